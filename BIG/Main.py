@@ -1,26 +1,108 @@
 import sys
 import os
-import shutil
+import threading
+import time
+import uuid
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QComboBox, QPushButton, \
-    QSpinBox, QTextEdit
-from PyQt5.QtCore import Qt
-from icrawler.builtin import GoogleImageCrawler
-import winreg
+    QSpinBox, QTextEdit, QCheckBox
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+# The download engine (icrawler, PIL, requests) is imported in the background once the window is up
 
 
 def get_desktop_path():
+    try:
+        import winreg
+    except ImportError:
+        # Not on Windows
+        return os.path.join(os.path.expanduser('~'), 'Desktop')
     key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Software\Microsoft\Windows\CurrentVersion\Explorer\Shell Folders")
     desktop_path = winreg.QueryValueEx(key, "Desktop")[0]
     return desktop_path
 
 
 DESKTOP_PATH = get_desktop_path()
+MAX_PARALLEL_JOBS = 3
+# bench_startup.py sets this to a file that gets the time the window was up, the app quits then
+STARTUP_PROBE = os.environ.get('STARTUP_PROBE')
+
+
+class DownloadSignals(QObject):
+    # job_id, images done, images wanted, bytes done, images/s, bytes/s
+    progress = pyqtSignal(str, int, int, int, float, float)
+    # job_id, result message
+    finished = pyqtSignal(str, str)
+
+
+class DownloadJob(QRunnable):
+    def __init__(self, job_id, query, num_images, filters, download_dir, index, cache, resume):
+        super().__init__()
+        self.job_id = job_id
+        self.signals = DownloadSignals()
+        from image_downloader import QueryDownload
+        self.download = QueryDownload(query, num_images, download_dir, filters, on_image=self.on_image,
+                                      index=index, resume=resume, cache=cache)
+
+    @property
+    def query(self):
+        return self.download.query
+
+    @property
+    def download_dir(self):
+        return self.download.download_dir
+
+    def cancel(self):
+        self.download.cancel()
+
+    def on_image(self, filename, nbytes):
+        download = self.download
+        elapsed = download.elapsed()
+        self.signals.progress.emit(self.job_id, download.images, download.num_images, download.bytes,
+                                   download.images / elapsed, download.bytes / elapsed)
+
+    def run(self):
+        try:
+            result = self.download.run()
+            if result['cancelled'] and not result['downloaded']:
+                message = f"Cancelled '{self.query}'."
+            elif result['cancelled']:
+                message = f"Cancelled '{self.query}' after {result['downloaded']} images in {self.download_dir}."
+            elif result['cached']:
+                message = (f"Copied {result['downloaded']} images from an earlier identical search "
+                           f"to {self.download_dir}.")
+            else:
+                message = (f"Downloaded {result['downloaded']} images to {self.download_dir} "
+                           f"({result['resumed']} from an earlier run, {result['reused']} already stored, "
+                           f"{result['near_duplicates']} near duplicates skipped).")
+        except Exception as e:
+            message = f"Download of '{self.query}' failed: {e}"
+        self.signals.finished.emit(self.job_id, message)
 
 
 class ImageDownloaderApp(QWidget):
     def __init__(self):
         super().__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(MAX_PARALLEL_JOBS)
+        self.jobs = {}
+        self.job_status = {}
+        self.index = self.cache = None
+        self.engine_ready = threading.Event()
         self.initUI()
+        # Runs once the event loop is up, i.e. after the window was shown
+        QTimer.singleShot(0, self.load_engine)
+
+    def load_engine(self):
+        threading.Thread(target=self._load_engine, daemon=True).start()
+
+    def _load_engine(self):
+        try:
+            from image_downloader import ImageIndex, ResultCache, QueryDownload  # noqa: F401
+            # Shared by every query so repeated downloads are linked instead of fetched again
+            self.index = ImageIndex(os.path.join(DESKTOP_PATH, 'downloaded_images_index'))
+            # Repeating a search within a day links the earlier results instead of crawling
+            self.cache = ResultCache(self.index, ttl=24 * 3600)
+        finally:
+            self.engine_ready.set()
 
     def initUI(self):
         layout = QVBoxLayout()
@@ -91,11 +173,20 @@ class ImageDownloaderApp(QWidget):
         time_layout.addWidget(self.time_combo)
         layout.addLayout(time_layout)
 
+        # Resume
+        self.resume_checkbox = QCheckBox('Resume previous download of this query')
+        layout.addWidget(self.resume_checkbox)
+
         # Download button
         self.download_button = QPushButton('Download Images')
         self.download_button.clicked.connect(self.download_images)
         layout.addWidget(self.download_button)
 
+        # Cancel button
+        self.cancel_button = QPushButton('Cancel All')
+        self.cancel_button.clicked.connect(self.cancel_downloads)
+        layout.addWidget(self.cancel_button)
+
         # Result display
         self.result_display = QTextEdit()
         self.result_display.setReadOnly(True)
@@ -111,70 +202,61 @@ class ImageDownloaderApp(QWidget):
         self.setGeometry(300, 300, 400, 550)
 
     def download_images(self):
+        # Only waits when the button is pressed right after startup
+        self.engine_ready.wait()
+        from image_downloader import build_filters, query_dir_name
         query = self.query_input.text()
         num_images = self.num_images_input.value()
-        color = self.color_combo.currentText().lower().replace(' ', '').replace('any', '')
-        image_type = self.type_combo.currentText().lower().replace(' ', '-').replace('any', '')
-        size = self.size_combo.currentText().lower().replace('any', '')
-        license = self.license_combo.currentText().lower().replace(' ', '').replace('any', '')
-        format = self.format_combo.currentText().lower().replace('any', '')
-        time = self.time_combo.currentText()
-
-        download_dir = os.path.join(DESKTOP_PATH, f'downloaded_images_{query.replace(" ", "_")}')
-        if os.path.exists(download_dir):
-            shutil.rmtree(download_dir)
-        os.makedirs(download_dir)
-
-        filters = {}
-        if color:
-            filters['color'] = color
-        if image_type:
-            filters['type'] = image_type
-        if size:
-            filters['size'] = size
-        if license:
-            filters['license'] = license
-        if format:
-            filters['format'] = format
-        if time != 'Any time':
-            if time == 'Past 24 hours':
-                filters['date'] = 'pastday'
-            elif time == 'Past 7 days':
-                filters['date'] = 'pastweek'
-            else:
-                # For 'Past month' and 'Past year', we won't set a date filter
-                # as icrawler doesn't support these options directly
-                pass
+        filters = build_filters(self.color_combo.currentText(), self.type_combo.currentText(),
+                                self.size_combo.currentText(), self.license_combo.currentText(),
+                                self.format_combo.currentText(), self.time_combo.currentText())
+        download_dir = os.path.join(DESKTOP_PATH, query_dir_name(query))
+
+        if any(job.download_dir == download_dir for job in self.jobs.values()):
+            self.job_status['busy'] = f"'{query}' is already downloading."
+            self.show_status()
+            return
+
+        # The crawl runs on the thread pool so the window stays responsive
+        job = DownloadJob(uuid.uuid4().hex, query, num_images, filters, download_dir, self.index,
+                          self.cache, self.resume_checkbox.isChecked())
+        job.signals.progress.connect(self.on_progress)
+        job.signals.finished.connect(self.on_finished)
+        self.jobs[job.job_id] = job
+        self.job_status.pop('busy', None)
+        self.job_status[job.job_id] = f"Queued '{query}'..."
+        self.show_status()
+        self.pool.start(job)
 
-        google_crawler = GoogleImageCrawler(
-            feeder_threads=1,
-            parser_threads=1,
-            downloader_threads=4,
-            storage={'root_dir': download_dir},
-            log_level=50
-        )
+    def cancel_downloads(self):
+        for job in self.jobs.values():
+            job.cancel()
 
-        google_crawler.crawl(keyword=query, max_num=num_images, filters=filters)
+    def on_progress(self, job_id, done, wanted, nbytes, images_per_sec, bytes_per_sec):
+        query = self.jobs[job_id].query
+        self.job_status[job_id] = (f"'{query}': {done}/{wanted} images, {nbytes / 1024:.0f} KB "
+                                   f"({images_per_sec:.1f} images/s, {bytes_per_sec / 1024:.0f} KB/s)")
+        self.show_status()
 
-        self.rename_images(download_dir, query)
+    def on_finished(self, job_id, result):
+        self.jobs.pop(job_id, None)
+        self.job_status[job_id] = result
+        self.show_status()
 
-        downloaded_count = len(
-            [name for name in os.listdir(download_dir) if os.path.isfile(os.path.join(download_dir, name))])
+    def show_status(self):
+        self.result_display.setText('\n'.join(self.job_status.values()))
 
-        result = f"Downloaded {downloaded_count} images to {download_dir}."
-        self.result_display.setText(result)
 
-    def rename_images(self, download_dir, query):
-        for i, filename in enumerate(os.listdir(download_dir)):
-            file_extension = os.path.splitext(filename)[1]
-            new_filename = f'{query.replace(" ", "_")}_{i:03d}{file_extension}'
-            old_path = os.path.join(download_dir, filename)
-            new_path = os.path.join(download_dir, new_filename)
-            os.rename(old_path, new_path)
+def report_startup(app):
+    with open(STARTUP_PROBE, 'w') as f:
+        f.write(repr(time.time()))
+    app.quit()
 
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     ex = ImageDownloaderApp()
     ex.show()
+    if STARTUP_PROBE:
+        QTimer.singleShot(0, lambda: report_startup(app))
     sys.exit(app.exec_())
\ No newline at end of file
@@ -1,38 +1,74 @@
 # -*- mode: python ; coding: utf-8 -*-
+# pyinstaller Main.spec                  -> dist/Main, one file
+# pyinstaller Main.spec -- --fast-start  -> dist/Main_fast/, one folder that starts without unpacking anything, no UPX
+import argparse
 
+parser = argparse.ArgumentParser()
+parser.add_argument('--fast-start', action='store_true')
+options = parser.parse_args()
 
 a = Analysis(
     ['Main.py'],
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # image_downloader loads these by name on first use
+    hiddenimports=['image_downloader.cache', 'image_downloader.engine', 'image_downloader.index'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Optional imports of PIL and icrawler's dependencies would drag in another GUI toolkit and dev tools
+    excludes=['tkinter', 'PyQt6', 'PySide2', 'PySide6', 'IPython', 'jedi', 'matplotlib', 'numpy', 'scipy',
+              'pandas'] if options.fast_start else [],
     noarchive=False,
     optimize=0,
 )
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
-    name='Main',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=False,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
+if options.fast_start:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='Main',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        name='Main_fast',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name='Main',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
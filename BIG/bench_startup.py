@@ -0,0 +1,93 @@
+"""
+Time from launch to the first window of the PyInstaller builds, cold and warm:
+
+    pyinstaller Main.spec && pyinstaller Main.spec -- --fast-start
+    python bench_startup.py --runs 5
+
+Times every build found in dist/ (one file: dist/<name>, one folder: dist/<name>_fast/<name>)
+and any executables given on the command line. The apps write the time their window was up
+to the file in STARTUP_PROBE and quit. The cold run follows a page cache drop when this is
+allowed (Linux as root), otherwise it is just the first run, marked with *.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APPS = ('Main', 'MyApp', 'speech_to_text_app')
+EXE_SUFFIX = '.exe' if sys.platform == 'win32' else ''
+
+
+def find_builds(dist):
+    for name in APPS:
+        one_file = os.path.join(dist, name + EXE_SUFFIX)
+        one_folder = os.path.join(dist, name + '_fast', name + EXE_SUFFIX)
+        if os.path.isfile(one_file):
+            yield f'{name} (one file)', one_file
+        if os.path.isfile(one_folder):
+            yield f'{name} (fast start)', one_folder
+
+
+def disk_size(executable):
+    folder = os.path.dirname(executable)
+    if not os.path.basename(folder).endswith('_fast'):
+        return os.path.getsize(executable)
+    # lstat, the Qt frameworks are full of symlinks to the same libraries
+    return sum(os.lstat(os.path.join(root, filename)).st_size
+               for root, _, filenames in os.walk(folder) for filename in filenames)
+
+
+def drop_caches():
+    try:
+        os.sync()
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+def time_to_window(executable, timeout):
+    with tempfile.TemporaryDirectory() as folder:
+        probe = os.path.join(folder, 'started')
+        started = time.time()
+        subprocess.run([executable], env=dict(os.environ, STARTUP_PROBE=probe), timeout=timeout,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not os.path.exists(probe):
+            raise RuntimeError(f'{executable} exited without showing its window')
+        with open(probe) as f:
+            return float(f.read()) - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time to first window of the packaged apps.')
+    parser.add_argument('executables', nargs='*', help='more builds to time')
+    parser.add_argument('--dist', default=os.path.join(HERE, 'dist'))
+    parser.add_argument('--runs', type=int, default=5, help='warm runs per build')
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args(argv)
+
+    builds = list(find_builds(args.dist)) + [(path, path) for path in args.executables]
+    if not builds:
+        print(f'No builds in {args.dist}, build them with pyinstaller first')
+        return 1
+    print(f'{"build":32} {"size MB":>8} {"cold ms":>9} {"warm ms":>9} {"best ms":>9}')
+    for label, executable in builds:
+        try:
+            cold_marker = '' if drop_caches() else '*'
+            cold = time_to_window(executable, args.timeout)
+            warm = [time_to_window(executable, args.timeout) for _ in range(args.runs)]
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f'{label:32} failed: {e}')
+            continue
+        print(f'{label:32} {disk_size(executable) / 2 ** 20:8.0f} {cold * 1000:8.0f}{cold_marker or " "} '
+              f'{statistics.median(warm) * 1000:9.0f} {min(warm) * 1000:9.0f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""
+Headless image download engine shared by the PyQt app (Main.py) and the batch CLI
+
+Importing the package is cheap, the names below load their module (and with it
+icrawler, PIL, ...) the first time they are used.
+"""
+import importlib
+
+_EXPORTS = {
+    'HostRateLimiter': 'engine',
+    'QueryDownload': 'engine',
+    'build_filters': 'engine',
+    'query_dir_name': 'engine',
+    'ResultCache': 'cache',
+    'ImageIndex': 'index',
+    'QueryStorage': 'storage',
+    'ImageProcessor': 'pipeline',
+    'ProcessingOptions': 'pipeline',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,109 @@
+"""
+Compares the asyncio downloader with icrawler's threaded one against a local mock image server:
+
+    python -m image_downloader.benchmark --images 400 --latency 0.05 --size-kb 200
+
+The server adds a fixed delay to every response to stand in for a real network round trip.
+"""
+import argparse
+import io
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from icrawler.utils import ProxyPool, Session, Signal
+from PIL import Image
+
+from .downloader import AsyncImageDownloader, ProgressImageDownloader
+from .fetch import httpx
+from .storage import QueryStorage
+
+
+def make_png(size_kb):
+    side = max(8, int((size_kb * 1024 / 3) ** 0.5))
+    image = Image.frombytes('RGB', (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', compress_level=0)
+    return buffer.getvalue()
+
+
+def start_server(body, latency, error_rate):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            if random.random() < error_rate:
+                self.send_response(429)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_downloader(downloader_cls, thread_num, urls, out_dir):
+    signal = Signal()
+    signal.set(feeder_exited=True, parser_exited=True, reach_max_num=False)
+    storage = QueryStorage(out_dir, 'bench')
+    downloader = downloader_cls(thread_num, signal, Session(ProxyPool()), storage)
+    downloader.in_queue = queue.Queue()
+    for url in urls:
+        downloader.in_queue.put({'file_url': url})
+    nbytes = []
+    downloader.on_image = lambda filename, size: nbytes.append(size)
+
+    started = time.perf_counter()
+    downloader.start(max_num=len(urls), queue_timeout=1)
+    for worker in downloader.workers:
+        worker.join()
+    seconds = time.perf_counter() - started
+    storage.close()
+    return len(nbytes), sum(nbytes), seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='image_downloader.benchmark')
+    parser.add_argument('--images', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the server waits per request')
+    parser.add_argument('--size-kb', type=int, default=200)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 429')
+    parser.add_argument('--threads', type=int, default=4, help='threads for the icrawler downloader')
+    args = parser.parse_args(argv)
+
+    server = start_server(make_png(args.size_kb), args.latency, args.error_rate)
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    urls = [f'{base}/{i}.png' for i in range(args.images)]
+
+    candidates = [(f'threaded ({args.threads} threads)', ProgressImageDownloader, args.threads)]
+    if httpx is not None:
+        candidates.append(('asyncio (adaptive)', AsyncImageDownloader, 1))
+    else:
+        print('httpx is not installed, only the threaded downloader is measured')
+
+    print(f'{args.images} images of {args.size_kb} KB, {args.latency * 1000:.0f} ms latency')
+    for name, downloader_cls, thread_num in candidates:
+        with tempfile.TemporaryDirectory() as out_dir:
+            images, nbytes, seconds = run_downloader(downloader_cls, thread_num, urls, out_dir)
+        print(f'{name:28} {images:5d} images in {seconds:6.2f}s  '
+              f'{images / seconds:7.1f} images/s  {nbytes / seconds / 2 ** 20:7.1f} MB/s')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
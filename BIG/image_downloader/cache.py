@@ -0,0 +1,216 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .index import content_hash, link_or_copy
+from .storage import MANIFEST_NAME, THUMBNAIL_DIR
+
+CACHE_THUMBNAIL_DIR = 'cache_thumbnails'
+COUNTERS = ('hits', 'misses', 'expired', 'evictions')
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+class ResultCache:
+    """Remembers which images a finished query + filters download produced.
+
+    Entries live in cache.sqlite3 next to the image index and point at files in its object
+    store, so repeating a search only links those files into the query folder again instead
+    of crawling. Entries expire after ttl seconds. When the files of all entries add up to
+    more than max_bytes the least recently used entries are dropped, together with the
+    thumbnails no other entry uses. The images stay: they belong to the index, which
+    deduplicates downloads whether or not a cache entry points at them. Hit/miss counters
+    are kept in the database so every process sharing the index adds to the same numbers.
+    """
+
+    def __init__(self, index, ttl=7 * 24 * 3600, max_bytes=2 * 2 ** 30):
+        self.index = index
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.thumbnail_dir = os.path.join(index.root, CACHE_THUMBNAIL_DIR)
+        os.makedirs(self.thumbnail_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(index.root, 'cache.sqlite3'), timeout=30, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    filters TEXT NOT NULL,
+                    num_images INTEGER NOT NULL,
+                    files TEXT NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    used REAL NOT NULL
+                )""")
+            self.db.execute('CREATE INDEX IF NOT EXISTS entries_used ON entries(used)')
+            # Which stored files (kind 'image' in the index, 'thumbnail' in cache_thumbnails) an entry uses
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS entry_files (
+                    key TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    kind TEXT NOT NULL
+                )""")
+            self.db.execute('CREATE INDEX IF NOT EXISTS entry_files_key ON entry_files(key)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS entry_files_sha256 ON entry_files(sha256)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            self.db.executemany('INSERT OR IGNORE INTO counters VALUES (?, 0)', [(name,) for name in COUNTERS])
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def key(self, query, filters, processing=None):
+        """Same search, same key: the query ignores case and spacing, empty filters are left out."""
+        parts = [normalize_query(query), json.dumps({k: v for k, v in sorted((filters or {}).items()) if v})]
+        if processing is not None:
+            # Processed images depend on the options too
+            parts.append(json.dumps(vars(processing), sort_keys=True))
+        return '\n'.join(parts)
+
+    def _count(self, name, amount=1):
+        self.db.execute('UPDATE counters SET value = value + ? WHERE name = ?', (amount, name))
+
+    def get(self, key, num_images):
+        """File list of a fresh entry holding num_images images (or everything the search had), else None."""
+        now = time.time()
+        with self.lock:
+            with self.db:
+                row = self.db.execute('SELECT num_images, files, created FROM entries WHERE key = ?',
+                                      (key,)).fetchone()
+                if row is not None and now - row[2] > self.ttl:
+                    self._count('expired')
+                    unused = self._drop(key)
+                    row = None
+                else:
+                    unused = []
+                files = json.loads(row[1]) if row is not None else []
+                # An entry also answers bigger requests when the search ran out of results last time
+                if row is None or (len(files) < num_images and row[0] < num_images):
+                    self._count('misses')
+                    files = None
+                else:
+                    self.db.execute('UPDATE entries SET used = ? WHERE key = ?', (now, key))
+                    self._count('hits')
+        self._remove_files(unused)
+        return files[:num_images] if files is not None else None
+
+    def put(self, key, query, filters, num_images, download_dir):
+        """Remember the images listed in download_dir's manifest under key."""
+        files = []
+        thumbnails = set()
+        manifest_path = os.path.join(download_dir, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                found = self.index.url_object(entry['url']) if entry.get('url') else None
+                if found is None:
+                    # Written without the index, nothing to link from
+                    continue
+                sha, path = found
+                cached = {'url': entry['url'], 'object': sha, 'size': os.path.getsize(path),
+                          'width': entry['width'], 'height': entry['height'], 'thumbnail': None}
+                if entry.get('thumbnail'):
+                    cached['thumbnail'] = self._keep_thumbnail(os.path.join(download_dir, entry['thumbnail']))
+                    thumbnails.add(cached['thumbnail'])
+                files.append(cached)
+        if not files:
+            return
+
+        nbytes = sum(f['size'] for f in files) + sum(
+            os.path.getsize(self._thumbnail_path(sha)) for sha in thumbnails)
+        now = time.time()
+        with self.lock:
+            with self.db:
+                old = self._drop(key)
+                self.db.execute('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                (key, query, json.dumps(filters), num_images, json.dumps(files), nbytes, now, now))
+                self.db.executemany('INSERT INTO entry_files VALUES (?, ?, ?)',
+                                    [(key, sha, 'image') for sha in {f['object'] for f in files}]
+                                    + [(key, sha, 'thumbnail') for sha in thumbnails])
+                unused = [(sha, kind) for sha, kind in old if not self._referenced(sha)]
+                unused += self._evict(now)
+        self._remove_files(unused)
+
+    def invalidate(self, key):
+        with self.lock:
+            with self.db:
+                unused = self._drop(key)
+        self._remove_files(unused)
+
+    def _keep_thumbnail(self, path):
+        with open(path, 'rb') as f:
+            sha = content_hash(f.read())
+        if not os.path.exists(self._thumbnail_path(sha)):
+            link_or_copy(path, self._thumbnail_path(sha))
+        return sha
+
+    def _thumbnail_path(self, sha):
+        return os.path.join(self.thumbnail_dir, f'{sha}.jpg')
+
+    def _referenced(self, sha):
+        return self.db.execute('SELECT 1 FROM entry_files WHERE sha256 = ? LIMIT 1', (sha,)).fetchone() is not None
+
+    def _drop(self, key):
+        """Delete an entry, returns the (sha256, kind) of its files that no other entry uses."""
+        files = self.db.execute('SELECT sha256, kind FROM entry_files WHERE key = ?', (key,)).fetchall()
+        self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+        self.db.execute('DELETE FROM entry_files WHERE key = ?', (key,))
+        return [(sha, kind) for sha, kind in files if not self._referenced(sha)]
+
+    def _evict(self, now):
+        unused = []
+        for (key,) in self.db.execute('SELECT key FROM entries WHERE created < ?', (now - self.ttl,)).fetchall():
+            self._count('expired')
+            unused += self._drop(key)
+        total = self.db.execute('SELECT COALESCE(SUM(bytes), 0) FROM entries').fetchone()[0]
+        while total > self.max_bytes:
+            key, nbytes = self.db.execute('SELECT key, bytes FROM entries ORDER BY used LIMIT 1').fetchone()
+            self._count('evictions')
+            unused += self._drop(key)
+            total -= nbytes
+        return unused
+
+    def _remove_files(self, files):
+        """Delete the cache's own files among files, the thumbnails."""
+        for sha, kind in files:
+            if kind == 'thumbnail' and os.path.exists(self._thumbnail_path(sha)):
+                os.remove(self._thumbnail_path(sha))
+
+    def serve(self, files, storage, checkpoint):
+        """Link the cached files into storage's folder, returns [(filename, size)] or None if one is gone."""
+        paths = [self.index.lookup_hash(f['object']) for f in files]
+        if None in paths:
+            return None
+        served = []
+        for number, (cached, path) in enumerate(zip(files, paths), 1):
+            id = f'{number}{os.path.splitext(path)[1]}'
+            task = {'file_url': cached['url'], 'img_size': (cached['width'], cached['height'])}
+            if cached['thumbnail'] and os.path.exists(self._thumbnail_path(cached['thumbnail'])):
+                thumbnail_name = os.path.splitext(storage.final_name(id))[0] + '.jpg'
+                task['thumbnail'] = os.path.join(storage.root_dir, THUMBNAIL_DIR, thumbnail_name)
+                link_or_copy(self._thumbnail_path(cached['thumbnail']), task['thumbnail'])
+            storage.write_from(id, path, task)
+            filename = os.path.basename(task['path'])
+            checkpoint.complete(cached['url'], filename, number)
+            served.append((filename, cached['size']))
+        return served
+
+    def metrics(self):
+        with self.lock:
+            counters = dict(self.db.execute('SELECT name, value FROM counters'))
+            entries, nbytes = self.db.execute('SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries').fetchone()
+        lookups = counters['hits'] + counters['misses']
+        return dict(counters, entries=entries, bytes=nbytes, max_bytes=self.max_bytes,
+                    hit_rate=round(counters['hits'] / lookups, 3) if lookups else 0.0)
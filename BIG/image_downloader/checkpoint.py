@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+
+CHECKPOINT_NAME = '.checkpoint.jsonl'
+
+
+class Checkpoint:
+    """Append-only record of what a query folder already holds, one JSON line per URL.
+
+    Lines are {"url", "file", "index"} for saved images and {"url", "skipped"} for URLs that
+    were downloaded but rejected, so a resumed crawl never fetches either again. Network
+    failures are not recorded and get retried.
+    """
+
+    def __init__(self, download_dir):
+        self.path = os.path.join(download_dir, CHECKPOINT_NAME)
+        self.lock = threading.Lock()
+        self.completed = {}
+        self.skipped = set()
+        self.max_index = 0
+        if os.path.exists(self.path):
+            self._load()
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line cut off by a crash
+                    continue
+                if 'skipped' in entry:
+                    self.skipped.add(entry['url'])
+                else:
+                    self.completed[entry['url']] = entry['file']
+                    self.max_index = max(self.max_index, entry['index'])
+
+    def is_done(self, url):
+        return url in self.completed or url in self.skipped
+
+    def complete(self, url, filename, index):
+        self._append({'url': url, 'file': filename, 'index': index})
+        with self.lock:
+            self.completed[url] = filename
+            self.max_index = max(self.max_index, index)
+
+    def skip(self, url, reason):
+        self._append({'url': url, 'skipped': reason})
+        with self.lock:
+            self.skipped.add(url)
+
+    def _append(self, entry):
+        with self.lock:
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+
+    def remove_partial_files(self):
+        """Delete temp files left behind by writes that were interrupted."""
+        folder = os.path.dirname(self.path)
+        for filename in os.listdir(folder):
+            if filename.endswith('.tmp'):
+                os.remove(os.path.join(folder, filename))
+
+    def close(self):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
@@ -0,0 +1,148 @@
+"""
+Batch mode: python -m image_downloader manifest.csv --concurrency 8 --rate-limit 2
+
+The manifest is CSV (with a header row) or JSONL, one query per row with the columns
+query, num_images, color, type, size, license, format, time and optionally output_dir.
+Filter columns take the same labels as the app ("Black and White", "Past 7 days", ...).
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .cache import ResultCache
+from .engine import HostRateLimiter, QueryDownload, build_filters, query_dir_name
+from .index import ImageIndex
+from .pipeline import ImageProcessor, ProcessingOptions
+
+
+def read_manifest(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith(('.jsonl', '.json')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def make_download(row, args, rate_limiter, index, processor, processing, cache=None):
+    query = row['query'].strip()
+    filters = build_filters(row.get('color'), row.get('type'), row.get('size'), row.get('license'),
+                            row.get('format'), row.get('time'))
+    download_dir = os.path.join(row.get('output_dir') or args.output_dir, query_dir_name(query))
+    num_images = int(row.get('num_images') or args.num_images)
+    return QueryDownload(query, num_images, download_dir, filters, rate_limiter, args.downloader_threads,
+                         index=index, resume=args.resume, fsync=args.fsync,
+                         async_downloads=False if args.threaded else None, max_connections=args.max_connections,
+                         processor=processor, processing=processing, cache=cache)
+
+
+def run_download(download):
+    try:
+        return download.run()
+    except Exception as e:
+        return {'query': download.query, 'download_dir': download.download_dir, 'error': str(e)}
+
+
+def write_result(log, result):
+    log.write(json.dumps(result) + '\n')
+    log.flush()
+    if 'error' in result:
+        print(f"FAILED '{result['query']}': {result['error']}", file=sys.stderr)
+        return 1
+    if result.get('cached'):
+        print(f"Served {result['downloaded']} images to {result['download_dir']} from the cache.")
+        return 0
+    print(f"Downloaded {result['downloaded']} images to {result['download_dir']} "
+          f"({result['resumed']} from an earlier run, {result['reused']} already stored, "
+          f"{result['near_duplicates']} near duplicates dropped).")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='image_downloader',
+                                     description='Download images for every query in a manifest.')
+    parser.add_argument('manifest', help='CSV or JSONL file with one query per row')
+    parser.add_argument('--output-dir', default='downloaded_images', help='root folder for the query folders')
+    parser.add_argument('--log', default='results.jsonl', help='JSONL file that gets one result line per query')
+    parser.add_argument('--concurrency', type=int, default=4, help='queries crawled at the same time')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='max requests per second to any single host (0 = unlimited)')
+    parser.add_argument('--num-images', type=int, default=10, help='used when a row has no num_images')
+    parser.add_argument('--downloader-threads', type=int, default=4,
+                        help='download threads per query with --threaded')
+    parser.add_argument('--threaded', action='store_true',
+                        help="use icrawler's blocking downloader threads instead of the asyncio downloader")
+    parser.add_argument('--max-connections', type=int, default=64,
+                        help='upper bound for the adaptive number of parallel downloads per query')
+    parser.add_argument('--resume', action='store_true',
+                        help='keep existing query folders and only download what their checkpoint is missing')
+    parser.add_argument('--fsync', action='store_true', help='fsync every image before it is renamed into place')
+    parser.add_argument('--index', help='dedup index folder shared by all runs (default: OUTPUT_DIR/.index)')
+    parser.add_argument('--no-index', action='store_true', help='download everything again, no dedup')
+    parser.add_argument('--max-distance', type=int, default=3,
+                        help='drop images whose perceptual hash is this many bits or less from a stored one '
+                             '(-1 keeps near duplicates)')
+    parser.add_argument('--cache-ttl', type=float, default=168,
+                        help='hours a finished search is served from the index instead of crawled again')
+    parser.add_argument('--cache-size', type=int, default=2048,
+                        help='MB of cached search results to keep, least recently used go first')
+    parser.add_argument('--no-cache', action='store_true', help='always crawl, even for repeated searches')
+    parser.add_argument('--process', action='store_true',
+                        help='check every image in a process pool: it must decode, match the format filter and '
+                             'fit --min-size/--max-size, then --max-side/--output-format/--thumbnail are applied')
+    parser.add_argument('--workers', type=int, help='post-processing processes (default: one per CPU)')
+    parser.add_argument('--min-size', type=parse_size, help='smallest accepted WIDTHxHEIGHT')
+    parser.add_argument('--max-size', type=parse_size, help='largest accepted WIDTHxHEIGHT')
+    parser.add_argument('--max-side', type=int, help='downscale images whose longest side is bigger')
+    parser.add_argument('--output-format', choices=['jpg', 'png', 'webp'], help='re-encode every image to this format')
+    parser.add_argument('--quality', type=int, default=85, help='encoder quality for re-encoded images')
+    parser.add_argument('--thumbnail', type=int, help='also write a thumbnail with this longest side')
+    args = parser.parse_args(argv)
+
+    rate_limiter = HostRateLimiter(args.rate_limit) if args.rate_limit > 0 else None
+    index = None
+    if not args.no_index:
+        index = ImageIndex(args.index or os.path.join(args.output_dir, '.index'), args.max_distance)
+    cache = None
+    if index is not None and not args.no_cache:
+        cache = ResultCache(index, args.cache_ttl * 3600, args.cache_size * 2 ** 20)
+    processor = processing = None
+    if args.process:
+        processor = ImageProcessor(args.workers)
+        processing = ProcessingOptions(args.min_size, args.max_size, None, args.max_side, args.output_format,
+                                       args.quality, args.thumbnail)
+    rows = read_manifest(args.manifest)
+    done = failed = 0
+
+    # Only keep a couple of queries per worker in flight so huge manifests are streamed, not loaded
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool, open(args.log, 'a', encoding='utf-8') as log:
+        pending = set()
+        for row in rows:
+            download = make_download(row, args, rate_limiter, index, processor, processing, cache)
+            pending.add(pool.submit(run_download, download))
+            if len(pending) >= args.concurrency * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    failed += write_result(log, future.result())
+                    done += 1
+        for future in pending:
+            failed += write_result(log, future.result())
+            done += 1
+
+    if processor is not None:
+        processor.close()
+    if cache is not None:
+        metrics = cache.metrics()
+        print(f"Cache: {metrics['hits']} hits, {metrics['misses']} misses, {metrics['entries']} searches "
+              f"({metrics['bytes'] / 2 ** 20:.1f} MB), {metrics['evictions']} evicted")
+    print(f"Finished {done} queries ({failed} failed), results in {args.log}")
+    return 1 if failed else 0
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import queue
+from io import BytesIO
+
+from icrawler import ImageDownloader
+from PIL import Image
+
+from .fetch import AdaptiveLimiter, fetch, make_client
+from .index import content_hash, perceptual_hash
+from .pipeline import RejectedImage
+
+
+class ProgressImageDownloader(ImageDownloader):
+    # Calls on_image(filename, nbytes) from the downloader threads after every saved image,
+    # nbytes is 0 when the image came out of the index instead of the network
+    on_image = None
+    on_duplicate = None
+    checkpoint = None
+    # ImageProcessor and ProcessingOptions for validating/re-encoding images before they are stored
+    processor = None
+    processing = None
+
+    @property
+    def index(self):
+        return getattr(self.storage, 'index', None)
+
+    def get_filename(self, task, default_ext):
+        filename = super().get_filename(task, default_ext)
+        if hasattr(self.storage, 'expect'):
+            self.storage.expect(filename, task)
+        return filename
+
+    def download(self, task, default_ext, timeout=5, max_retry=3, overwrite=False, **kwargs):
+        if not self.skip_or_reuse(task, default_ext):
+            return super().download(task, default_ext, timeout, max_retry, overwrite, **kwargs)
+
+    def skip_or_reuse(self, task, default_ext):
+        """Handle tasks that need no network request, returns False if task still has to be downloaded."""
+        task['success'] = False
+        task['filename'] = None
+        if self.checkpoint is not None and self.checkpoint.is_done(task['file_url']):
+            return True
+        stored_path = self.index.lookup_url(task['file_url']) if self.index is not None else None
+        if stored_path is None:
+            return False
+
+        # Already downloaded for an earlier query, link the stored copy instead of fetching it
+        with self.lock:
+            if self.reach_max_num():
+                self.signal.set(reach_max_num=True)
+                return True
+            self.fetched_num += 1
+            filename = super().get_filename(task, default_ext)
+        self.storage.write_from(filename, stored_path, task)
+        task['success'] = True
+        task['filename'] = filename
+        task['reused'] = True
+        return True
+
+    def save(self, task, response, default_ext, **kwargs):
+        """Filter and store a response that was fetched outside of download()."""
+        if not self.keep_file(task, response, **kwargs):
+            return
+        with self.lock:
+            # Checked under the lock, many saves can be running at the same time
+            if self.reach_max_num():
+                self.signal.set(reach_max_num=True)
+                return
+            self.fetched_num += 1
+            filename = self.get_filename(task, default_ext)
+        self.storage.write(filename, response.content)
+        task['success'] = True
+        task['filename'] = filename
+
+    def keep_file(self, task, response, **kwargs):
+        if not super().keep_file(task, response, **kwargs):
+            self._skip(task, 'filtered')
+            return False
+        if self.index is not None and not self._check_index(task, response):
+            return False
+        if self.processor is not None:
+            try:
+                task['processed'] = self.processor.process(response.content, self.processing)
+            except RejectedImage as e:
+                self._skip(task, f'rejected: {e}')
+                return False
+        return True
+
+    def _check_index(self, task, response):
+        task['sha256'] = content_hash(response.content)
+        if self.index.lookup_hash(task['sha256']) is not None:
+            # Same bytes under another URL, storage will hard-link it
+            return True
+        task['phash'] = perceptual_hash(Image.open(BytesIO(response.content)))
+        if self.index.find_similar(task['phash']) is not None:
+            self._skip(task, 'near_duplicate')
+            if self.on_duplicate is not None:
+                self.on_duplicate(task['file_url'])
+            return False
+        return True
+
+    def _skip(self, task, reason):
+        if self.checkpoint is not None:
+            self.checkpoint.skip(task['file_url'], reason)
+
+    def process_meta(self, task):
+        if not task.get('success'):
+            return
+        filename = os.path.basename(task['path'])
+        if self.checkpoint is not None:
+            self.checkpoint.complete(task['file_url'], filename, int(os.path.splitext(task['filename'])[0]))
+        if self.on_image is not None:
+            nbytes = 0 if task.get('reused') else os.path.getsize(task['path'])
+            self.on_image(filename, nbytes)
+
+
+class AsyncImageDownloader(ProgressImageDownloader):
+    """Downloads from one asyncio loop over a shared keep-alive (HTTP/2 if h2 is installed) pool.
+
+    Start it with a single downloader thread, the number of parallel requests is set by an
+    AdaptiveLimiter instead. Filtering, hashing and writing happen in worker threads so the
+    loop only ever waits on the network.
+    """
+
+    initial_concurrency = 4
+    max_connections = 64
+
+    def worker_exec(self, max_num, default_ext='jpg', queue_timeout=5, req_timeout=5, max_idle_time=None, **kwargs):
+        self.max_num = max_num
+        asyncio.run(self._run(default_ext, req_timeout, kwargs))
+        self.logger.info('async downloader exit')
+
+    async def _run(self, default_ext, req_timeout, kwargs):
+        limiter = AdaptiveLimiter(self.initial_concurrency, maximum=self.max_connections)
+        rate_limiter = getattr(self.session, 'rate_limiter', None)
+        running = set()
+        async with make_client(dict(self.session.headers), self.max_connections, req_timeout) as client:
+            while not self.signal.get('reach_max_num'):
+                # Only pull a few more tasks than there are request slots, the rest waits in the queue
+                if len(running) >= limiter.limit * 2:
+                    _, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                try:
+                    task = self.in_queue.get_nowait()
+                except queue.Empty:
+                    if self.signal.get('parser_exited') and not running:
+                        break
+                    if running:
+                        _, running = await asyncio.wait(running, timeout=0.05, return_when=asyncio.FIRST_COMPLETED)
+                    else:
+                        await asyncio.sleep(0.05)
+                    continue
+                running.add(asyncio.create_task(
+                    self._download(client, limiter, rate_limiter, task, default_ext, kwargs)))
+
+            # Not cancelled: a task may already have written its file and still has to record it
+            if running:
+                await asyncio.wait(running)
+
+    async def _download(self, client, limiter, rate_limiter, task, default_ext, kwargs):
+        try:
+            if not await asyncio.to_thread(self.skip_or_reuse, task, default_ext):
+                response = await fetch(client, task['file_url'], limiter, rate_limiter=rate_limiter,
+                                       should_stop=lambda: self.signal.get('reach_max_num'))
+                if response is not None and response.status_code == 200:
+                    await asyncio.to_thread(self.save, task, response, default_ext, **kwargs)
+            await asyncio.to_thread(self.process_meta, task)
+        except Exception:
+            self.logger.exception('failed to download %s', task['file_url'])
+        finally:
+            self.in_queue.task_done()
@@ -0,0 +1,257 @@
+import asyncio
+import os
+import shutil
+import threading
+import time
+from urllib.parse import urlsplit
+
+from icrawler.builtin import GoogleImageCrawler
+from icrawler.utils import Session
+
+from .checkpoint import Checkpoint
+from .downloader import AsyncImageDownloader, ProgressImageDownloader
+from .fetch import httpx
+from .pipeline import ProcessingOptions
+from .storage import QueryStorage
+
+# icrawler only knows these two date ranges, 'Past month' and 'Past year' fall back to no date filter
+DATE_FILTERS = {
+    'past 24 hours': 'pastday',
+    'past-24-hours': 'pastday',
+    'pastday': 'pastday',
+    'past 7 days': 'pastweek',
+    'past-7-days': 'pastweek',
+    'pastweek': 'pastweek',
+}
+
+
+def build_filters(color='', image_type='', size='', license='', format='', time=''):
+    """Turn the combo box labels (or already normalized values) into icrawler filters."""
+    color = (color or '').lower().replace(' ', '').replace('any', '')
+    image_type = (image_type or '').lower().replace(' ', '-').replace('any', '')
+    size = (size or '').lower().replace('any', '')
+    license = (license or '').lower().replace(' ', '').replace('any', '')
+    format = (format or '').lower().replace('any', '')
+    date = DATE_FILTERS.get((time or '').lower())
+
+    filters = {}
+    if color:
+        filters['color'] = color
+    if image_type:
+        filters['type'] = image_type
+    if size:
+        filters['size'] = size
+    if license:
+        filters['license'] = license
+    if format:
+        filters['format'] = format
+    if date:
+        filters['date'] = date
+    return filters
+
+
+def query_dir_name(query):
+    """A folder name for query that stays a single path component: no separators, no leading dots."""
+    name = query.replace(' ', '_').replace('/', '_').replace('\\', '_').replace('\0', '')
+    return f'downloaded_images_{name.lstrip(".")}'
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host, shared by every crawl in the process."""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def reserve(self, url):
+        """Book the next free slot for url's host, returns how long to wait for it."""
+        host = urlsplit(url).hostname
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        return slot - now
+
+    def wait(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class RateLimitedSession(Session):
+    def __init__(self, proxy_pool, rate_limiter):
+        super().__init__(proxy_pool)
+        self.rate_limiter = rate_limiter
+
+    def get(self, url, **kwargs):
+        self.rate_limiter.wait(url)
+        return super().get(url, **kwargs)
+
+
+class EngineCrawler(GoogleImageCrawler):
+    def __init__(self, rate_limiter=None, downloader_cls=ProgressImageDownloader, **kwargs):
+        # set_session() runs inside the base constructor, so this has to exist first
+        self.rate_limiter = rate_limiter
+        super().__init__(downloader_cls=downloader_cls, **kwargs)
+
+    def set_session(self, headers=None):
+        super().set_session(headers)
+        if self.rate_limiter is not None:
+            session = RateLimitedSession(self.proxy_pool, self.rate_limiter)
+            session.headers.update(self.session.headers)
+            self.session = session
+
+    def crawl(self, keyword, filters=None, max_num=1000, remaining=None, file_idx_offset=0):
+        # The feeder still walks the first max_num search results, but the downloader only
+        # has to save what is missing, finished URLs are skipped through the checkpoint
+        max_num = min(max_num, 1000)
+        remaining = max_num if remaining is None else remaining
+        feeder_kwargs = dict(keyword=keyword, offset=0, max_num=max_num, language=None, filters=filters)
+        downloader_kwargs = dict(max_num=remaining, file_idx_offset=file_idx_offset)
+        super(GoogleImageCrawler, self).crawl(feeder_kwargs=feeder_kwargs, downloader_kwargs=downloader_kwargs)
+
+
+class QueryDownload:
+    """Crawls one query into download_dir, thread safe to cancel() from anywhere."""
+
+    def __init__(self, query, num_images, download_dir, filters=None, rate_limiter=None,
+                 downloader_threads=4, on_image=None, index=None, resume=False, fsync=False,
+                 async_downloads=None, max_connections=64, processor=None, processing=None, cache=None):
+        self.query = query
+        self.num_images = num_images
+        self.download_dir = download_dir
+        self.filters = filters or {}
+        self.rate_limiter = rate_limiter
+        self.downloader_threads = downloader_threads
+        self.on_image = on_image
+        self.index = index
+        self.resume = resume
+        self.fsync = fsync
+        # Default to the asyncio downloader whenever httpx is installed
+        self.async_downloads = httpx is not None if async_downloads is None else async_downloads
+        self.max_connections = max_connections
+        self.processor = processor
+        self.processing = processing
+        # A ResultCache (needs index) serves repeated searches from the object store without crawling
+        self.cache = cache if index is not None else None
+        self.cached = False
+        self.crawler = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.images = 0
+        self.bytes = 0
+        self.reused = 0
+        self.near_duplicates = 0
+        self.resumed = 0
+        self.started = None
+
+    def cancel(self):
+        self.cancelled = True
+        if self.crawler is not None:
+            # The feeder, parser and downloader threads all stop once this signal is set
+            self.crawler.signal.set(reach_max_num=True)
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return max(time.monotonic() - self.started, 1e-6)
+
+    def _image_saved(self, filename, nbytes):
+        with self.lock:
+            self.images += 1
+            self.bytes += nbytes
+            if not nbytes:
+                self.reused += 1
+        if self.on_image is not None:
+            self.on_image(filename, nbytes)
+
+    def _near_duplicate(self, url):
+        with self.lock:
+            self.near_duplicates += 1
+
+    def run(self):
+        self.started = time.monotonic()
+        downloaded_count = 0
+        if not self.cancelled:
+            if os.path.exists(self.download_dir) and not self.resume:
+                shutil.rmtree(self.download_dir)
+            os.makedirs(self.download_dir, exist_ok=True)
+            checkpoint = Checkpoint(self.download_dir)
+            checkpoint.remove_partial_files()
+            self.resumed = len(checkpoint.completed)
+
+            storage = QueryStorage(self.download_dir, self.query, self.index, self.fsync)
+            processing = None
+            if self.processor is not None:
+                # The format filter is only a hint to the search engine, the pipeline checks the real one
+                processing = (self.processing or ProcessingOptions()).for_format(self.filters.get('format'))
+            cache_key = None
+            if self.cache is not None:
+                cache_key = self.cache.key(self.query, self.filters, processing)
+                if not self.resume and self._serve_cached(cache_key, storage, checkpoint):
+                    cache_key = None
+            self.crawler = EngineCrawler(
+                rate_limiter=self.rate_limiter,
+                downloader_cls=AsyncImageDownloader if self.async_downloads else ProgressImageDownloader,
+                feeder_threads=1,
+                parser_threads=1,
+                downloader_threads=1 if self.async_downloads else self.downloader_threads,
+                storage=storage,
+                log_level=50
+            )
+            self.crawler.downloader.max_connections = self.max_connections
+            if self.processor is not None:
+                self.crawler.downloader.processor = self.processor
+                self.crawler.downloader.processing = processing
+            self.crawler.downloader.on_image = self._image_saved
+            self.crawler.downloader.on_duplicate = self._near_duplicate
+            self.crawler.downloader.checkpoint = checkpoint
+            remaining = 0 if self.cached else self.num_images - self.resumed
+            # Files written after the last checkpoint line are complete too, never reuse their numbers
+            file_idx_offset = max(checkpoint.max_index, storage.max_file_idx())
+            try:
+                if remaining > 0 and not self.cancelled:
+                    self.crawler.crawl(keyword=self.query, filters=self.filters, max_num=self.num_images,
+                                       remaining=remaining, file_idx_offset=file_idx_offset)
+            finally:
+                checkpoint.close()
+                storage.close()
+            if cache_key is not None and not self.cancelled:
+                self.cache.put(cache_key, self.query, self.filters, self.num_images, self.download_dir)
+
+            downloaded_count = len(
+                [name for name in os.listdir(self.download_dir)
+                 if os.path.isfile(os.path.join(self.download_dir, name)) and not name.startswith('.')])
+        return {
+            'query': self.query,
+            'filters': self.filters,
+            'download_dir': self.download_dir,
+            'downloaded': downloaded_count,
+            'bytes': self.bytes,
+            'reused': self.reused,
+            'near_duplicates': self.near_duplicates,
+            'resumed': self.resumed,
+            'seconds': round(self.elapsed(), 3),
+            'cached': self.cached,
+            'cancelled': self.cancelled,
+        }
+
+    def _serve_cached(self, cache_key, storage, checkpoint):
+        files = self.cache.get(cache_key, self.num_images)
+        if files is None:
+            return False
+        served = self.cache.serve(files, storage, checkpoint)
+        if served is None:
+            # Somebody deleted stored files, crawl again
+            self.cache.invalidate(cache_key)
+            return False
+        self.cached = True
+        for filename, nbytes in served:
+            self._image_saved(filename, 0)
+        return True
@@ -0,0 +1,103 @@
+import asyncio
+import importlib.util
+import random
+import time
+
+try:
+    import httpx
+except ImportError:
+    # Without httpx the engine keeps using icrawler's blocking downloader threads
+    httpx = None
+
+HTTP2 = importlib.util.find_spec('h2') is not None
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def backoff(attempt, base=0.5, cap=20.0):
+    """Exponential backoff with full jitter so retries from many tasks don't line up."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after(response):
+    value = response.headers.get('Retry-After', '')
+    return float(value) if value.isdigit() else None
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that grows while throughput improves and halves on errors (AIMD).
+
+    Every `window` finished requests the measured bytes/s is compared with the previous
+    window: better by 5% adds a slot, worse by 10% removes one. A failed request or a
+    429/5xx cuts the limit in half right away.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=64, window=8):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = window
+        self.active = 0
+        self.condition = asyncio.Condition()
+        self.last_rate = 0.0
+        self._reset_window()
+
+    def _reset_window(self):
+        self.window_bytes = 0
+        self.window_count = 0
+        self.window_start = time.monotonic()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def release(self, nbytes=0, error=False):
+        async with self.condition:
+            self.active -= 1
+            if error:
+                self.limit = max(self.minimum, self.limit // 2)
+                self.last_rate = 0.0
+                self._reset_window()
+            else:
+                self.window_bytes += nbytes
+                self.window_count += 1
+                if self.window_count >= self.window:
+                    rate = self.window_bytes / max(time.monotonic() - self.window_start, 1e-6)
+                    if rate > self.last_rate * 1.05:
+                        self.limit = min(self.maximum, self.limit + 1)
+                    elif rate < self.last_rate * 0.9:
+                        self.limit = max(self.minimum, self.limit - 1)
+                    self.last_rate = rate
+                    self._reset_window()
+            self.condition.notify_all()
+
+
+def make_client(headers, max_connections, timeout):
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return httpx.AsyncClient(http2=HTTP2, limits=limits, headers=headers, timeout=timeout, follow_redirects=True)
+
+
+async def fetch(client, url, limiter, max_retry=3, rate_limiter=None, should_stop=None):
+    """GET url through the shared client, returns the response or None after max_retry failures."""
+    for attempt in range(max_retry):
+        if should_stop is not None and should_stop():
+            return None
+        if rate_limiter is not None:
+            await rate_limiter.wait_async(url)
+        await limiter.acquire()
+        if should_stop is not None and should_stop():
+            await limiter.release()
+            return None
+        try:
+            response = await client.get(url)
+        except httpx.HTTPError:
+            await limiter.release(error=True)
+            await asyncio.sleep(backoff(attempt))
+            continue
+        if response.status_code in RETRY_STATUS:
+            await limiter.release(error=True)
+            await asyncio.sleep(retry_after(response) or backoff(attempt))
+            continue
+        await limiter.release(len(response.content))
+        return response
+    return None
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+
+# The 64 bit perceptual hash is split into 4 bands of 16 bits. Two hashes that differ in
+# at most 3 bits must share at least one band exactly, so those lookups use an index.
+BANDS = 4
+BAND_BITS = 16
+INDEXED_MAX_DISTANCE = BANDS - 1
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(image):
+    """64 bit difference hash: compares each pixel with its right neighbour on a 9x8 thumbnail."""
+    small = image.convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hash_bands(phash):
+    mask = (1 << BAND_BITS) - 1
+    return [(phash >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+def to_signed(value):
+    # SQLite integers are signed 64 bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def link_or_copy(src, dst):
+    tmp_path = dst + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        # Different drive or a filesystem without hard links
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+class ImageIndex:
+    """Content addressed image store with an SQLite index of source URLs and hashes.
+
+    Every unique file is kept once under <root>/objects and the query folders get hard
+    links to it, so deleting a query folder never loses the stored bytes.
+    """
+
+    def __init__(self, root, max_distance=3):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.max_distance = max_distance
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(root, 'index.sqlite3'), timeout=30, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS objects (
+                    sha256 TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    phash INTEGER,
+                    band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER,
+                    added REAL NOT NULL
+                )""")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    url TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL REFERENCES objects(sha256)
+                )""")
+            for band in range(BANDS):
+                self.db.execute(f'CREATE INDEX IF NOT EXISTS objects_band{band} ON objects(band{band})')
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _object_path(self, sha, relative_path):
+        path = os.path.join(self.root, relative_path)
+        if os.path.exists(path):
+            return path
+        # Someone removed the stored file, forget about it so it gets downloaded again
+        with self.db:
+            self.db.execute('DELETE FROM urls WHERE sha256 = ?', (sha,))
+            self.db.execute('DELETE FROM objects WHERE sha256 = ?', (sha,))
+        return None
+
+    def lookup_url(self, url):
+        """Path of the stored file already downloaded from url, or None."""
+        found = self.url_object(url)
+        return found[1] if found else None
+
+    def url_object(self, url):
+        """(sha256, path) of the object stored for url, or None."""
+        with self.lock:
+            row = self.db.execute(
+                'SELECT o.sha256, o.path FROM urls u JOIN objects o ON o.sha256 = u.sha256 WHERE u.url = ?',
+                (url,)).fetchone()
+            path = self._object_path(*row) if row else None
+            return (row[0], path) if path else None
+
+    def lookup_hash(self, sha):
+        with self.lock:
+            row = self.db.execute('SELECT sha256, path FROM objects WHERE sha256 = ?', (sha,)).fetchone()
+            return self._object_path(*row) if row else None
+
+    def find_similar(self, phash):
+        """sha256 of a stored image within max_distance bits of phash, or None."""
+        if self.max_distance < 0:
+            return None
+        bands = hash_bands(phash)
+        with self.lock:
+            if self.max_distance <= INDEXED_MAX_DISTANCE:
+                where = ' OR '.join(f'band{i} = ?' for i in range(BANDS))
+                rows = self.db.execute(f'SELECT sha256, phash FROM objects WHERE {where}', bands)
+            else:
+                rows = self.db.execute('SELECT sha256, phash FROM objects WHERE phash IS NOT NULL')
+            for sha, other in rows:
+                if ((phash ^ other) & ((1 << 64) - 1)).bit_count() <= self.max_distance:
+                    return sha
+        return None
+
+    def store(self, url, data, sha, phash, extension, fsync=False):
+        """Keep data in the object store (once per sha256) and remember url, returns its path."""
+        path = self.lookup_hash(sha)
+        if path is None:
+            relative_path = os.path.join('objects', sha[:2], f'{sha}.{extension}')
+            path = os.path.join(self.root, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            bands = hash_bands(phash) if phash is not None else [None] * BANDS
+            with self.lock, self.db:
+                self.db.execute(
+                    'INSERT OR IGNORE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (sha, relative_path, len(data), None if phash is None else to_signed(phash), *bands, time.time()))
+        self.add_url(url, sha)
+        return path
+
+    def remove(self, sha):
+        """Forget an object and delete its file, hard links in query folders keep their copy."""
+        with self.lock:
+            row = self.db.execute('SELECT path FROM objects WHERE sha256 = ?', (sha,)).fetchone()
+            with self.db:
+                self.db.execute('DELETE FROM urls WHERE sha256 = ?', (sha,))
+                self.db.execute('DELETE FROM objects WHERE sha256 = ?', (sha,))
+        if row and os.path.exists(os.path.join(self.root, row[0])):
+            os.remove(os.path.join(self.root, row[0]))
+
+    def add_url(self, url, sha):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO urls VALUES (?, ?)', (url, sha))
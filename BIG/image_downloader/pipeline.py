@@ -0,0 +1,99 @@
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+# Filter values of the format combo box that PIL can check, svg and raw can't be decoded
+PIL_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'gif': 'GIF', 'bmp': 'BMP', 'webp': 'WEBP', 'ico': 'ICO'}
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'BMP': 'bmp', 'WEBP': 'webp', 'ICO': 'ico', 'TIFF': 'tiff'}
+
+
+class RejectedImage(Exception):
+    pass
+
+
+class ProcessingOptions:
+    """What to check and change on every downloaded image, sizes are (width, height) tuples."""
+
+    def __init__(self, min_size=None, max_size=None, format=None, max_side=None, output_format=None,
+                 quality=85, thumbnail_side=None):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.format = format
+        self.max_side = max_side
+        self.output_format = output_format
+        self.quality = quality
+        self.thumbnail_side = thumbnail_side
+
+    def for_format(self, format):
+        options = ProcessingOptions(**vars(self))
+        options.format = format or None
+        return options
+
+
+class ProcessedImage:
+    def __init__(self, data, extension, width, height, thumbnail=None):
+        self.data = data
+        self.extension = extension
+        self.width = width
+        self.height = height
+        self.thumbnail = thumbnail
+
+
+def encode(image, pil_format, quality):
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def process_image(data, options):
+    """Runs in a worker process: validate, downscale/re-encode and thumbnail one image."""
+    try:
+        image = Image.open(io.BytesIO(data))
+        # load() decodes every pixel, truncated and corrupt files fail here
+        image.load()
+    except Exception as e:
+        raise RejectedImage(f'does not decode: {e}')
+
+    width, height = image.size
+    if options.min_size and (width < options.min_size[0] or height < options.min_size[1]):
+        raise RejectedImage(f'{width}x{height} is smaller than {options.min_size[0]}x{options.min_size[1]}')
+    if options.max_size and (width > options.max_size[0] or height > options.max_size[1]):
+        raise RejectedImage(f'{width}x{height} is larger than {options.max_size[0]}x{options.max_size[1]}')
+    wanted = PIL_FORMATS.get((options.format or '').lower())
+    if wanted and image.format != wanted:
+        raise RejectedImage(f'is {image.format}, not {wanted}')
+
+    source_format = image.format
+    target_format = PIL_FORMATS.get((options.output_format or '').lower(), source_format)
+    too_big = options.max_side and max(width, height) > options.max_side
+    animated = getattr(image, 'is_animated', False)
+    if (too_big or target_format != source_format) and not animated:
+        if too_big:
+            image.thumbnail((options.max_side, options.max_side), Image.LANCZOS)
+        data = encode(image, target_format, options.quality)
+    else:
+        target_format = source_format
+
+    thumbnail = None
+    if options.thumbnail_side:
+        small = image.copy()
+        small.thumbnail((options.thumbnail_side, options.thumbnail_side), Image.LANCZOS)
+        thumbnail = encode(small, 'JPEG', options.quality)
+
+    return ProcessedImage(data, EXTENSIONS.get(target_format, 'jpg'), image.width, image.height, thumbnail)
+
+
+class ImageProcessor:
+    """Process pool shared by all downloads, process() blocks the calling downloader thread only."""
+
+    def __init__(self, workers=None):
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+
+    def process(self, data, options):
+        return self.pool.submit(process_image, data, options).result()
+
+    def close(self):
+        self.pool.shutdown()
@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+
+from icrawler.storage import BaseStorage
+from PIL import Image
+
+from .index import content_hash, link_or_copy
+
+MANIFEST_NAME = '.manifest.jsonl'
+THUMBNAIL_DIR = 'thumbnails'
+
+
+class QueryStorage(BaseStorage):
+    """icrawler storage that writes straight to the final <query>_<NNN>.<ext> name.
+
+    The downloader still hands out ids like 000042.jpg, those are mapped to query_042.jpg
+    here. Every file is written to a .tmp file and renamed into place, so a folder never
+    holds half written images, and gets a line in .manifest.jsonl with its size, sha256,
+    source URL and dimensions.
+    """
+
+    def __init__(self, root_dir, query, index=None, fsync=False):
+        self.root_dir = root_dir
+        self.prefix = query.replace(" ", "_")
+        self.index = index
+        self.fsync = fsync
+        self.pending = {}
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(root_dir, THUMBNAIL_DIR), exist_ok=True)
+        self.manifest = open(os.path.join(root_dir, MANIFEST_NAME), 'a', encoding='utf-8')
+
+    def final_name(self, id, extension=None):
+        stem, id_extension = os.path.splitext(id)
+        extension = f'.{extension}' if extension else id_extension
+        return f'{self.prefix}_{int(stem):03d}{extension}'
+
+    def path(self, id, extension=None):
+        return os.path.join(self.root_dir, self.final_name(id, extension))
+
+    def expect(self, id, task):
+        # The downloader names the file right before writing it, remember which task it belongs to
+        self.pending[id] = task
+
+    def exists(self, id):
+        return os.path.exists(self.path(id))
+
+    def max_file_idx(self):
+        max_idx = 0
+        start = len(self.prefix) + 1
+        for filename in os.listdir(self.root_dir):
+            stem = os.path.splitext(filename)[0]
+            if stem.startswith(self.prefix + '_') and stem[start:].isdigit():
+                max_idx = max(max_idx, int(stem[start:]))
+        return max_idx
+
+    def write(self, id, data):
+        task = self.pending.pop(id, None) or {}
+        processed = task.get('processed')
+        if processed is not None:
+            # The post-processing stage may have re-encoded it into another format
+            data = processed.data
+            task['img_size'] = (processed.width, processed.height)
+            extension = processed.extension
+        else:
+            extension = os.path.splitext(id)[1].lstrip('.') or 'jpg'
+        path = self.path(id, extension)
+        if self.index is not None and 'sha256' in task:
+            stored_path = self.index.store(task['file_url'], data, task['sha256'], task.get('phash'), extension,
+                                           fsync=self.fsync)
+            link_or_copy(stored_path, path)
+        else:
+            self._write_atomic(path, data)
+        if processed is not None and processed.thumbnail is not None:
+            thumbnail_name = os.path.splitext(os.path.basename(path))[0] + '.jpg'
+            thumbnail_path = os.path.join(self.root_dir, THUMBNAIL_DIR, thumbnail_name)
+            self._write_atomic(thumbnail_path, processed.thumbnail)
+            task['thumbnail'] = thumbnail_path
+        sha = task['sha256'] if 'sha256' in task and processed is None else content_hash(data)
+        self._commit(id, path, task, len(data), sha)
+
+    def _write_atomic(self, path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def write_from(self, id, src_path, task):
+        """Put an already stored file under id, hard-linked when possible."""
+        path = self.path(id, os.path.splitext(src_path)[1].lstrip('.'))
+        link_or_copy(src_path, path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        self._commit(id, path, task, len(data), content_hash(data))
+
+    def _commit(self, id, path, task, size, sha):
+        if self.fsync and hasattr(os, 'O_DIRECTORY'):
+            # Make the rename itself durable (not possible on Windows)
+            fd = os.open(self.root_dir, os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        if task.get('img_size'):
+            width, height = task['img_size']
+        else:
+            with Image.open(path) as img:
+                width, height = img.size
+        task['path'] = path
+        entry = {'file': os.path.basename(path), 'url': task.get('file_url'), 'size': size, 'sha256': sha,
+                 'width': width, 'height': height}
+        if task.get('thumbnail'):
+            entry['thumbnail'] = os.path.relpath(task['thumbnail'], self.root_dir)
+        with self.lock:
+            self.manifest.write(json.dumps(entry) + '\n')
+            self.manifest.flush()
+
+    def close(self):
+        with self.lock:
+            if self.fsync:
+                os.fsync(self.manifest.fileno())
+            self.manifest.close()
@@ -1,40 +1,47 @@
 """
 My first application
 """
-import speech_recognition as sr
+import os
+
 import toga
 from toga.style import Pack
 from toga.style.pack import COLUMN, ROW
 
+# Cheap to import, the recognition stack loads in the background once the window is shown
+from speech_engine import SpeechEngine
+
 
 class HelloWorld(toga.App):
-    def speech_to_text():
-        # Create a recognizer object
-        recognizer = sr.Recognizer()
+    def startup(self):
+        # SPEECH_BACKEND=vosk recognizes offline on the CPU, the model comes from VOSK_MODEL
+        self.engine = SpeechEngine(backend=os.environ.get('SPEECH_BACKEND', 'google'))
 
-        # Use the default microphone as the audio source
-        with sr.Microphone() as source:
-            print("Listening... Speak now!")
+        self.listen_button = toga.Button("Listen", on_press=self.speech_to_text, style=Pack(padding=5))
+        self.result = toga.Label("Press Listen and speak", style=Pack(padding=5))
+        main_box = toga.Box(children=[self.listen_button, self.result], style=Pack(direction=COLUMN))
 
-            # Adjust for ambient noise
-            recognizer.adjust_for_ambient_noise(source)
+        self.main_window = toga.MainWindow(title=self.formal_name)
+        self.main_window.content = main_box
+        self.main_window.show()
 
-            # Listen for audio input
-            audio = recognizer.listen(source)
+        self.engine.warm_up()
 
+    async def speech_to_text(self, widget):
+        self.listen_button.enabled = False
         try:
-            # Use Google Speech Recognition to convert audio to text
-            text = recognizer.recognize_google(audio)
-            print("You said:", text)
-            return text
-        except sr.UnknownValueError:
-            print("Sorry, I couldn't understand what you said.")
-        except sr.RequestError as e:
-            print("Could not request results from the speech recognition service; {0}".format(e))
-
-    # Run the speech-to-text function
-    speech_to_text()
-
-    def main():
-        return None
-
+            await self.loop.run_in_executor(None, self.engine.wait_ready)
+            import speech_recognition as sr
+            self.result.text = "Listening... Speak now!"
+            try:
+                text = await self.engine.listen_once()
+                self.result.text = f"You said: {text}"
+            except sr.UnknownValueError:
+                self.result.text = "Sorry, I couldn't understand what you said."
+            except sr.RequestError as e:
+                self.result.text = "Could not request results from the speech recognition service; {0}".format(e)
+        finally:
+            self.listen_button.enabled = True
+
+
+def main():
+    return HelloWorld()
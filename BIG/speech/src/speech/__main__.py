@@ -1,4 +1,4 @@
-from speech_to_text_app import main
+from speech.app import main
 
 if __name__ == "__main__":
     main().main_loop()
@@ -6,21 +6,71 @@ import toga
 from toga.style import Pack
 from toga.style.pack import COLUMN, ROW
 
+# Cheap to import, the recognition stack loads in the background once the window is shown
+from speech_engine import SpeechEngine
+
 
 class speech(toga.App):
     def startup(self):
         """Construct and show the Toga application.
 
-        Usually, you would add your application to a main content box.
-        We then create a main window (with a name matching the app), and
-        show the main window.
+        The speech engine warms up after the main window is shown, results come in on
+        worker threads and are handed over to the event loop.
         """
-        main_box = toga.Box()
+        self.engine = SpeechEngine(self.on_result, self.on_partial)
+
+        self.listen_button = toga.Button("Start Listening", on_press=self.toggle_listening, style=Pack(padding=5))
+        self.status = toga.Label("Loading speech engine...", style=Pack(padding=5, flex=1))
+        controls = toga.Box(children=[self.listen_button, self.status], style=Pack(direction=ROW))
+        self.output = toga.MultilineTextInput(readonly=True, style=Pack(flex=1, padding=5))
+        main_box = toga.Box(children=[controls, self.output], style=Pack(direction=COLUMN))
 
         self.main_window = toga.MainWindow(title=self.formal_name)
         self.main_window.content = main_box
         self.main_window.show()
 
+        self.engine.warm_up()
+        self.loop.create_task(self.show_ready())
+
+    async def show_ready(self):
+        await self.loop.run_in_executor(None, self.engine.wait_ready)
+        error = self.engine.warm_up_error
+        self.status.text = f"Speech engine not available: {error}" if error else "Ready"
+
+    async def toggle_listening(self, widget):
+        if self.engine.listening:
+            self.engine.stop()
+            self.listen_button.text = "Start Listening"
+            self.status.text = "Ready"
+            return
+        await self.loop.run_in_executor(None, self.engine.wait_ready)
+        import speech_recognition as sr
+        try:
+            self.engine.start()
+        except sr.RequestError as e:
+            self.status.text = f"Can't listen: {e}"
+            return
+        self.listen_button.text = "Stop Listening"
+        self.status.text = "Listening... Speak now!"
+
+    def on_partial(self, text):
+        self.loop.call_soon_threadsafe(setattr, self.status, "text", f"... {text}")
+
+    def on_result(self, text, error, confidence):
+        # Called on a recognition thread
+        self.loop.call_soon_threadsafe(self.show_result, text, error)
+
+    def show_result(self, text, error):
+        import speech_recognition as sr
+        if error is None:
+            line = f"You said: {text}"
+        elif isinstance(error, sr.UnknownValueError):
+            line = "Sorry, I couldn't understand what you said."
+        else:
+            line = f"Could not request results; {error}"
+        self.output.value += line + "\n"
+        self.output.scroll_to_bottom()
+
 
 def main():
     return speech()
@@ -0,0 +1,37 @@
+"""
+Speech recognition pieces shared by the speech front-ends
+
+Importing the package is cheap, the names below load their module (and with it
+speech_recognition, numpy, ...) the first time they are used.
+"""
+import importlib
+
+_EXPORTS = {
+    'GoogleBackend': 'backends',
+    'RecognizerBackend': 'backends',
+    'VoskBackend': 'backends',
+    'available_backends': 'backends',
+    'make_backend': 'backends',
+    'VoiceActivityDetector': 'audio',
+    'SpeechEngine': 'engine',
+    'RecognitionPipeline': 'pipeline',
+    'Reorderer': 'pipeline',
+    'StreamingPipeline': 'pipeline',
+    'TranscriptStore': 'store',
+    'LatencyTracer': 'trace',
+    'Transcript': 'transcript',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
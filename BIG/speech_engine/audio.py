@@ -0,0 +1,169 @@
+import os
+import shutil
+import subprocess
+from collections import deque
+
+import numpy as np
+import speech_recognition as sr
+
+from .backends import SAMPLE_RATE
+
+FRAME_SECONDS = 0.03
+NOISE_BLOCK_SECONDS = 0.5
+
+
+def find_ffmpeg():
+    return os.environ.get('FFMPEG') or shutil.which('ffmpeg')
+
+
+def decode(path, rate=SAMPLE_RATE, chunk_seconds=1.0):
+    """Yields path as mono 16 bit numpy chunks at rate, never holding the whole file in memory.
+
+    ffmpeg does the decoding and resampling when it is installed (needed for webm/ogg/mp3),
+    otherwise wav, aiff and flac go through speech_recognition's AudioFile.
+    """
+    ffmpeg = find_ffmpeg()
+    if ffmpeg:
+        process = subprocess.Popen(
+            [ffmpeg, '-nostdin', '-loglevel', 'error', '-i', path, '-f', 's16le', '-ac', '1', '-ar', str(rate), '-'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            chunk_bytes = int(rate * chunk_seconds) * 2
+            while True:
+                data = process.stdout.read(chunk_bytes)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) // 2 * 2], np.int16)
+        finally:
+            process.stdout.close()
+            error = process.stderr.read().decode(errors='replace').strip()
+            process.stderr.close()
+            if process.wait() != 0 and error:
+                raise ValueError(f'{path}: {error}')
+    elif os.path.splitext(path)[1].lower() in ('.wav', '.aif', '.aiff', '.flac'):
+        with sr.AudioFile(path) as source:
+            frames = int(source.SAMPLE_RATE * chunk_seconds)
+            while True:
+                data = source.stream.read(frames)
+                if not data:
+                    break
+                audio = sr.AudioData(data, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+                yield np.frombuffer(audio.get_raw_data(convert_rate=rate, convert_width=2), np.int16)
+    else:
+        raise ValueError(f'{path}: decoding this format needs ffmpeg, install it or set FFMPEG to its path')
+
+
+def frame_energy(frames):
+    """RMS of every row of a (frames, samples) array."""
+    return np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+
+
+class VoiceActivityDetector:
+    """Frame based voice activity detection with a noise floor that follows the room.
+
+    Frames (30 ms) with an energy above ratio times the noise floor count as speech. The
+    floor is the quietest frame of the last noise_window seconds; people breathe and pause
+    often enough for that to be the room noise, and it follows the room within noise_window
+    seconds when it gets louder or quieter. A segment starts after
+    min_speech seconds of speech and only ends once there was none for hangover seconds,
+    so short pauses inside a sentence don't split it. Segments get `padding` seconds of
+    context on both sides and are cut at max_segment seconds at the latest.
+    """
+
+    def __init__(self, rate=SAMPLE_RATE, ratio=3.0, min_threshold=150, hangover=0.6, min_speech=0.15,
+                 max_segment=30.0, padding=0.2, noise_window=5.0):
+        self.rate = rate
+        self.ratio = ratio
+        self.min_threshold = min_threshold
+        self.frame_length = int(rate * FRAME_SECONDS)
+        self.hangover_frames = max(1, round(hangover / FRAME_SECONDS))
+        self.min_speech_frames = max(1, round(min_speech / FRAME_SECONDS))
+        self.max_segment_frames = round(max_segment / FRAME_SECONDS)
+        self.padding_frames = round(padding / FRAME_SECONDS)
+        # Minimum energy per half second block, the floor is the smallest of them
+        self.block_frames = round(NOISE_BLOCK_SECONDS / FRAME_SECONDS)
+        self.blocks = deque(maxlen=max(1, round(noise_window / NOISE_BLOCK_SECONDS)))
+        self.block_min = np.inf
+        self.block_count = 0
+        self.floor = None
+        self.leftover = np.zeros(0, np.int16)
+        self.frame_index = 0
+        self.recent = deque(maxlen=max(1, self.padding_frames))
+        self.onset = []
+        self.segment = None
+        self.segment_start = 0
+        self.silence_run = 0
+
+    @property
+    def threshold(self):
+        return max(self.min_threshold, (self.floor or 0) * self.ratio)
+
+    def process(self, samples):
+        """Feed 16 bit mono samples, returns [(start_seconds, samples)] of the segments that ended."""
+        samples = np.concatenate([self.leftover, samples])
+        whole = len(samples) // self.frame_length * self.frame_length
+        self.leftover = samples[whole:]
+        frames = samples[:whole].reshape(-1, self.frame_length)
+        energies = frame_energy(frames)
+        finished = []
+        for frame, energy in zip(frames, energies):
+            self._track_floor(energy)
+            self._frame(frame, energy > self.threshold, finished)
+            self.frame_index += 1
+        return finished
+
+    def _track_floor(self, energy):
+        self.block_min = min(self.block_min, energy)
+        self.block_count += 1
+        if self.block_count == self.block_frames:
+            self.blocks.append(self.block_min)
+            self.block_min = np.inf
+            self.block_count = 0
+        self.floor = float(min(min(self.blocks, default=np.inf), self.block_min))
+
+    def _frame(self, frame, voiced, finished):
+        if self.segment is not None:
+            self.segment.append(frame)
+            self.silence_run = 0 if voiced else self.silence_run + 1
+            if self.silence_run >= self.hangover_frames:
+                keep = len(self.segment) - self.silence_run + self.padding_frames
+                finished.append(self._emit(self.segment[:keep]))
+                self.segment = None
+                self.recent.clear()
+            elif len(self.segment) >= self.max_segment_frames:
+                # Still talking, carry on in a new segment
+                finished.append(self._emit(self.segment))
+                self.segment = []
+                self.segment_start = self.frame_index + 1
+        elif voiced:
+            self.onset.append(frame)
+            if len(self.onset) >= self.min_speech_frames:
+                padding = list(self.recent) if self.padding_frames else []
+                self.segment = padding + self.onset
+                self.segment_start = self.frame_index + 1 - len(self.segment)
+                self.onset = []
+                self.silence_run = 0
+        else:
+            # A click or a cough shorter than min_speech is not speech
+            self.recent.extend(self.onset)
+            self.recent.append(frame)
+            self.onset = []
+
+    def _emit(self, frames):
+        return self.segment_start * FRAME_SECONDS, np.concatenate(frames)
+
+    def flush(self):
+        """The segment still open when the audio ends, if any."""
+        finished = []
+        if self.segment:
+            end = len(self.segment) - self.silence_run + self.padding_frames
+            finished.append(self._emit(self.segment[:end]))
+        self.segment = None
+        self.onset = []
+        return finished
+
+    def split(self, chunks):
+        """Yields (start_seconds, samples) for every voiced segment in an iterable of chunks."""
+        for chunk in chunks:
+            yield from self.process(chunk)
+        yield from self.flush()
@@ -0,0 +1,136 @@
+import importlib.util
+import json
+import os
+
+import speech_recognition as sr
+
+# Vosk models are big, they are downloaded separately from https://alphacephei.com/vosk/models
+DEFAULT_VOSK_MODEL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models',
+                                  'vosk-model-small-en-us-0.15')
+SAMPLE_RATE = 16000
+
+
+class RecognizerBackend:
+    """A speech engine. recognize() turns a finished phrase into text, recognize_with_confidence()
+    into (text, confidence between 0 and 1 or None when the engine doesn't say).
+
+    Backends with streaming = True also hand out streams that take raw 16 bit mono audio
+    as it is recorded, report partial hypotheses and decide themselves where a phrase ends.
+    Failures raise sr.UnknownValueError (nothing understood) or sr.RequestError (engine
+    not reachable or not installed), the same as speech_recognition does.
+    """
+    name = None
+    label = None
+    streaming = False
+
+    def recognize(self, audio):
+        return self.recognize_with_confidence(audio)[0]
+
+    def recognize_with_confidence(self, audio):
+        return self.recognize(audio), None
+
+    def stream(self, sample_rate):
+        raise NotImplementedError
+
+
+class GoogleBackend(RecognizerBackend):
+    name = 'google'
+    label = 'Google (online)'
+
+    def __init__(self, recognizer=None, language='en-US'):
+        self.recognizer = recognizer or sr.Recognizer()
+        self.language = language
+
+    def recognize_with_confidence(self, audio):
+        result = self.recognizer.recognize_google(audio, language=self.language, show_all=True)
+        if not result or not result.get('alternative'):
+            raise sr.UnknownValueError()
+        best = result['alternative'][0]
+        return best['transcript'], best.get('confidence')
+
+
+def vosk_result(result):
+    result = json.loads(result)
+    words = result.get('result', [])
+    confidence = sum(word['conf'] for word in words) / len(words) if words else None
+    return result.get('text', ''), confidence
+
+
+class VoskStream:
+    def __init__(self, model, sample_rate):
+        import vosk
+        self.decoder = vosk.KaldiRecognizer(model, sample_rate)
+        # Per word confidences in the results
+        self.decoder.SetWords(True)
+        self.last_partial = ''
+
+    def accept(self, data):
+        """Feed audio, returns ('final', text, confidence) at the end of a phrase, ('partial', text, None)
+        when the hypothesis changed, otherwise None."""
+        if self.decoder.AcceptWaveform(data):
+            self.last_partial = ''
+            return ('final', *vosk_result(self.decoder.Result()))
+        partial = json.loads(self.decoder.PartialResult()).get('partial', '')
+        if partial != self.last_partial:
+            self.last_partial = partial
+            return 'partial', partial, None
+        return None
+
+    def finish(self):
+        """(text, confidence) of whatever is left."""
+        self.last_partial = ''
+        return vosk_result(self.decoder.FinalResult())
+
+
+class VoskBackend(RecognizerBackend):
+    """Offline recognition on the CPU with a Vosk (Kaldi) model."""
+    name = 'vosk'
+    label = 'Offline (Vosk)'
+    streaming = True
+
+    def __init__(self, model_path=None):
+        # Imported here, vosk takes longer to import than everything else together
+        try:
+            import vosk
+        except ImportError:
+            raise sr.RequestError('offline recognition needs the vosk package (pip install vosk)')
+        model_path = model_path or os.environ.get('VOSK_MODEL', DEFAULT_VOSK_MODEL)
+        if not os.path.isdir(model_path):
+            raise sr.RequestError(f'no Vosk model at {model_path}, set VOSK_MODEL to a model folder')
+        vosk.SetLogLevel(-1)
+        # Loading the model takes a while, do it once and share it between streams
+        self.model = vosk.Model(model_path)
+
+    def stream(self, sample_rate=SAMPLE_RATE):
+        return VoskStream(self.model, sample_rate)
+
+    def recognize_with_confidence(self, audio):
+        stream = self.stream(SAMPLE_RATE)
+        data = audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2)
+        results = []
+        for start in range(0, len(data), 8000):
+            result = stream.accept(data[start:start + 8000])
+            if result is not None and result[0] == 'final':
+                results.append(result[1:])
+        results.append(stream.finish())
+        results = [(text, confidence) for text, confidence in results if text]
+        if not results:
+            raise sr.UnknownValueError()
+        confidences = [confidence for _, confidence in results if confidence is not None]
+        return ' '.join(text for text, _ in results), sum(confidences) / len(confidences) if confidences else None
+
+
+BACKENDS = {backend.name: backend for backend in (GoogleBackend, VoskBackend)}
+
+
+def available_backends():
+    """Backends that can be created here, Google always is (it fails later when offline)."""
+    # Without vosk only the Google backend is offered
+    return [backend for backend in BACKENDS.values()
+            if backend is not VoskBackend or importlib.util.find_spec('vosk') is not None]
+
+
+def make_backend(name, **options):
+    if name not in BACKENDS:
+        raise ValueError(f'unknown speech backend {name!r}, choose from {", ".join(BACKENDS)}')
+    return BACKENDS[name](**options)
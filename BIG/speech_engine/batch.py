@@ -0,0 +1,168 @@
+"""
+Batch mode: python -m speech_engine.batch recordings/ talk.webm --output-dir transcripts --workers 8
+
+Every audio file (webm, wav, flac, ... or all of them in the given folders) is decoded as a
+stream, cut into phrases at pauses by the voice activity detector and the phrases are
+recognized in a process pool. Each file gets <name>.jsonl (one {"start", "end", "text"} line
+per phrase) and/or <name>.srt, in the same subfolders of --output-dir as the file is in the
+folder given. Files that would get the same transcript (x.wav and x.flac, or two x.wav given
+one by one) are refused after the first.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import speech_recognition as sr
+
+from .audio import VoiceActivityDetector, decode
+from .backends import BACKENDS, SAMPLE_RATE, make_backend
+
+AUDIO_EXTENSIONS = ('.webm', '.wav', '.flac', '.ogg', '.opus', '.mp3', '.m4a', '.aif', '.aiff')
+
+# Set once per worker process by init_worker
+backend = None
+
+
+def find_audio_files(paths):
+    """(path, path relative to the folder it was found in or only its name for a file given) of each audio file."""
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, filenames in sorted(os.walk(path)):
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(AUDIO_EXTENSIONS):
+                        yield os.path.join(folder, filename), os.path.relpath(os.path.join(folder, filename), path)
+        else:
+            yield path, os.path.basename(path)
+
+
+def init_worker(backend_name, options):
+    global backend
+    backend = make_backend(backend_name, **options)
+
+
+def transcribe(data):
+    """Runs in a worker process, returns (text, error) for one phrase of 16 bit mono audio."""
+    try:
+        return backend.recognize(sr.AudioData(data, SAMPLE_RATE, 2)), None
+    except sr.UnknownValueError:
+        return '', None
+    except sr.RequestError as e:
+        return None, str(e)
+
+
+def srt_time(seconds):
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}'
+
+
+class TranscriptWriter:
+    def __init__(self, audio_path, stem, formats):
+        """Writes stem.jsonl and/or stem.srt, stem being the output path without extension."""
+        os.makedirs(os.path.dirname(stem) or '.', exist_ok=True)
+        self.audio_path = audio_path
+        self.jsonl = open(stem + '.jsonl', 'w', encoding='utf-8') if 'jsonl' in formats else None
+        self.srt = open(stem + '.srt', 'w', encoding='utf-8') if 'srt' in formats else None
+        self.count = 0
+        self.failed = False
+
+    def write(self, start, end, text, error):
+        if error is not None:
+            print(f'{self.audio_path} at {srt_time(start)}: {error}', file=sys.stderr)
+        if self.jsonl is not None:
+            entry = {'start': round(start, 2), 'end': round(end, 2), 'text': text}
+            if error is not None:
+                entry['error'] = error
+            self.jsonl.write(json.dumps(entry) + '\n')
+        if text and self.srt is not None:
+            self.count += 1
+            self.srt.write(f'{self.count}\n{srt_time(start)} --> {srt_time(end)}\n{text}\n\n')
+
+    def close(self):
+        for f in (self.jsonl, self.srt):
+            if f is not None:
+                f.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='speech_engine.batch', description='Transcribe recorded audio files.')
+    parser.add_argument('paths', nargs='+', help='audio files or folders with audio files')
+    parser.add_argument('--output-dir', default='transcripts')
+    parser.add_argument('--format', default='jsonl,srt', help='comma separated: jsonl, srt')
+    parser.add_argument('--backend', default='google', choices=list(BACKENDS))
+    parser.add_argument('--model', help='Vosk model folder for --backend vosk')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='recognition processes')
+    parser.add_argument('--hangover', type=float, default=0.6, help='seconds of silence that end a phrase')
+    parser.add_argument('--max-phrase', type=float, default=30.0, help='longest phrase in seconds')
+    parser.add_argument('--ratio', type=float, default=3.0,
+                        help='a frame is speech when its energy is this many times the noise floor')
+    parser.add_argument('--min-threshold', type=float, default=150, help='energy that always counts as silence')
+    args = parser.parse_args(argv)
+
+    formats = set(args.format.split(','))
+    options = {'model_path': args.model} if args.backend == 'vosk' else {}
+    started = time.perf_counter()
+    audio_seconds = 0.0
+    failed = 0
+
+    with ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=(args.backend, options)) as pool:
+        # Results are written in submission order, at most two phrases per worker wait in memory.
+        # A None future marks the end of a file, so the pool moves on to the next file right away.
+        pending = deque()
+
+        def write_oldest():
+            nonlocal failed
+            writer, start, end, future = pending.popleft()
+            if future is None:
+                writer.close()
+            elif not writer.failed:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Anything but a recognition error (a crashed worker, a bug): the file fails, not the batch
+                    print(f'FAILED {writer.audio_path}: {e!r}', file=sys.stderr)
+                    writer.failed = True
+                    failed += 1
+                else:
+                    writer.write(start, end, *result)
+
+        written = {}
+        for path, relative in find_audio_files(args.paths):
+            stem = os.path.join(args.output_dir, os.path.splitext(relative)[0])
+            key = os.path.normcase(os.path.abspath(stem))
+            if key in written:
+                print(f'FAILED {path}: its transcript would overwrite the one of {written[key]}', file=sys.stderr)
+                failed += 1
+                continue
+            written[key] = path
+            writer = TranscriptWriter(path, stem, formats)
+            try:
+                vad = VoiceActivityDetector(SAMPLE_RATE, args.ratio, args.min_threshold, args.hangover,
+                                            max_segment=args.max_phrase)
+                for start, samples in vad.split(decode(path)):
+                    end = start + len(samples) / SAMPLE_RATE
+                    audio_seconds += end - start
+                    pending.append((writer, start, end, pool.submit(transcribe, samples.tobytes())))
+                    while len(pending) > args.workers * 2:
+                        write_oldest()
+            except ValueError as e:
+                print(f'FAILED {e}', file=sys.stderr)
+                failed += 1
+            pending.append((writer, None, None, None))
+        while pending:
+            write_oldest()
+
+    seconds = time.perf_counter() - started
+    print(f'Transcribed {audio_seconds / 60:.1f} minutes of speech in {seconds:.1f}s '
+          f'({audio_seconds / seconds:.1f}x real time), transcripts in {args.output_dir}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
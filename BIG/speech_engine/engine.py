@@ -0,0 +1,123 @@
+import threading
+
+# Nothing heavy is imported here. speech_recognition, numpy and the recognizer backends are
+# loaded by warm_up() on a background thread, or by the first call that needs them.
+
+
+class SpeechEngine:
+    """What a front-end talks to: pick a backend, start and stop listening, get results.
+
+    Results arrive through callbacks on worker threads, on_result(text, error, confidence)
+    in the order the phrases were spoken and on_partial(text) for streaming backends, so
+    front-ends hand them over to their UI thread themselves. listen_once() is the asyncio
+    version for a single phrase.
+
+    Call warm_up() once the window is shown, it imports the recognition stack and creates
+    the backend in the background so the first start() doesn't wait for it. A LatencyTracer
+    passed as tracer times every utterance.
+    """
+
+    def __init__(self, on_result=None, on_partial=None, backend='google', workers=4, pause=0.6,
+                 microphone=None, tracer=None, **backend_options):
+        self.on_result = on_result
+        self.on_partial = on_partial
+        self.backend_name = backend
+        self.backend_options = backend_options
+        self.workers = workers
+        self.pause = pause
+        self.microphone = microphone
+        self.tracer = tracer
+        self.backends = {}
+        self.backends_lock = threading.Lock()
+        self.pipeline = None
+        self.ready = threading.Event()
+        self.warm_up_error = None
+        self.warm_up_thread = None
+
+    def warm_up(self):
+        if self.warm_up_thread is None:
+            self.warm_up_thread = threading.Thread(target=self._warm_up, name='speech-warm-up', daemon=True)
+            self.warm_up_thread.start()
+        return self
+
+    def _warm_up(self):
+        try:
+            from . import pipeline  # noqa: F401, imports speech_recognition and numpy
+            self.get_backend()
+        except Exception as e:
+            # Reported again by start() when the backend is really needed
+            self.warm_up_error = e
+        finally:
+            self.ready.set()
+
+    def wait_ready(self, timeout=None):
+        self.warm_up()
+        return self.ready.wait(timeout)
+
+    def available_backends(self):
+        """(name, label) of the backends that can be used here."""
+        from .backends import available_backends
+        return [(backend.name, backend.label) for backend in available_backends()]
+
+    def get_backend(self, name=None):
+        """The backend called name (the current one by default), created on first use and kept,
+        loading an offline model takes seconds. Raises sr.RequestError when it can't be used."""
+        from .backends import make_backend
+        name = name or self.backend_name
+        with self.backends_lock:
+            if name not in self.backends:
+                options = self.backend_options if name == self.backend_name else {}
+                self.backends[name] = make_backend(name, **options)
+            return self.backends[name]
+
+    @property
+    def listening(self):
+        return self.pipeline is not None
+
+    def start(self, backend=None):
+        """Start listening with backend (the current one by default)."""
+        from .pipeline import RecognitionPipeline, StreamingPipeline
+        self.wait_ready()
+        if backend is not None:
+            self.backend_name = backend
+        chosen = self.get_backend()
+        if chosen.streaming:
+            # The engine hears the audio as it is recorded and reports what it understood so far
+            self.pipeline = StreamingPipeline(chosen, self._deliver, self.on_partial, microphone=self.microphone,
+                                              tracer=self.tracer)
+        else:
+            # One thread keeps reading the microphone while earlier phrases are recognized in parallel
+            self.pipeline = RecognitionPipeline(chosen.recognize_with_confidence, self._deliver, workers=self.workers,
+                                                microphone=self.microphone, vad_options={'hangover': self.pause},
+                                                tracer=self.tracer)
+        self.pipeline.start()
+
+    def stop(self):
+        """Stop listening, phrases already captured are still delivered."""
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+
+    def _deliver(self, text, error, confidence):
+        if self.on_result is not None:
+            self.on_result(text, error, confidence)
+
+    def recognize_once(self, timeout=None, phrase_time_limit=None):
+        """Listen for one phrase and return its text, blocking. Raises sr.WaitTimeoutError,
+        sr.UnknownValueError or sr.RequestError."""
+        import speech_recognition as sr
+        from .backends import SAMPLE_RATE
+        self.wait_ready()
+        backend = self.get_backend()
+        recognizer = sr.Recognizer()
+        microphone = self.microphone or (lambda: sr.Microphone(sample_rate=SAMPLE_RATE))
+        with microphone() as source:
+            recognizer.adjust_for_ambient_noise(source)
+            audio = recognizer.listen(source, timeout, phrase_time_limit)
+        return backend.recognize(audio)
+
+    async def listen_once(self, timeout=None, phrase_time_limit=None):
+        """recognize_once() on a worker thread, for front-ends that run an asyncio loop."""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.recognize_once, timeout, phrase_time_limit)
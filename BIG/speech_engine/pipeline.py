@@ -0,0 +1,235 @@
+import itertools
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import speech_recognition as sr
+
+from .audio import VoiceActivityDetector
+from .backends import SAMPLE_RATE
+
+# Sent by the capture thread before the audio, which comes as (perf_counter time it was read, bytes)
+AudioFormat = namedtuple('AudioFormat', 'rate width')
+
+
+class Reorderer:
+    """Hands results to deliver() in sequence number order, whatever order they finish in."""
+
+    def __init__(self, deliver, first=0):
+        self.deliver = deliver
+        self.next_seq = first
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def put(self, seq, *result):
+        with self.lock:
+            self.pending[seq] = result
+            # Deliver under the lock so two workers can't interleave their outputs
+            while self.next_seq in self.pending:
+                self.deliver(*self.pending.pop(self.next_seq))
+                self.next_seq += 1
+
+
+class RecognitionPipeline:
+    """Microphone capture on one thread, recognition on a pool of worker threads.
+
+    The capture thread only reads raw audio from the microphone and queues it. A second
+    thread runs it through the voice activity detector and hands every voiced segment to
+    the pool, so nothing said while an earlier phrase is still being recognized gets lost
+    and silence never reaches the recognizer. recognize(audio) returns (text, confidence).
+    on_result(text, error, confidence) is called in the order the phrases were spoken,
+    error being the exception (usually UnknownValueError or RequestError) of a phrase that
+    could not be recognized, text is None then.
+
+    With a LatencyTracer every phrase is traced under its sequence number.
+    """
+
+    def __init__(self, recognize, on_result, workers=4, microphone=None, vad_options=None, tracer=None):
+        self.recognize = recognize
+        self.on_result = on_result
+        self.microphone = microphone or (lambda: sr.Microphone(sample_rate=SAMPLE_RATE))
+        self.workers = workers
+        self.vad_options = vad_options or {}
+        self.tracer = tracer
+        self.reorderer = Reorderer(self._deliver)
+        self.chunks = queue.Queue()
+        self.listening = threading.Event()
+        self.threads = []
+
+    def start(self):
+        self.listening.set()
+        self.threads = [threading.Thread(target=self._capture, daemon=True),
+                        threading.Thread(target=self._dispatch, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """Stop listening, phrases already captured are still recognized and delivered."""
+        self.listening.clear()
+
+    def join(self, timeout=None):
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _capture(self):
+        try:
+            with self.microphone() as source:
+                self.chunks.put(AudioFormat(source.SAMPLE_RATE, source.SAMPLE_WIDTH))
+                while self.listening.is_set():
+                    data = source.stream.read(source.CHUNK)
+                    self.chunks.put((time.perf_counter(), data))
+        except Exception as e:
+            # No microphone (or PyAudio missing), report it after whatever was already captured
+            self.chunks.put(e)
+        finally:
+            self.chunks.put(None)
+
+    def _dispatch(self):
+        seq = itertools.count()
+        vad = rate = width = None
+        # Samples seen so far and when the last of them was read, to date the end of speech
+        position = 0
+        captured = dequeued = None
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='recognize') as pool:
+            while True:
+                chunk = self.chunks.get()
+                if chunk is None:
+                    segments = vad.flush() if vad is not None else []
+                elif isinstance(chunk, Exception):
+                    pool.submit(self._recognize, next(seq), chunk)
+                    continue
+                elif isinstance(chunk, AudioFormat):
+                    rate, width = chunk
+                    vad = VoiceActivityDetector(rate, **self.vad_options)
+                    continue
+                else:
+                    captured, data = chunk
+                    dequeued = time.perf_counter()
+                    samples = sr.AudioData(data, rate, width).get_raw_data(convert_width=2) if width != 2 else data
+                    position += len(samples) // 2
+                    segments = vad.process(np.frombuffer(samples, np.int16))
+                for start, samples in segments:
+                    n = next(seq)
+                    if self.tracer is not None and captured is not None:
+                        speech_end = round(start * rate) + len(samples) - vad.padding_frames * vad.frame_length
+                        self.tracer.mark(n, 'captured', captured)
+                        self.tracer.mark(n, 'dequeued', dequeued)
+                        self.tracer.mark(n, 'speech_end', captured - (position - speech_end) / rate)
+                        self.tracer.mark(n, 'emitted')
+                    pool.submit(self._recognize, n, sr.AudioData(samples.tobytes(), rate, 2))
+                if chunk is None:
+                    break
+
+    def _recognize(self, seq, audio):
+        if isinstance(audio, Exception):
+            self.reorderer.put(seq, None, None, audio, None)
+            return
+        if self.tracer is not None:
+            self.tracer.mark(seq, 'started')
+        try:
+            (text, confidence), error = self.recognize(audio), None
+        except Exception as e:
+            # Every sequence number has to be delivered or the ones after it would wait forever
+            text, confidence, error = None, None, e
+        if self.tracer is not None:
+            self.tracer.mark(seq, 'recognized')
+        self.reorderer.put(seq, seq, text, error, confidence)
+
+    def _deliver(self, seq, text, error, confidence):
+        # Marked first, a front-end may draw the result before on_result returns
+        if self.tracer is not None and seq is not None:
+            self.tracer.mark(seq, 'delivered')
+        self.on_result(text, error, confidence)
+
+
+class StreamingPipeline:
+    """Feeds the microphone straight into a streaming backend.
+
+    The capture thread only reads audio chunks, a decoder thread passes them to the backend,
+    which reports on_partial(text) while a phrase is spoken and on_result(text, error,
+    confidence) once it decided the phrase ended.
+
+    With a LatencyTracer every final result is traced, its recognize span being the
+    backend's work on the chunk that completed the phrase.
+    """
+
+    def __init__(self, backend, on_result, on_partial=None, microphone=None, tracer=None):
+        self.backend = backend
+        self.on_result = on_result
+        self.on_partial = on_partial
+        self.microphone = microphone or (lambda: sr.Microphone(sample_rate=SAMPLE_RATE))
+        self.tracer = tracer
+        self.finals = itertools.count()
+        self.chunks = queue.Queue()
+        self.listening = threading.Event()
+        self.threads = []
+
+    def start(self):
+        self.listening.set()
+        self.threads = [threading.Thread(target=self._capture, daemon=True),
+                        threading.Thread(target=self._decode, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.listening.clear()
+
+    def join(self, timeout=None):
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _capture(self):
+        try:
+            with self.microphone() as source:
+                self.chunks.put(source.SAMPLE_RATE)
+                while self.listening.is_set():
+                    data = source.stream.read(source.CHUNK)
+                    self.chunks.put((time.perf_counter(), data))
+        except Exception as e:
+            self.chunks.put(e)
+        finally:
+            self.chunks.put(None)
+
+    def _decode(self):
+        stream = None
+        captured = None
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                self.on_result(None, chunk, None)
+            elif isinstance(chunk, int):
+                # The capture thread sends the sample rate first
+                stream = self.backend.stream(chunk)
+            else:
+                captured, data = chunk
+                started = time.perf_counter()
+                self._handle(stream.accept(data), captured, started)
+        if stream is not None:
+            # Whatever was said right before stopping
+            started = time.perf_counter()
+            self._handle(('final', *stream.finish()), captured, started)
+
+    def _handle(self, result, captured=None, started=None):
+        if result is None:
+            return
+        kind, text, confidence = result
+        if kind == 'partial':
+            if self.on_partial is not None:
+                self.on_partial(text)
+        elif text:
+            n = next(self.finals)
+            if self.tracer is not None and captured is not None:
+                self.tracer.mark(n, 'captured', captured)
+                self.tracer.mark(n, 'dequeued', started)
+                self.tracer.mark(n, 'started', started)
+                self.tracer.mark(n, 'recognized')
+                self.tracer.mark(n, 'delivered')
+            self.on_result(text, None, confidence)
+        elif self.on_partial is not None:
+            # Noise that turned out to be nothing, clear the partial text
+            self.on_partial('')
@@ -0,0 +1,176 @@
+"""
+Offline, repeatable latency and throughput benchmark of the recognition pipeline:
+
+    python -m speech_engine.replay temp_audio.webm recordings/ --delay 0.4 --trace trace.json
+
+Recorded audio fixtures are played into RecognitionPipeline through ReplayMicrophone,
+a fake sr.Microphone that hands out the audio at the pace it was recorded (or --speed
+times faster), and recognized by StubRecognizer, which takes a fixed, seeded time per
+phrase instead of calling a service. Prints per-stage latency percentiles, --trace also
+writes every utterance as a Chrome trace. Latencies are only meaningful at --speed 1,
+the pause that ends a phrase is measured in audio time.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+import speech_recognition as sr
+
+from .audio import decode
+from .backends import SAMPLE_RATE
+from .batch import find_audio_files
+from .pipeline import RecognitionPipeline
+from .trace import LatencyTracer
+
+
+class ReplayMicrophone(sr.AudioSource):
+    """Plays an audio file like a microphone would, followed by tail seconds of silence.
+
+    finished is set once all of it was read, the pipeline keeps getting silence after that.
+    It is also set when the file can't be played, with the exception in error.
+    """
+
+    def __init__(self, path, speed=1.0, tail=1.0, chunk_size=1024):
+        self.path = path
+        self.speed = speed
+        self.tail = tail
+        self.CHUNK = chunk_size
+        self.SAMPLE_RATE = SAMPLE_RATE
+        self.SAMPLE_WIDTH = 2
+        self.finished = threading.Event()
+        self.duration = 0.0
+        self.samples = None
+        self.error = None
+        self.stream = None
+
+    def load(self):
+        """Decodes the file, raises ValueError or OSError if it can't be."""
+        if self.samples is None:
+            self.samples = np.concatenate(list(decode(self.path))
+                                          + [np.zeros(int(self.tail * SAMPLE_RATE), np.int16)])
+            self.duration = len(self.samples) / SAMPLE_RATE
+        return self.samples
+
+    def __enter__(self):
+        try:
+            samples = self.load()
+        except Exception as e:
+            # Raised in the pipeline's capture thread, whoever waits for finished has to see it
+            self.error = e
+            self.finished.set()
+            raise
+        self.stream = ReplayStream(samples.tobytes(), self.SAMPLE_RATE * self.speed, self.finished)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+
+
+class ReplayStream:
+    def __init__(self, data, rate, finished):
+        self.data = data
+        self.rate = rate
+        self.finished = finished
+        self.offset = 0
+        self.started = None
+
+    def read(self, size):
+        if self.started is None:
+            self.started = time.perf_counter()
+        chunk = self.data[self.offset:self.offset + size * 2]
+        self.offset += size * 2
+        if len(chunk) < size * 2:
+            self.finished.set()
+            chunk += b'\0' * (size * 2 - len(chunk))
+        # Sleep until the audio would have been recorded, so delays don't add up
+        due = self.started + self.offset / 2 / self.rate
+        time.sleep(max(0.0, due - time.perf_counter()))
+        return chunk
+
+
+class StubRecognizer:
+    """Stands in for a recognition service: delay seconds per phrase (plus per_second for every
+    second of audio), give or take jitter, reproducible with seed."""
+
+    def __init__(self, delay=0.3, per_second=0.05, jitter=0.1, seed=0):
+        self.delay = delay
+        self.per_second = per_second
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def recognize_with_confidence(self, audio):
+        seconds = len(audio.frame_data) / audio.sample_rate / audio.sample_width
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, self.delay + self.per_second * seconds + jitter))
+        return f'{seconds:.2f} seconds of speech', 1.0
+
+
+def replay(path, recognizer, tracer, workers=4, speed=1.0, hangover=0.6):
+    """Plays one fixture through the pipeline, returns (utterances, audio seconds, wall seconds)."""
+    results = []
+    microphone = ReplayMicrophone(path, speed)
+    # Before the pipeline starts, so a file that can't be decoded fails here instead of in its thread
+    microphone.load()
+    pipeline = RecognitionPipeline(recognizer.recognize_with_confidence, lambda *result: results.append(result),
+                                   workers=workers, microphone=lambda: microphone, vad_options={'hangover': hangover},
+                                   tracer=tracer)
+    started = time.perf_counter()
+    pipeline.start()
+    microphone.finished.wait()
+    pipeline.stop()
+    pipeline.join()
+    if microphone.error is not None:
+        raise microphone.error
+    return len(results), microphone.duration, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='speech_engine.replay', description='Replay audio fixtures through the '
+                                     'recognition pipeline with a stub recognizer and report latencies.')
+    parser.add_argument('paths', nargs='+', help='audio files or folders with audio files')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--speed', type=float, default=1.0, help='play the audio this many times faster')
+    parser.add_argument('--hangover', type=float, default=0.6, help='seconds of silence that end a phrase')
+    parser.add_argument('--delay', type=float, default=0.3, help='stub recognition seconds per phrase')
+    parser.add_argument('--per-second', type=float, default=0.05, help='stub recognition seconds per audio second')
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace', help='write a Chrome trace of every utterance to this file')
+    args = parser.parse_args(argv)
+
+    recognizer = StubRecognizer(args.delay, args.per_second, args.jitter, args.seed)
+    tracer = LatencyTracer(keep=100000)
+    utterances = 0
+    audio_seconds = wall_seconds = 0.0
+    paths = [path for path, _ in find_audio_files(args.paths)]
+    if not paths:
+        print(f'No audio files in {" ".join(args.paths)}', file=sys.stderr)
+        return 1
+    for path in paths:
+        try:
+            count, duration, seconds = replay(path, recognizer, tracer, args.workers, args.speed, args.hangover)
+        except (ValueError, OSError) as e:
+            print(f'FAILED {e}', file=sys.stderr)
+            return 1
+        print(f'{path}: {count} utterances in {duration:.1f}s of audio, replayed in {seconds:.1f}s')
+        utterances += count
+        audio_seconds += duration
+        wall_seconds += seconds
+
+    print(f'\n{utterances} utterances, {utterances / wall_seconds:.2f}/s, '
+          f'{audio_seconds / wall_seconds:.2f}x real time\n')
+    print(tracer.report())
+    if args.trace:
+        with open(args.trace, 'w') as f:
+            tracer.dump(f)
+        print(f'\nTrace written to {args.trace}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Startup benchmark of the speech front-ends:
+
+    python -m speech_engine.startup --runs 5
+
+Every run is a fresh interpreter that imports the front-end module (what happens before
+its window can show), then warms the engine up the way the apps do after the window is
+shown. Reports the median of both and whether the import pulled in the heavy modules.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BIG = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FRONT_ENDS = (
+    ('tkinter', 'speech_to_text_app', [BIG]),
+    ('toga speech', 'speech.app', [os.path.join(BIG, 'speech', 'src'), BIG]),
+    ('toga helloworld', 'helloworld.app', [os.path.join(BIG, 'speech', 'helloworld', 'src'), BIG]),
+)
+
+HEAVY_MODULES = ('speech_recognition', 'numpy', 'vosk')
+
+PROBE = '''
+import importlib, json, sys, time
+started = time.perf_counter()
+importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+heavy = [name for name in sys.argv[2:] if name in sys.modules]
+from speech_engine import SpeechEngine
+engine = SpeechEngine().warm_up()
+engine.wait_ready()
+print(json.dumps({'import': imported - started, 'warm_up': time.perf_counter() - imported, 'heavy': heavy,
+                  'error': repr(engine.warm_up_error) if engine.warm_up_error else None}))
+'''
+
+
+def probe(module, path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path + [os.environ.get('PYTHONPATH', '')]))
+    result = subprocess.run([sys.executable, '-c', PROBE, module, *HEAVY_MODULES], env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='speech_engine.startup')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f'{"front-end":16} {"import ms":>10} {"warm-up ms":>11}  heavy modules at import')
+    for name, module, path in FRONT_ENDS:
+        try:
+            runs = [probe(module, path) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f'{name:16} skipped: {e}')
+            continue
+        import_ms = statistics.median(run['import'] for run in runs) * 1000
+        warm_up_ms = statistics.median(run['warm_up'] for run in runs) * 1000
+        print(f'{name:16} {import_ms:10.1f} {warm_up_ms:11.1f}  {", ".join(runs[0]["heavy"]) or "none"}'
+              + (f'  (warm-up failed: {runs[0]["error"]})' if runs[0]['error'] else ''))
+
+
+if __name__ == '__main__':
+    main()
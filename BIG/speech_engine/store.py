@@ -0,0 +1,188 @@
+"""
+Archive of every recognized segment across sessions, searchable with SQLite FTS5.
+
+    python -m speech_engine.store --benchmark 1000000
+
+fills a scratch database with that many segments and times a few searches.
+"""
+import argparse
+import os
+import queue
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+
+def match_expression(query):
+    """Turn what someone typed into an FTS5 query: every word must appear, the last one as a prefix."""
+    words = ['"' + word.replace('"', '""') + '"' for word in query.split()]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+
+class TranscriptStore:
+    """SQLite (WAL) store of recognized segments with an FTS5 index on their text.
+
+    add() only puts the segment on a queue. A writer thread commits whatever is queued in
+    one transaction (up to batch_size rows) so recognition never waits for the disk, and
+    searches run on their own connection without blocking the writer. SQLite picks the ids,
+    so several processes can share the file. When a batch can't be written the writer keeps
+    the error and add() and flush() raise it from then on.
+    """
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.error = None
+        self.reader = db = self._connect()
+        # Commits the schema, the connection stays open for searches
+        with db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS segments (
+                    id INTEGER PRIMARY KEY,
+                    session TEXT NOT NULL,
+                    time REAL NOT NULL,
+                    text TEXT NOT NULL,
+                    confidence REAL
+                )""")
+            db.execute('CREATE INDEX IF NOT EXISTS segments_session ON segments(session, id)')
+            db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(text, content='segments', "
+                       "content_rowid='id')")
+            db.execute("""
+                CREATE TRIGGER IF NOT EXISTS segments_fts_insert AFTER INSERT ON segments BEGIN
+                    INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+                END""")
+        self.reader_lock = threading.Lock()
+        self.writer = threading.Thread(target=self._write_batches, daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    @staticmethod
+    def new_session():
+        return uuid.uuid4().hex
+
+    def add(self, session, text, confidence=None, timestamp=None):
+        self._raise_error()
+        self.queue.put((session, timestamp or time.time(), text, confidence))
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(f'saving transcripts failed: {self.error}') from self.error
+
+    def _write_batches(self):
+        try:
+            db = self._connect()
+        except Exception as e:
+            self.error = e
+            db = None
+        closing = False
+        while not closing:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Besides segments the queue carries flush() events and None to stop
+            closing = None in batch
+            flushed = [item for item in batch if isinstance(item, threading.Event)]
+            batch = [item for item in batch if isinstance(item, tuple)]
+            if batch and self.error is None:
+                try:
+                    with db:
+                        # The trigger adds them to the FTS index
+                        db.executemany('INSERT INTO segments (session, time, text, confidence) VALUES (?, ?, ?, ?)',
+                                       batch)
+                except Exception as e:
+                    # Kept for add() and flush(), the thread goes on so flush() never waits forever
+                    self.error = e
+            for event in flushed:
+                event.set()
+        if db is not None:
+            db.close()
+
+    def search(self, query, limit=50, before_id=None):
+        """Newest segments containing every word of query, pass the last id as before_id for the next page.
+
+        Returns (id, session, time, text, confidence) tuples.
+        """
+        expression = match_expression(query)
+        if not expression:
+            return []
+        with self.reader_lock:
+            return self.reader.execute(
+                'SELECT s.id, s.session, s.time, s.text, s.confidence FROM segments_fts f '
+                'JOIN segments s ON s.id = f.rowid '
+                'WHERE segments_fts MATCH ? AND f.rowid < ? ORDER BY f.rowid DESC LIMIT ?',
+                (expression, before_id or 2 ** 63 - 1, limit)).fetchall()
+
+    def export(self, f, session=None, page_size=1000):
+        """Write segments (of one session or all of them) to the text file f, oldest first."""
+        last_id = 0
+        where = 'id > ?' + (' AND session = ?' if session else '')
+        while True:
+            with self.reader_lock:
+                page = self.reader.execute(
+                    f'SELECT id, time, text FROM segments WHERE {where} ORDER BY id LIMIT ?',
+                    (last_id, session, page_size) if session else (last_id, page_size)).fetchall()
+            if not page:
+                break
+            for _, timestamp, text in page:
+                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))}  {text}\n")
+            last_id = page[-1][0]
+
+    def flush(self):
+        """Wait until everything added so far is committed, RuntimeError if it couldn't be."""
+        self._raise_error()
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+        self._raise_error()
+
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
+        with self.reader_lock:
+            self.reader.close()
+
+
+WORDS = ('the quick brown fox jumps over lazy dog meeting budget project deadline review speech text '
+         'model server client weather coffee tomorrow monday report numbers search window export').split()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='speech_engine.store')
+    parser.add_argument('--benchmark', type=int, default=1000000, help='segments in the scratch database')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = TranscriptStore(os.path.join(folder, 'transcripts.sqlite3'), batch_size=5000)
+        started = time.perf_counter()
+        session = store.new_session()
+        for i in range(args.benchmark):
+            if i % 10000 == 0:
+                session = store.new_session()
+            store.add(session, ' '.join(random.choices(WORDS, k=random.randint(4, 16))), random.random())
+        add_seconds = time.perf_counter() - started
+        store.flush()
+        print(f'{args.benchmark} segments added in {add_seconds:.2f}s ({args.benchmark / add_seconds:.0f}/s), '
+              f'committed after {time.perf_counter() - started:.2f}s')
+        for query in ('budget', 'quick fox', 'dead', 'coffee tomorrow report', 'nothing like this'):
+            started = time.perf_counter()
+            results = store.search(query)
+            print(f'search {query!r:26} {len(results):3d} results in {(time.perf_counter() - started) * 1000:6.1f} ms')
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+from collections import deque
+
+# (stage, from event, to event) of an utterance's timeline, in perf_counter seconds
+STAGES = (
+    ('capture', 'captured', 'dequeued'),    # microphone read -> the pipeline picked the chunk up
+    ('endpoint', 'speech_end', 'emitted'),  # last voiced audio -> the detector decided the phrase ended
+    ('queue', 'emitted', 'started'),        # waiting for a free recognition worker
+    ('recognize', 'started', 'recognized'),
+    ('reorder', 'recognized', 'delivered'),  # waiting for earlier phrases
+    ('render', 'delivered', 'rendered'),    # on screen
+)
+
+
+def percentile(ordered, fraction):
+    """Nearest rank percentile of a sorted list."""
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+class LatencyTracer:
+    """Timing spans for every stage of every utterance.
+
+    The pipelines mark() events as an utterance passes through them. It is finished when
+    it is delivered, or when a front-end that draws in batches calls rendered() if
+    wait_for_render is set. The last `window` spans of every stage feed percentiles(), the
+    last `keep` utterances can be dumped as a Chrome trace (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self, wait_for_render=False, window=10000, keep=1000):
+        self.wait_for_render = wait_for_render
+        self.active = {}
+        self.delivered = deque()
+        self.samples = {stage: deque(maxlen=window) for stage, _, _ in STAGES + (('total', None, None),)}
+        self.finished = deque(maxlen=keep)
+        self.lock = threading.Lock()
+
+    def mark(self, key, event, at=None):
+        """Record that utterance key reached event (now, or at the perf_counter time at)."""
+        at = time.perf_counter() if at is None else at
+        with self.lock:
+            self.active.setdefault(key, {})[event] = at
+            if event == 'delivered':
+                if self.wait_for_render:
+                    self.delivered.append(key)
+                else:
+                    self._finish(key)
+
+    def rendered(self):
+        """Everything delivered so far is on screen now."""
+        at = time.perf_counter()
+        with self.lock:
+            while self.delivered:
+                key = self.delivered.popleft()
+                self.active[key]['rendered'] = at
+                self._finish(key)
+
+    def _finish(self, key):
+        events = self.active.pop(key)
+        spans = []
+        for stage, start, end in STAGES:
+            if start in events and end in events:
+                spans.append((stage, events[start], events[end] - events[start]))
+                self.samples[stage].append(events[end] - events[start])
+        first, last = min(events.values()), max(events.values())
+        self.samples['total'].append(last - first)
+        self.finished.append((key, spans))
+
+    def percentiles(self):
+        """{stage: {'count', 'p50', 'p95', 'p99'}} in milliseconds, for the stages seen so far."""
+        with self.lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items() if values}
+        return {stage: {'count': len(ordered),
+                        **{f'p{p}': percentile(ordered, p / 100) * 1000 for p in (50, 95, 99)}}
+                for stage, ordered in samples.items()}
+
+    def report(self):
+        lines = [f'{"stage":10} {"count":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}']
+        for stage, values in self.percentiles().items():
+            lines.append(f'{stage:10} {values["count"]:6d} {values["p50"]:8.1f} {values["p95"]:8.1f} '
+                         f'{values["p99"]:8.1f}')
+        return '\n'.join(lines)
+
+    def dump(self, f):
+        """Write the kept utterances to the file f in Chrome trace event format, one row per stage."""
+        with self.lock:
+            finished = list(self.finished)
+        rows = {stage: row for row, (stage, _, _) in enumerate(STAGES)}
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': row, 'args': {'name': stage}}
+                  for stage, row in rows.items()]
+        for key, spans in finished:
+            for stage, start, duration in spans:
+                events.append({'name': f'{stage} #{key}', 'cat': stage, 'ph': 'X', 'pid': 1, 'tid': rows[stage],
+                               'ts': round(start * 1e6), 'dur': round(duration * 1e6), 'args': {'utterance': key}})
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
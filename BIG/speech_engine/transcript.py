@@ -0,0 +1,60 @@
+import threading
+
+
+class Transcript:
+    """Every line of a dictation session, kept outside the text widget.
+
+    Recognition threads append() lines, the UI picks them up with take_new() at its own pace
+    and pages older ones back in with lines(). Copy and export read from here, never from
+    the widget, which only shows a window of recent lines.
+    """
+
+    def __init__(self):
+        self._lines = []
+        self.taken = 0
+        self.partial = ''
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self._lines)
+
+    def append(self, line):
+        with self.lock:
+            self._lines.append(line)
+            self.partial = ''
+
+    def set_partial(self, text):
+        """What a streaming engine understood so far of the phrase being spoken."""
+        self.partial = text
+
+    def take_new(self):
+        """Lines appended since the last call, as (index of the first one, lines)."""
+        with self.lock:
+            start = self.taken
+            self.taken = len(self._lines)
+            return start, self._lines[start:]
+
+    def lines(self, start, stop):
+        with self.lock:
+            return self._lines[start:stop]
+
+    def text(self):
+        with self.lock:
+            return '\n'.join(self._lines)
+
+    def export(self, f, page_size=1000):
+        """Write the whole transcript to the text file f a page at a time."""
+        start = 0
+        while True:
+            page = self.lines(start, start + page_size)
+            if not page:
+                break
+            f.write('\n'.join(page) + '\n')
+            start += len(page)
+
+    def clear(self):
+        with self.lock:
+            self._lines = []
+            self.taken = 0
+            self.partial = ''
@@ -1,8 +1,35 @@
-import speech_recognition as sr
+import os
+import time
+
 import tkinter as tk
-from tkinter import scrolledtext
-import threading
-import pyperclip
+from tkinter import filedialog, scrolledtext
+
+# Cheap to import, speech_recognition and the backends load in the background once the window is up
+from speech_engine import LatencyTracer, SpeechEngine, Transcript, TranscriptStore
+
+# Phrases recognized at the same time by backends that don't stream, for Google each one is a request
+RECOGNITION_WORKERS = 4
+# A pause this long (in seconds) ends a phrase, shorter ones stay inside the sentence
+PAUSE_SECONDS = 0.6
+# New lines are drawn in one go this often, however fast they come in
+RENDER_INTERVAL_MS = 50
+# The text box only holds this many lines, older ones are paged back in from the transcript when scrolling up
+MAX_VISIBLE_LINES = 500
+PAGE_LINES = 100
+# Everything recognized in any session is archived here and can be searched
+HISTORY_PATH = os.path.join(os.path.expanduser("~"), "speech_transcripts.sqlite3")
+SEARCH_RESULTS = 50
+# SPEECH_TRACE=trace.json writes a Chrome trace of every utterance there on exit and prints latency percentiles
+TRACE_PATH = os.environ.get("SPEECH_TRACE")
+# bench_startup.py sets this to a file that gets the time the window was up, the app quits then
+STARTUP_PROBE = os.environ.get("STARTUP_PROBE")
+
+
+def clipboard():
+    # pyperclip looks for the platform's clipboard tools on import, only pay for that when copying
+    import pyperclip
+    return pyperclip
+
 
 class SpeechToTextApp:
     def __init__(self, master):
@@ -10,10 +37,27 @@ class SpeechToTextApp:
         master.title("Speech to Text Converter")
         master.geometry("600x400")
 
-        self.create_widgets()
-
         self.is_listening = False
-        self.recognizer = sr.Recognizer()
+        # Times capture, endpointing, recognition and drawing of every utterance
+        self.tracer = LatencyTracer(wait_for_render=True)
+        self.engine = SpeechEngine(self.on_result, self.on_partial, workers=RECOGNITION_WORKERS, pause=PAUSE_SECONDS,
+                                   tracer=self.tracer)
+        self.transcript = Transcript()
+        # Lines first_line..last_line-1 of the transcript are in the text box
+        self.first_line = 0
+        self.last_line = 0
+        self.following = True
+        self.paging = False
+        self.shown_partial = ""
+        # Label -> name, filled in once the engine has warmed up
+        self.backend_names = None
+        self.store = TranscriptStore(HISTORY_PATH)
+        self.session = self.store.new_session()
+
+        self.create_widgets()
+        self.render()
+        master.protocol("WM_DELETE_WINDOW", self.close)
+        master.after_idle(self.engine.warm_up)
 
     def create_widgets(self):
         # Control frame
@@ -29,9 +73,32 @@ class SpeechToTextApp:
         self.clear_button = tk.Button(control_frame, text="Clear All", command=self.clear_text)
         self.clear_button.pack(side=tk.LEFT, padx=5)
 
+        self.export_button = tk.Button(control_frame, text="Export", command=self.export_text)
+        self.export_button.pack(side=tk.LEFT, padx=5)
+
+        # Speech engine, can be switched between two listening sessions
+        self.backend_label = tk.StringVar(value="Loading...")
+        self.backend_menu = tk.OptionMenu(control_frame, self.backend_label, "Loading...")
+        self.backend_menu.config(state=tk.DISABLED)
+        self.backend_menu.pack(side=tk.LEFT, padx=5)
+
+        # Search through the history of all sessions
+        search_frame = tk.Frame(self.master)
+        search_frame.pack(padx=10, fill=tk.X)
+        self.search_query = tk.StringVar()
+        search_entry = tk.Entry(search_frame, textvariable=self.search_query)
+        search_entry.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        search_entry.bind("<Return>", lambda event: self.search_history())
+        tk.Button(search_frame, text="Search History", command=self.search_history).pack(side=tk.LEFT, padx=5)
+        tk.Button(search_frame, text="Export History", command=self.export_history).pack(side=tk.LEFT)
+
         # Scrolled text widget
         self.text_output = scrolledtext.ScrolledText(self.master, wrap=tk.WORD, width=70, height=20)
         self.text_output.pack(padx=10, pady=10, expand=True, fill=tk.BOTH)
+        self.text_output.config(yscrollcommand=self.on_scroll)
+        # Partial results of a streaming engine live between this mark and the end
+        self.text_output.mark_set("partial", tk.END)
+        self.text_output.mark_gravity("partial", tk.LEFT)
 
         # Right-click menu
         self.create_right_click_menu()
@@ -54,62 +121,229 @@ class SpeechToTextApp:
             self.stop_listening()
 
     def start_listening(self):
+        # Only waits when the button is pressed before the engine finished warming up
+        self.engine.wait_ready()
+        if self.backend_names is None:
+            self.show_backends()
+        import speech_recognition as sr
+        try:
+            self.engine.start(self.backend_names.get(self.backend_label.get()))
+        except sr.RequestError as e:
+            self.append_text(f"Can't use {self.backend_label.get()}: {e}")
+            return
         self.is_listening = True
         self.listen_button.config(text="Stop Listening")
-        self.append_text("Listening... Speak now!\n")
-        threading.Thread(target=self.speech_to_text, daemon=True).start()
+        self.backend_menu.config(state=tk.DISABLED)
+        self.append_text("Listening... Speak now!")
 
     def stop_listening(self):
         self.is_listening = False
         self.listen_button.config(text="Start Listening")
+        self.backend_menu.config(state=tk.NORMAL)
+        # Phrases that were already captured still show up
+        self.engine.stop()
 
-    def speech_to_text(self):
-        with sr.Microphone() as source:
-            self.recognizer.adjust_for_ambient_noise(source)
-            while self.is_listening:
-                try:
-                    audio = self.recognizer.listen(source, timeout=1, phrase_time_limit=5)
-                    text = self.recognizer.recognize_google(audio)
-                    self.master.after(0, self.append_text, f"You said: {text}\n")
-                except sr.WaitTimeoutError:
-                    continue
-                except sr.UnknownValueError:
-                    self.master.after(0, self.append_text, "Sorry, I couldn't understand what you said.\n")
-                except sr.RequestError as e:
-                    self.master.after(0, self.append_text, f"Could not request results; {e}\n")
+    def show_backends(self):
+        menu = self.backend_menu["menu"]
+        menu.delete(0, tk.END)
+        self.backend_names = {}
+        for name, label in self.engine.available_backends():
+            self.backend_names[label] = name
+            menu.add_command(label=label, command=tk._setit(self.backend_label, label))
+            if name == self.engine.backend_name:
+                self.backend_label.set(label)
+        if not self.is_listening:
+            self.backend_menu.config(state=tk.NORMAL)
+
+    def on_partial(self, text):
+        self.transcript.set_partial(text)
+
+    def on_result(self, text, error, confidence=None):
+        # Called from the worker threads in the order the phrases were spoken, render() draws it
+        import speech_recognition as sr
+        if error is None:
+            self.append_text(f"You said: {text}")
+            try:
+                self.store.add(self.session, text, confidence)
+            except RuntimeError as e:
+                self.append_text(f"Could not save it to the history; {e}")
+        elif isinstance(error, sr.UnknownValueError):
+            self.append_text("Sorry, I couldn't understand what you said.")
+        elif isinstance(error, sr.RequestError):
+            self.append_text(f"Could not request results; {error}")
+        else:
+            self.append_text(f"Speech recognition failed; {error}")
 
     def append_text(self, message):
-        self.text_output.insert(tk.END, message)
-        self.text_output.see(tk.END)
+        self.transcript.append(message)
+
+    def render(self):
+        """Draws whatever came in since the last frame with a single insert."""
+        if self.backend_names is None and self.engine.ready.is_set():
+            self.show_backends()
+        start, lines = self.transcript.take_new()
+        if lines and self.following and start == self.last_line:
+            self.insert_lines(lines)
+            self.trim_top()
+        if lines:
+            self.tracer.rendered()
+        partial = self.transcript.partial if self.following else ""
+        if lines and self.following or partial != self.shown_partial:
+            self.text_output.delete("partial", tk.END)
+            if partial:
+                self.text_output.insert(tk.END, f"... {partial}")
+            self.shown_partial = partial
+            self.text_output.see(tk.END)
+        self.master.after(RENDER_INTERVAL_MS, self.render)
+
+    def insert_lines(self, lines):
+        self.text_output.delete("partial", tk.END)
+        self.text_output.insert("partial", "".join(line + "\n" for line in lines))
+        self.text_output.mark_set("partial", "end-1c")
+        self.shown_partial = ""
+        self.last_line += len(lines)
+
+    def trim_top(self):
+        extra = self.last_line - self.first_line - MAX_VISIBLE_LINES
+        if extra > 0:
+            self.text_output.delete("1.0", f"{extra + 1}.0")
+            self.first_line += extra
+
+    def trim_bottom(self):
+        extra = self.last_line - self.first_line - MAX_VISIBLE_LINES
+        if extra > 0:
+            keep = self.last_line - self.first_line - extra
+            self.text_output.delete(f"{keep + 1}.0", tk.END)
+            self.text_output.mark_set("partial", "end-1c")
+            self.last_line -= extra
+            self.shown_partial = ""
+
+    def on_scroll(self, first, last):
+        self.text_output.vbar.set(first, last)
+        if self.paging:
+            return
+        if float(first) <= 0.0 and self.first_line > 0:
+            self.paging = True
+            self.master.after_idle(self.page_up)
+        elif float(last) >= 1.0:
+            if self.last_line < len(self.transcript):
+                self.paging = True
+                self.master.after_idle(self.page_down)
+            else:
+                self.following = True
+        else:
+            self.following = False
+
+    def page_up(self):
+        self.paging = False
+        count = min(PAGE_LINES, self.first_line)
+        if count == 0:
+            return
+        lines = self.transcript.lines(self.first_line - count, self.first_line)
+        self.text_output.insert("1.0", "".join(line + "\n" for line in lines))
+        self.first_line -= count
+        self.following = False
+        self.trim_bottom()
+        # Stay on the line that was at the top before
+        self.text_output.yview(f"{count + 1}.0")
+
+    def page_down(self):
+        self.paging = False
+        lines = self.transcript.lines(self.last_line, self.last_line + PAGE_LINES)
+        if not lines:
+            return
+        top = int(self.text_output.index("@0,0").split(".")[0])
+        self.insert_lines(lines)
+        before = self.first_line
+        self.trim_top()
+        self.text_output.yview(f"{max(1, top - (self.first_line - before))}.0")
 
     def copy_text(self):
-        text = self.text_output.get("1.0", tk.END).strip()
-        pyperclip.copy(text)
+        clipboard().copy(self.transcript.text())
+
+    def export_text(self):
+        path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")])
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                self.transcript.export(f)
+
+    def search_history(self, before_id=None, results_list=None):
+        query = self.search_query.get()
+        results = self.store.search(query, SEARCH_RESULTS, before_id)
+        if results_list is None:
+            window = tk.Toplevel(self.master)
+            window.title(f"History: {query}")
+            results_list = tk.Listbox(window, width=90, height=20)
+            results_list.pack(padx=10, pady=10, expand=True, fill=tk.BOTH)
+            more_button = tk.Button(window, text="Older Results")
+            more_button.pack(pady=(0, 10))
+            results_list.more_button = more_button
+        for _, _, timestamp, text, _ in results:
+            results_list.insert(tk.END, f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))}  {text}")
+        if len(results) == SEARCH_RESULTS:
+            results_list.more_button.config(
+                state=tk.NORMAL, command=lambda: self.search_history(results[-1][0], results_list))
+        else:
+            results_list.more_button.config(state=tk.DISABLED)
+
+    def export_history(self):
+        path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")])
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                self.store.export(f)
 
     def clear_text(self):
+        self.transcript.clear()
         self.text_output.delete("1.0", tk.END)
+        self.text_output.mark_set("partial", "end-1c")
+        self.first_line = self.last_line = 0
+        self.following = True
+        self.shown_partial = ""
 
     def copy_selected(self):
         try:
             selected_text = self.text_output.get(tk.SEL_FIRST, tk.SEL_LAST)
-            pyperclip.copy(selected_text)
+            clipboard().copy(selected_text)
         except tk.TclError:
             pass  # No text selected
 
     def paste_text(self):
         try:
-            self.text_output.insert(tk.INSERT, pyperclip.paste())
+            self.text_output.insert(tk.INSERT, clipboard().paste())
         except:
             pass
 
     def cut_selected(self):
         try:
             selected_text = self.text_output.get(tk.SEL_FIRST, tk.SEL_LAST)
-            pyperclip.copy(selected_text)
+            clipboard().copy(selected_text)
             self.text_output.delete(tk.SEL_FIRST, tk.SEL_LAST)
         except tk.TclError:
             pass  # No text selected
 
-root = tk.Tk()
-app = SpeechToTextApp(root)
-root.mainloop()
\ No newline at end of file
+    def close(self):
+        self.engine.stop()
+        # Writes what is still queued
+        self.store.close()
+        if TRACE_PATH:
+            with open(TRACE_PATH, "w") as f:
+                self.tracer.dump(f)
+            print(self.tracer.report())
+        self.master.destroy()
+
+def report_startup(app):
+    with open(STARTUP_PROBE, "w") as f:
+        f.write(repr(time.time()))
+    app.close()
+
+
+def main():
+    root = tk.Tk()
+    app = SpeechToTextApp(root)
+    if STARTUP_PROBE:
+        root.after_idle(report_startup, app)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,38 +1,100 @@
 # -*- mode: python ; coding: utf-8 -*-
+# pyinstaller speech_to_text_app.spec                  -> dist/speech_to_text_app, one file
+# pyinstaller speech_to_text_app.spec -- --fast-start  -> dist/speech_to_text_app_fast/, one folder that starts
+#     without unpacking anything, no UPX, and only the speech_recognition files the app uses
+import argparse
+import os
+import platform
+import sys
 
+parser = argparse.ArgumentParser()
+parser.add_argument('--fast-start', action='store_true')
+options = parser.parse_args()
+
+sys.path.insert(0, SPECPATH)
+from speech_engine.backends import DEFAULT_VOSK_MODEL
+
+if options.fast_start:
+    datas = []
+    # Bundled in the app when there is one, see speech_engine.backends
+    if os.path.isdir(DEFAULT_VOSK_MODEL):
+        datas.append((DEFAULT_VOSK_MODEL, os.path.join('models', os.path.basename(DEFAULT_VOSK_MODEL))))
+else:
+    datas = [('C:\\Users\\sacha\\PycharmProjects\\BIG\\venv\\Lib\\site-packages\\speech_recognition', 'speech_recognition')]
 
 a = Analysis(
     ['speech_to_text_app.py'],
     pathex=[],
     binaries=[],
-    datas=[('C:\\Users\\sacha\\PycharmProjects\\BIG\\venv\\Lib\\site-packages\\speech_recognition', 'speech_recognition')],
-    hiddenimports=[],
+    datas=datas,
+    # speech_engine loads these by name on first use
+    hiddenimports=['speech_engine.engine', 'speech_engine.store', 'speech_engine.trace', 'speech_engine.transcript'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Optional imports of pyperclip, numpy and speech_recognition would drag in GUI toolkits and dev tools
+    excludes=['PyQt5', 'PyQt6', 'PySide2', 'PySide6', 'PIL', 'IPython', 'jedi', 'yaml', 'matplotlib', 'scipy',
+              'pandas'] if options.fast_start else [],
     noarchive=False,
     optimize=0,
 )
+
+if options.fast_start:
+    # The Google backend only needs the FLAC encoder of this platform (when there is no flac on the PATH),
+    # not the 38 MB of pocketsphinx models or the encoders of the other platforms
+    flac = {'Windows': 'flac-win32.exe', 'Darwin': 'flac-mac'}.get(
+        platform.system(), 'flac-linux-x86_64' if platform.machine() in ('x86_64', 'AMD64') else 'flac-linux-x86')
+    def used(entry):
+        return not entry[0].startswith('speech_recognition') or os.path.basename(entry[0]) in (flac, 'version.txt')
+    a.datas = [entry for entry in a.datas if used(entry)]
+    a.binaries = [entry for entry in a.binaries if used(entry)]
+
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
-    name='speech_to_text_app',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=False,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
+if options.fast_start:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='speech_to_text_app',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        name='speech_to_text_app_fast',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name='speech_to_text_app',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
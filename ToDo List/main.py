@@ -1,37 +1,103 @@
-tasks = []
+import os
+from datetime import date
+from itertools import islice
+
+from query import DEFAULT_PRIORITY, PRIORITIES, TaskList
+from storage import TaskStore
+
+# Where the tasks are kept between runs
+DATA_DIR = os.environ.get("TODO_DATA", os.path.join(os.path.expanduser("~"), ".todo_list"))
+PAGE_SIZE = 20
+
+tasks = None
+
+
+def formatTask(taskId, task):
+    line = f"Task #{taskId}. {task.text}"
+    if task.priority != DEFAULT_PRIORITY:
+        line += f"  (priority {task.priority})"
+    if task.due is not None:
+        line += f"  due {task.due.isoformat()}"
+    if task.tags:
+        line += "  " + " ".join(f"#{tag}" for tag in task.tags)
+    return line
+
+
+def showPages(results, title, empty="There are no tasks currently."):
+    """Prints PAGE_SIZE tasks at a time with one print each, only reading as many results as are shown."""
+    shown = 0
+    try:
+        while True:
+            page = [formatTask(taskId, task) for taskId, task in islice(results, PAGE_SIZE)]
+            if not page:
+                break
+            if not shown:
+                print(title)
+            shown += len(page)
+            print("\n".join(page))
+            if len(page) < PAGE_SIZE or input(f"-- {shown} shown, Enter for more, q to stop: ").lower() == "q":
+                break
+    finally:
+        results.close()
+    if not shown:
+        print(empty)
 
 
 def addTask():
     task = input("Please enter a task: ")
-    tasks.append(task)
-    print(f"Task '{task}' added to the list.")
+    try:
+        priority = input(f"Priority {PRIORITIES[0]} (most urgent) to {PRIORITIES[-1]} [{DEFAULT_PRIORITY}]: ")
+        priority = int(priority) if priority else DEFAULT_PRIORITY
+        due = input("Due date YYYY-MM-DD [none]: ")
+        due = date.fromisoformat(due) if due else None
+        tags = input("Tags, separated by commas [none]: ").split(",")
+        taskId = tasks.add(task, priority, due, tags)
+    except ValueError as e:
+        print(f"Invalid input: {e}")
+        return
+    tasks.sync()
+    print(f"Task '{task}' added to the list as #{taskId}.")
 
 
 def listTasks():
-    if not tasks:
-        print("There are no tasks currently.")
-    else:
-        print("Current Tasks:")
-        for index, task in enumerate(tasks):
-            print(f"Task #{index}. {task}")
+    showPages(tasks.all(), "Current Tasks:")
+
+
+def listByPriority():
+    showPages(tasks.by_priority(), "Most urgent tasks:")
+
+
+def listDue():
+    showPages(tasks.by_due(), "Tasks by due date:", "No task has a due date.")
+
+
+def listTagged():
+    tag = input("Tag: ").lstrip("#")
+    showPages(tasks.tagged(tag), f"Tasks tagged #{tag}:", f"No task is tagged #{tag}.")
+
+
+def searchTasks():
+    text = input("Search for: ")
+    showPages(tasks.search(text), f"Tasks with '{text}':", f"No task contains '{text}'.")
 
 
 def deleteTask():
-    listTasks()
     try:
-        taskToDelete = int(input("Enter the # to delete: "))
-        if taskToDelete >= 0 and taskToDelete < len(tasks):
-            tasks.pop(taskToDelete)
-            print(f"Task {taskToDelete} has been removed.")
-        else:
-            print(f"Task #{taskToDelete} was not found.")
-    except:
+        taskToDelete = int(input("Enter the # to delete (List tasks shows the #): "))
+    except ValueError:
         print("Invalid input.")
+        return
+    if tasks.delete(taskToDelete):
+        tasks.sync()
+        print(f"Task {taskToDelete} has been removed.")
+    else:
+        print(f"Task #{taskToDelete} was not found.")
 
 
 if __name__ == "__main__":
     ### Create a loop to run the app
     print("Welcome to the to do list app :)")
+    tasks = TaskList(TaskStore(DATA_DIR))
     while True:
         print("\n")
         print("Please select one of the following options")
@@ -39,7 +105,11 @@ if __name__ == "__main__":
         print("1. Add a new task")
         print("2. Delete a task")
         print("3. List tasks")
-        print("4. Quit")
+        print("4. List by priority")
+        print("5. List by due date")
+        print("6. List by tag")
+        print("7. Search")
+        print("8. Quit")
 
         choice = input("Enter your choice: ")
 
@@ -50,8 +120,17 @@ if __name__ == "__main__":
         elif (choice == "3"):
             listTasks()
         elif (choice == "4"):
+            listByPriority()
+        elif (choice == "5"):
+            listDue()
+        elif (choice == "6"):
+            listTagged()
+        elif (choice == "7"):
+            searchTasks()
+        elif (choice == "8"):
             break
         else:
             print("Invalid input. Please try again.")
 
+    tasks.close()
     print("Goodbye 👋👋")
@@ -0,0 +1,314 @@
+"""
+Tasks with a priority, a due date and tags, indexed in memory for fast listing.
+
+    tasks = TaskList(TaskStore(DATA_DIR))
+    tasks.add("Pay rent", priority=1, due=date(2024, 5, 1), tags=("home",))
+    for task_id, task in itertools.islice(tasks.by_due(), 10):
+        ...
+
+Benchmark of the index build and the queries against scanning every task:
+
+    python query.py --benchmark --tasks 500000
+
+Every query is a generator that yields (id, Task) pairs in order and only does the work
+for the pairs that are taken, so the first page of a listing costs the same with ten
+tasks or a million:
+
+- by_priority(): a heap of (priority, id), deleted tasks are dropped when they come up
+- by_due(): a sorted list of (due date, id), kept sorted with bisect
+- tagged(tag): a set of ids per tag
+- search(text): a set of ids per word, plus a set of words per trigram, so a substring
+  only has to be looked for in the words that contain all of its trigrams
+"""
+import argparse
+import bisect
+import heapq
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+from itertools import islice
+
+from storage import TaskStore
+
+PRIORITIES = range(1, 6)
+DEFAULT_PRIORITY = 3
+WORD = re.compile(r"\w+")
+
+# priority 1 is the most urgent, tags are lower case
+Task = namedtuple("Task", "text priority due tags", defaults=(DEFAULT_PRIORITY, None, ()))
+
+
+def to_record(task):
+    """The dict the store keeps, without the defaults."""
+    record = {"text": task.text}
+    if task.priority != DEFAULT_PRIORITY:
+        record["priority"] = task.priority
+    if task.due is not None:
+        record["due"] = task.due.isoformat()
+    if task.tags:
+        record["tags"] = list(task.tags)
+    return record
+
+
+def from_record(record):
+    due = record.get("due")
+    return Task(record["text"], record.get("priority", DEFAULT_PRIORITY),
+                date.fromisoformat(due) if due else None, tuple(record.get("tags", ())))
+
+
+def words(text):
+    return set(WORD.findall(text.lower()))
+
+
+def trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+class TaskList:
+    """A TaskStore and the indexes over it. Don't change it while iterating over a query.
+
+    The priority heap and the due dates are ready right away. The tag and word indexes
+    take a few seconds per million tasks and are built in the background, tagged() and
+    search() wait for them (so do add() and delete(), which update them).
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.priority_heap = [(record.get("priority", DEFAULT_PRIORITY), task_id)
+                              for task_id, record in store.items()]
+        heapq.heapify(self.priority_heap)
+        # ISO dates sort like the dates they stand for
+        self.due_dates = sorted((record["due"], task_id) for task_id, record in store.items() if record.get("due"))
+        self.tags = defaultdict(set)
+        self.words = defaultdict(set)
+        self.word_trigrams = defaultdict(set)
+        self.text_lock = threading.Lock()
+        self.text_ready = threading.Event()
+        self.text_lock.acquire()
+        threading.Thread(target=self._index_texts, name="todo-index", daemon=True).start()
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, task_id):
+        return task_id in self.store
+
+    def get(self, task_id):
+        record = self.store.get(task_id)
+        return None if record is None else from_record(record)
+
+    def add(self, text, priority=DEFAULT_PRIORITY, due=None, tags=()):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priority must be {PRIORITIES[0]} to {PRIORITIES[-1]}")
+        tags = tuple(dict.fromkeys(tag.strip().lower() for tag in tags if tag.strip()))
+        record = to_record(Task(text, priority, due, tags))
+        with self.text_lock:
+            task_id = self.store.add(record)
+            self._index_text(task_id, record)
+        heapq.heappush(self.priority_heap, (priority, task_id))
+        if due is not None:
+            bisect.insort(self.due_dates, (record["due"], task_id))
+        return task_id
+
+    def delete(self, task_id):
+        record = self.store.get(task_id)
+        if record is None:
+            return False
+        with self.text_lock:
+            if not self.store.delete(task_id):
+                return False
+            for tag in record.get("tags", ()):
+                self._unindex(self.tags, tag, task_id)
+            for word in words(record["text"]):
+                if self._unindex(self.words, word, task_id):
+                    for gram in trigrams(word):
+                        self._unindex(self.word_trigrams, gram, word)
+        # The heap entry is skipped once it comes up
+        if record.get("due"):
+            del self.due_dates[bisect.bisect_left(self.due_dates, (record["due"], task_id))]
+        return True
+
+    def sync(self):
+        self.store.sync()
+
+    def close(self):
+        self.text_ready.wait()
+        self.store.close()
+
+    def all(self):
+        """Every task, oldest first."""
+        for task_id, record in self.store.items():
+            yield task_id, from_record(record)
+
+    def by_priority(self):
+        """Most urgent first, then oldest first."""
+        taken = []
+        try:
+            while self.priority_heap:
+                entry = heapq.heappop(self.priority_heap)
+                if entry[1] in self.store:
+                    taken.append(entry)
+                    yield entry[1], self.get(entry[1])
+        finally:
+            # Put back what was looked at, so the heap is whole again for the next query
+            for entry in taken:
+                heapq.heappush(self.priority_heap, entry)
+
+    def by_due(self, after=None):
+        """Tasks with a due date, soonest first; only those due on or after the date after."""
+        start = 0 if after is None else bisect.bisect_left(self.due_dates, (after.isoformat(),))
+        for _, task_id in islice(self.due_dates, start, None):
+            yield task_id, self.get(task_id)
+
+    def tagged(self, tag):
+        self.text_ready.wait()
+        ids = self.tags.get(tag.strip().lower(), ())
+        for task_id in sorted(ids):
+            yield task_id, self.get(task_id)
+
+    def search(self, text):
+        """Tasks containing text, case insensitive, oldest first."""
+        self.text_ready.wait()
+        text = text.lower()
+        terms = sorted(words(text), key=len, reverse=True)
+        if not terms:
+            # Nothing to look up, only punctuation or spaces
+            candidates = self.store
+        else:
+            candidates = None
+            # The longest terms first, they match the fewest tasks
+            for term in terms:
+                ids = set()
+                for word in self._words_containing(term):
+                    ids |= self.words[word]
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    return
+            candidates = sorted(candidates)
+        for task_id in candidates:
+            record = self.store.get(task_id)
+            if text in record["text"].lower():
+                yield task_id, from_record(record)
+
+    def _words_containing(self, term):
+        if len(term) < 3:
+            # There are far fewer words than tasks
+            return [word for word in self.words if term in word]
+        grams = sorted((self.word_trigrams.get(gram, set()) for gram in trigrams(term)), key=len)
+        return [word for word in grams[0].intersection(*grams[1:]) if term in word]
+
+    def _index_texts(self):
+        try:
+            tags = self.tags
+            index = self.words
+            for task_id, record in self.store.items():
+                for tag in record.get("tags", ()):
+                    tags[tag].add(task_id)
+                for word in words(record["text"]):
+                    index[word].add(task_id)
+            for word in index:
+                for gram in trigrams(word):
+                    self.word_trigrams[gram].add(word)
+        finally:
+            self.text_ready.set()
+            self.text_lock.release()
+
+    def _index_text(self, task_id, record):
+        for tag in record.get("tags", ()):
+            self.tags[tag].add(task_id)
+        for word in words(record["text"]):
+            if word not in self.words:
+                for gram in trigrams(word):
+                    self.word_trigrams[gram].add(word)
+            self.words[word].add(task_id)
+
+    @staticmethod
+    def _unindex(index, key, value):
+        """Removes value from the set at key, True when that was the last one."""
+        values = index[key]
+        values.discard(value)
+        if not values:
+            del index[key]
+            return True
+        return False
+
+
+def benchmark(count, folder):
+    rng = random.Random(0)
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 10)))
+                  for _ in range(20000)]
+    tags = [f"tag{i}" for i in range(100)]
+    today = date.today()
+
+    store = TaskStore(folder)
+    started = time.perf_counter()
+    for _ in range(count):
+        record = {"text": " ".join(rng.choices(vocabulary, k=rng.randint(3, 8))),
+                  "priority": rng.randint(1, 5), "tags": rng.sample(tags, rng.randint(0, 3))}
+        if rng.random() < 0.7:
+            record["due"] = (today + timedelta(days=rng.randint(-30, 700))).isoformat()
+        store.add(record)
+    store.close()
+    print(f"{count} tasks written in {time.perf_counter() - started:.1f}s\n")
+
+    started = time.perf_counter()
+    store = TaskStore(folder)
+    print(f"open the store:       {(time.perf_counter() - started) * 1000:6.0f} ms")
+    started = time.perf_counter()
+    tasks = TaskList(store)
+    print(f"priority, due dates:  {(time.perf_counter() - started) * 1000:6.0f} ms")
+    tasks.text_ready.wait()
+    print(f"tags, words (in the background): {(time.perf_counter() - started) * 1000:6.0f} ms "
+          f"({len(tasks.words)} words, {len(tasks.word_trigrams)} trigrams)\n")
+
+    word = vocabulary[123]
+    substring = word[1:4]
+    queries = [
+        ("first 20 by priority", lambda: tasks.by_priority(),
+         lambda: sorted((task.priority, task_id, task) for task_id, task in tasks.all())),
+        ("next 20 due", lambda: tasks.by_due(today),
+         lambda: sorted((task.due, task_id) for task_id, task in tasks.all() if task.due and task.due >= today)),
+        ("first 20 tagged", lambda: tasks.tagged("tag7"),
+         lambda: [task_id for task_id, task in tasks.all() if "tag7" in task.tags]),
+        (f"first 20 with '{word}'", lambda: tasks.search(word),
+         lambda: [task_id for task_id, task in tasks.all() if word in task.text.lower()]),
+        (f"first 20 with '{substring}'", lambda: tasks.search(substring),
+         lambda: [task_id for task_id, task in tasks.all() if substring in task.text.lower()]),
+    ]
+    print(f"{'query':32} {'index ms':>9} {'scan ms':>9}")
+    for label, indexed, scan in queries:
+        started = time.perf_counter()
+        query = indexed()
+        page = list(islice(query, 20))
+        query.close()
+        index_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        scan()
+        scan_ms = (time.perf_counter() - started) * 1000
+        print(f"{label:32} {index_ms:9.2f} {scan_ms:9.0f}   ({len(page)} results)")
+
+    started = time.perf_counter()
+    for task_id in random.Random(1).sample(range(1, count + 1), 1000):
+        tasks.delete(task_id)
+    print(f"\ndelete: {(time.perf_counter() - started):.3f} ms each")
+    tasks.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the task indexes.")
+    parser.add_argument("--benchmark", action="store_true", required=True)
+    parser.add_argument("--tasks", type=int, default=500000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        benchmark(args.tasks, folder)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+"""
+Durable task storage: an append-only log of adds and deletes, compacted into snapshots.
+
+    store = TaskStore(os.path.expanduser("~/.todo_list"))
+    task_id = store.add({"text": "Buy milk"})
+    store.delete(task_id)
+    store.close()
+
+Benchmark of adds per second and cold start (open of the store) at 1M tasks:
+
+    python storage.py --benchmark --tasks 1000000
+
+Every change is one JSON line in log.<n>. Lines are written right away but fsynced in
+batches, every sync_interval seconds by a background thread or when sync() is called,
+so a crash loses at most the last sync_interval of changes that nobody sync()ed. Once the
+log has as many entries as there are tasks, a background thread writes the current tasks
+to snapshot.json and starts the next log file; opening the store loads the snapshot and
+replays only the logs written after it.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+SNAPSHOT = "snapshot.json"
+LOG_NAME = re.compile(r"log\.(\d+)$")
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _fsync_folder(path):
+    if os.name == "nt":
+        # Windows can't open folders, renames there are durable once the file is
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class TaskStore:
+    """Tasks (JSON serializable dicts) by stable id, in the order they were added.
+
+    ids count up from 1 and are never reused, delete() is O(1). Safe to use from several
+    threads.
+    """
+
+    def __init__(self, path, sync_interval=0.05, auto_compact=True, compact_min=10000):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.auto_compact = auto_compact
+        self.compact_min = compact_min
+        self.tasks = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+        # One fsync at a time, who waits for it finds their changes synced by the one before
+        self.sync_lock = threading.Lock()
+        self.written = 0
+        self.synced = 0
+        self.syncs = 0
+        self.log_entries = 0
+        self.compactor = None
+        self.compaction_error = None
+        self.closed = threading.Event()
+        os.makedirs(path, exist_ok=True)
+        self.generation = self._load()
+        self.log = open(self._log_path(self.generation), "ab")
+        self.syncer = threading.Thread(target=self._sync_loop, name="todo-sync", daemon=True)
+        self.syncer.start()
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __contains__(self, task_id):
+        return task_id in self.tasks
+
+    def __iter__(self):
+        return iter(self.tasks)
+
+    def get(self, task_id, default=None):
+        return self.tasks.get(task_id, default)
+
+    def items(self):
+        """(id, task) pairs, oldest first. Don't change the store while iterating."""
+        return self.tasks.items()
+
+    def add(self, task):
+        """Stores task, returns its id. Durable after the next sync."""
+        with self.lock:
+            task_id = self.next_id
+            self.next_id += 1
+            self._append(_encode(["add", task_id, task]))
+            self.tasks[task_id] = task
+            self._maybe_compact()
+        return task_id
+
+    def delete(self, task_id):
+        """Removes a task, False when there is no task with that id."""
+        with self.lock:
+            if task_id not in self.tasks:
+                return False
+            self._append(_encode(["delete", task_id]))
+            del self.tasks[task_id]
+            self._maybe_compact()
+        return True
+
+    def sync(self):
+        """Waits until every change made so far is on disk."""
+        with self.sync_lock:
+            with self.lock:
+                target = self.written
+                if self.synced >= target:
+                    return
+                self.log.flush()
+                # A duplicate, so adds can go on and compaction can switch to the next log meanwhile
+                fd = os.dup(self.log.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            with self.lock:
+                self.syncs += 1
+                self.synced = max(self.synced, target)
+
+    def compact(self, wait=True):
+        """Writes a snapshot and starts a new log; in the background unless wait."""
+        with self.lock:
+            compactor = self._start_compaction()
+        if wait and compactor is not None:
+            compactor.join()
+            if self.compaction_error is not None:
+                raise self.compaction_error
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.syncer.join()
+        if self.compactor is not None:
+            self.compactor.join()
+        self.sync()
+        self.log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _log_path(self, generation):
+        return os.path.join(self.path, f"log.{generation}")
+
+    def _append(self, line):
+        self.log.write(line.encode() + b"\n")
+        self.written += 1
+        self.log_entries += 1
+
+    def _sync_loop(self):
+        while not self.closed.wait(self.sync_interval):
+            try:
+                self.sync()
+            except OSError as e:
+                # Keep the changes in memory, the next sync() tries again
+                print(f"Could not save tasks: {e}", file=sys.stderr)
+
+    def _maybe_compact(self):
+        # Compacting once the log is as long as the snapshot keeps both the log and the
+        # time spent writing snapshots proportional to the number of tasks
+        if self.auto_compact and self.log_entries >= max(self.compact_min, len(self.tasks)):
+            self._start_compaction()
+
+    def _start_compaction(self):
+        """Called with self.lock held."""
+        if self.compactor is not None and self.compactor.is_alive():
+            return self.compactor
+        # Everything up to here goes in the snapshot, everything after it in the next log
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.synced = self.written
+        self.log.close()
+        self.generation += 1
+        self.log = open(self._log_path(self.generation), "ab")
+        self.log_entries = 0
+        # Tasks aren't changed once added, so a shallow copy is a consistent snapshot
+        tasks = dict(self.tasks)
+        self.compaction_error = None
+        self.compactor = threading.Thread(target=self._write_snapshot, args=(tasks, self.next_id, self.generation),
+                                          name="todo-compact", daemon=True)
+        self.compactor.start()
+        return self.compactor
+
+    def _write_snapshot(self, tasks, next_id, generation):
+        try:
+            # By column, a million small dicts are much slower to load than a few long lists
+            fields = {}
+            for task in tasks.values():
+                for name in task:
+                    fields.setdefault(name, None)
+            snapshot = {
+                "version": 1,
+                "next_id": next_id,
+                "log": generation,
+                "ids": list(tasks),
+                "fields": {name: [task.get(name) for task in tasks.values()] for name in fields},
+            }
+            temporary = os.path.join(self.path, SNAPSHOT + ".tmp")
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(_encode(snapshot))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, os.path.join(self.path, SNAPSHOT))
+            _fsync_folder(self.path)
+            for old in self._log_generations():
+                if old < generation:
+                    os.remove(self._log_path(old))
+        except Exception as e:
+            # The logs are all still there, nothing is lost
+            self.compaction_error = e
+            print(f"Could not compact the task log: {e}", file=sys.stderr)
+
+    def _log_generations(self):
+        return sorted(int(match.group(1)) for match in map(LOG_NAME.match, os.listdir(self.path)) if match)
+
+    def _load(self):
+        """Loads the snapshot and replays the logs after it, returns the generation to append to."""
+        generation = 0
+        try:
+            with open(os.path.join(self.path, SNAPSHOT), encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            pass
+        else:
+            generation = snapshot["log"]
+            self.next_id = snapshot["next_id"]
+            tasks = [{} for _ in snapshot["ids"]]
+            # Column by column, a lot faster than a dict per row
+            for name, column in snapshot["fields"].items():
+                for task, value in zip(tasks, column):
+                    if value is not None:
+                        task[name] = value
+            self.tasks = dict(zip(snapshot["ids"], tasks))
+        for log in self._log_generations():
+            if log >= generation:
+                self._replay(self._log_path(log))
+                generation = log
+        return generation
+
+    def _replay(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        # Only whole lines were written completely, a crash can leave half of the last one
+        end = data.rfind(b"\n") + 1
+        try:
+            entries = json.loads(b"[" + data[:end - 1].replace(b"\n", b",") + b"]") if end else []
+        except ValueError:
+            entries, end = self._replay_lines(data[:end])
+        if end < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        tasks = self.tasks
+        for entry in entries:
+            if entry[0] == "add":
+                tasks[entry[1]] = entry[2]
+                self.next_id = max(self.next_id, entry[1] + 1)
+            else:
+                tasks.pop(entry[1], None)
+        self.log_entries += len(entries)
+
+    @staticmethod
+    def _replay_lines(data):
+        """Entries up to the first damaged line and where that line starts."""
+        entries = []
+        end = 0
+        for line in data.splitlines(keepends=True):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+            end += len(line)
+        return entries, end
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def benchmark(count, folder):
+    def timed_open(**options):
+        started = time.perf_counter()
+        store = TaskStore(folder, **options)
+        seconds = time.perf_counter() - started
+        if len(store) != count:
+            raise RuntimeError(f"Expected {count} tasks, loaded {len(store)}")
+        return store, seconds
+
+    def add_all(store):
+        started = time.perf_counter()
+        for i in range(count):
+            store.add({"text": f"Task number {i}, buy some milk on the way home"})
+        store.sync()
+        return time.perf_counter() - started
+
+    print(f"{count} tasks in {folder}\n")
+    store = TaskStore(folder, auto_compact=False)
+    seconds = add_all(store)
+    print(f"add, log only:          {count / seconds:10.0f}/s  ({store.syncs} fsyncs)")
+    store.close()
+    store, seconds = timed_open(auto_compact=False)
+    print(f"open, replay the log:   {seconds * 1000:10.0f} ms  ({folder_size(folder) / 2 ** 20:.0f} MB)")
+    started = time.perf_counter()
+    store.compact()
+    print(f"compact:                {(time.perf_counter() - started) * 1000:10.0f} ms")
+    store.close()
+    store, seconds = timed_open()
+    print(f"open, snapshot:         {seconds * 1000:10.0f} ms  ({folder_size(folder) / 2 ** 20:.0f} MB)")
+    store.close()
+    shutil.rmtree(folder)
+
+    store = TaskStore(folder)
+    seconds = add_all(store)
+    print(f"add, compacting:        {count / seconds:10.0f}/s  ({store.syncs} fsyncs)")
+    ids = random.Random(0).sample(range(1, count + 1), count // 10)
+    started = time.perf_counter()
+    for task_id in ids:
+        store.delete(task_id)
+    store.sync()
+    print(f"delete:                 {len(ids) / (time.perf_counter() - started):10.0f}/s")
+    for task_id in ids:
+        store.add({"text": f"Task {task_id} again"})
+    store.close()
+    store, seconds = timed_open()
+    print(f"open, snapshot + tail:  {seconds * 1000:10.0f} ms  ({folder_size(folder) / 2 ** 20:.0f} MB)")
+    store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the task store.")
+    parser.add_argument("--benchmark", action="store_true", required=True)
+    parser.add_argument("--tasks", type=int, default=1000000)
+    parser.add_argument("--dir", help="where to put the store, a temporary folder by default")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as folder:
+        benchmark(args.tasks, os.path.join(folder, "tasks"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
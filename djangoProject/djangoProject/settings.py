@@ -10,11 +10,16 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# The image downloader and speech engines and Index.html live next to the desktop apps in BIG/
+BIG_DIR = BASE_DIR.parent / 'BIG'
+sys.path.append(str(BIG_DIR))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
@@ -37,6 +42,11 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'downloads',
+    'transcription',
+    'todo',
+    'gallery',
+    'monitoring',
 ]
 
 MIDDLEWARE = [
@@ -54,7 +64,7 @@ ROOT_URLCONF = 'djangoProject.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [BASE_DIR / 'templates']
+        'DIRS': [BASE_DIR / 'templates', BIG_DIR]
         ,
         'APP_DIRS': True,
         'OPTIONS': {
@@ -78,6 +88,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Crawl workers and the web server write to the same file, wait for the lock instead of failing.
+        # Transactions take the write lock when they start: one that reads and then writes can't wait
+        # for a lock another writer holds, SQLite fails it right away. Django 5.1+ (requirements.txt)
+        'OPTIONS': {'timeout': 20, 'transaction_mode': 'IMMEDIATE'},
     }
 }
 
@@ -122,3 +136,74 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Image downloader
+# Crawl jobs are queued in the database and run by `python manage.py crawl_worker`, which runs
+# DOWNLOAD_WORKERS jobs at once by default and saves under DOWNLOAD_ROOT
+
+DOWNLOAD_ROOT = BASE_DIR / 'downloaded_images'
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_MAX_IMAGES = 1000
+DOWNLOAD_POLL_INTERVAL = 0.5
+# Repeated searches (same query and filters) are served from stored files for this long
+DOWNLOAD_CACHE_TTL = 24 * 3600
+DOWNLOAD_CACHE_MAX_BYTES = 2 * 2 ** 30
+
+
+# Streaming transcription
+# WebSocket clients at ws://host/ws/transcribe/ (served with an ASGI server, e.g.
+# `uvicorn djangoProject.asgi:application`) share TRANSCRIBE_VAD_WORKERS threads cutting
+# their audio into phrases and TRANSCRIBE_WORKERS threads recognizing them
+
+TRANSCRIBE_BACKEND = 'google'
+TRANSCRIBE_BACKEND_OPTIONS = {}
+TRANSCRIBE_WORKERS = 16
+TRANSCRIBE_VAD_WORKERS = 4
+TRANSCRIBE_PAUSE = 0.6
+# Per connection: audio messages waiting to be processed before the socket stops being read,
+# and phrases being recognized at once before the audio stops being processed
+TRANSCRIBE_MAX_BUFFERED_FRAMES = 64
+TRANSCRIBE_MAX_PENDING_PHRASES = 4
+
+
+# ToDo REST API at /api/tasks
+# Pages are at most TODO_MAX_PAGE_SIZE tasks, bulk create and delete at most TODO_MAX_BULK
+
+TODO_PAGE_SIZE = 50
+TODO_MAX_PAGE_SIZE = 500
+TODO_MAX_BULK = 1000
+
+
+# Image gallery at /api/gallery, serving the images under GALLERY_ROOT (DOWNLOAD_ROOT to browse
+# what the crawl workers saved). Thumbnails are made on first request, kept in
+# GALLERY_THUMBNAIL_DIR and up to GALLERY_THUMBNAIL_MEMORY_BYTES of them in each process' memory
+
+GALLERY_ROOT = BIG_DIR / 'downloaded_images'
+GALLERY_THUMBNAIL_DIR = BASE_DIR / '.gallery_thumbnails'
+# The listing links to GALLERY_THUMBNAIL_SIZE, the others are there for other layouts
+GALLERY_THUMBNAIL_SIZE = 256
+GALLERY_THUMBNAIL_SIZES = (128, 256, 512)
+GALLERY_THUMBNAIL_MEMORY_BYTES = 64 * 2 ** 20
+GALLERY_PAGE_SIZE = 100
+GALLERY_MAX_PAGE_SIZE = 1000
+
+
+# Request metrics at /metrics, off (and not routed) unless METRICS_ENABLED
+# MetricsMiddleware records each request's time, SQL queries, cache lookups and response size.
+# /metrics answers requests from METRICS_ALLOWED_IPS (behind a proxy: the proxy's address) and
+# ones with "Authorization: Bearer <METRICS_TOKEN>" when a token is set.
+# METRICS_PROFILE_SAMPLE_RATE of the requests are profiled, the ones slower than
+# METRICS_PROFILE_SLOW_SECONDS are saved in METRICS_PROFILE_DIR. A profiled request takes a few
+# times as long, so a rate costs about rate * (that factor - 1): bench_metrics measures the factor.
+
+METRICS_ENABLED = False
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_TOKEN = ''
+METRICS_PROFILE_SAMPLE_RATE = 0
+METRICS_PROFILE_SLOW_SECONDS = 0.5
+METRICS_PROFILE_DIR = BASE_DIR / 'profiles'
+
+if METRICS_ENABLED:
+    # Last, so it times the view and not the other middleware
+    MIDDLEWARE.append('monitoring.middleware.MetricsMiddleware')
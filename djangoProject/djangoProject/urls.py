@@ -14,9 +14,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('', include('downloads.urls')),
+    path('', include('todo.urls')),
+    path('', include('gallery.urls')),
 ]
+
+if settings.METRICS_ENABLED:
+    urlpatterns.append(path('', include('monitoring.urls')))
@@ -0,0 +1,10 @@
+from django.contrib import admin
+
+from .models import CrawlJob
+
+
+@admin.register(CrawlJob)
+class CrawlJobAdmin(admin.ModelAdmin):
+    list_display = ('query', 'status', 'priority', 'images', 'attempts', 'worker', 'created')
+    list_filter = ('status',)
+    search_fields = ('query',)
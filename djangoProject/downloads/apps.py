@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    # WAL lets the web server read while crawl workers write
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+
+
+class DownloadsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'downloads'
+
+    def ready(self):
+        connection_created.connect(configure_sqlite)
@@ -0,0 +1,112 @@
+"""
+Crawl job queue stored in the project's database.
+
+Requests only insert a CrawlJob and return its id. `python manage.py crawl_worker` processes
+(as many as you like) claim queued jobs, run them and heartbeat while they do, so jobs survive
+server restarts and a worker that dies has its jobs put back in the queue.
+"""
+import asyncio
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from image_downloader import query_dir_name
+
+from .models import CrawlJob
+
+
+def download_dir(query):
+    """Where query's images go, ValueError if that is not inside DOWNLOAD_ROOT (e.g. through a symlink)."""
+    root = os.path.realpath(settings.DOWNLOAD_ROOT)
+    path = os.path.join(root, query_dir_name(query))
+    if os.path.dirname(os.path.realpath(path)) != root:
+        raise ValueError('query does not make a folder inside the download root')
+    return path
+
+
+def enqueue(query, num_images, filters, priority=0):
+    return CrawlJob.objects.create(query=query, num_images=num_images, filters=filters, priority=priority)
+
+
+def update(job_id, **changes):
+    CrawlJob.objects.filter(pk=job_id).update(version=F('version') + 1, **changes)
+
+
+def report(job_id, claimed_by, **changes):
+    """update() only while worker claimed_by still runs the job, False once it was requeued or claimed again."""
+    return bool(CrawlJob.objects.filter(pk=job_id, worker=claimed_by, status=CrawlJob.RUNNING).update(
+        version=F('version') + 1, **changes))
+
+
+def claimable():
+    running = CrawlJob.objects.filter(status=CrawlJob.RUNNING).values('query')
+    return CrawlJob.objects.filter(status=CrawlJob.QUEUED).exclude(query__in=running)
+
+
+def claim(worker, limit=1):
+    """Atomically take up to limit queued jobs for worker, highest priority and oldest first.
+
+    SQLite has no SELECT ... FOR UPDATE SKIP LOCKED, so this picks candidates and then claims
+    each one with a conditional UPDATE; when another worker got there first the UPDATE
+    matches no row and the next candidate is tried. Jobs of a query that is running already
+    wait: they would download into the same folder, and a fresh start removes it. started is
+    only set by the first claim, so a job claimed again has started before its heartbeat.
+    """
+    claimed = []
+    while len(claimed) < limit:
+        candidates = list(claimable().order_by('-priority', 'created')
+                          .values_list('pk', flat=True)[:limit - len(claimed)])
+        if not candidates:
+            break
+        now = timezone.now()
+        for pk in candidates:
+            # Checked again in the UPDATE, the query may have started since (even in this loop)
+            won = claimable().filter(pk=pk).update(
+                status=CrawlJob.RUNNING, worker=worker, heartbeat=now, started=Coalesce('started', Value(now)),
+                attempts=F('attempts') + 1, version=F('version') + 1)
+            if won:
+                claimed.append(pk)
+    return list(CrawlJob.objects.filter(pk__in=claimed).order_by('-priority', 'created'))
+
+
+def heartbeat(worker, job_ids):
+    """Mark worker's jobs as alive, returns the ids of those that were asked to cancel."""
+    jobs = CrawlJob.objects.filter(pk__in=job_ids, worker=worker, status=CrawlJob.RUNNING)
+    jobs.update(heartbeat=timezone.now())
+    return set(jobs.filter(cancel_requested=True).values_list('pk', flat=True))
+
+
+def requeue_stalled(stall_timeout, max_attempts):
+    """Put running jobs whose worker stopped heartbeating back in the queue (or fail them)."""
+    cutoff = timezone.now() - timedelta(seconds=stall_timeout)
+    stalled = CrawlJob.objects.filter(status=CrawlJob.RUNNING, heartbeat__lt=cutoff)
+    failed = stalled.filter(attempts__gte=max_attempts).update(
+        status=CrawlJob.FAILED, error='worker stopped responding', finished=timezone.now(),
+        version=F('version') + 1)
+    requeued = stalled.filter(attempts__lt=max_attempts).update(
+        status=CrawlJob.QUEUED, worker='', heartbeat=None, version=F('version') + 1)
+    return requeued, failed
+
+
+def cancel(job):
+    if job.status == CrawlJob.QUEUED:
+        CrawlJob.objects.filter(pk=job.pk, status=CrawlJob.QUEUED).update(
+            status=CrawlJob.CANCELLED, finished=timezone.now(), version=F('version') + 1)
+    CrawlJob.objects.filter(pk=job.pk, status=CrawlJob.RUNNING).update(
+        cancel_requested=True, version=F('version') + 1)
+    job.refresh_from_db()
+    return job
+
+
+async def wait_for_change(job, version, timeout):
+    """Long poll: returns the job as soon as its version moves past version, or after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while job.version <= version and not job.done and time.monotonic() < deadline:
+        await asyncio.sleep(settings.DOWNLOAD_POLL_INTERVAL)
+        job = await CrawlJob.objects.aget(pk=job.pk)
+    return job
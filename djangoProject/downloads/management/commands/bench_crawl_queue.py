@@ -0,0 +1,86 @@
+"""
+Measures how many jobs per second N worker processes can claim from the queue:
+
+    python manage.py bench_crawl_queue --jobs 2000 --workers 1,2,4,8
+
+Runs against a throwaway SQLite file, not the project's database. The workers don't crawl,
+they claim a job and mark it finished, so this is the cost of the queue itself.
+"""
+import multiprocessing
+import os
+import tempfile
+import time
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+def use_database(path):
+    connection.close()
+    connection.settings_dict['NAME'] = path
+
+
+def claim_until_empty(path, batch, start, counts):
+    django.setup()
+    use_database(path)
+    from downloads import jobs
+    from downloads.models import CrawlJob
+
+    name = f'bench:{os.getpid()}'
+    start.wait()
+    claimed = 0
+    while True:
+        batch_jobs = jobs.claim(name, batch)
+        if not batch_jobs:
+            break
+        for job in batch_jobs:
+            jobs.update(job.pk, status=CrawlJob.FINISHED)
+        claimed += len(batch_jobs)
+    counts.put(claimed)
+    connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks claiming crawl jobs with several worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=2000)
+        parser.add_argument('--workers', default='1,2,4,8', help='comma separated worker process counts')
+        parser.add_argument('--batch', type=int, default=1, help='jobs claimed per call')
+
+    def handle(self, *args, **options):
+        from downloads.models import CrawlJob
+
+        self.stdout.write(f'{options["jobs"]} jobs, {options["batch"]} per claim')
+        for workers in [int(n) for n in options['workers'].split(',')]:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                use_database(path)
+                call_command('migrate', 'downloads', verbosity=0)
+                CrawlJob.objects.bulk_create(CrawlJob(query=f'query {i}', priority=i % 3)
+                                             for i in range(options['jobs']))
+                connection.close()
+
+                start = multiprocessing.Event()
+                counts = multiprocessing.Queue()
+                processes = [multiprocessing.Process(target=claim_until_empty,
+                                                     args=(path, options['batch'], start, counts))
+                             for _ in range(workers)]
+                for process in processes:
+                    process.start()
+                started = time.perf_counter()
+                start.set()
+                claimed = [counts.get() for _ in processes]
+                seconds = time.perf_counter() - started
+                for process in processes:
+                    process.join()
+
+                # Every job must have been claimed exactly once
+                twice = CrawlJob.objects.exclude(attempts=1).count()
+                left = CrawlJob.objects.exclude(status=CrawlJob.FINISHED).count()
+                connection.close()
+            self.stdout.write(f'{workers:2d} workers  {sum(claimed):6d} jobs in {seconds:6.2f}s  '
+                              f'{sum(claimed) / seconds:8.1f} claims/s  '
+                              f'(claimed twice: {twice}, not claimed: {left})')
@@ -0,0 +1,33 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from downloads.worker import CrawlWorker
+
+
+class Command(BaseCommand):
+    help = 'Runs queued image crawl jobs. Start as many workers as you like, they share the database queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.DOWNLOAD_WORKERS,
+                            help='jobs this worker runs at the same time')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between queue checks')
+        parser.add_argument('--heartbeat-interval', type=float, default=5.0)
+        parser.add_argument('--stall-timeout', type=float, default=60.0,
+                            help='requeue running jobs whose worker has not sent a heartbeat for this long')
+        parser.add_argument('--max-attempts', type=int, default=3, help='fail a job after this many stalls')
+        parser.add_argument('--name', help='worker name stored on claimed jobs (default: host:pid)')
+
+    def handle(self, *args, **options):
+        worker = CrawlWorker(options['concurrency'], options['poll_interval'], options['heartbeat_interval'],
+                             options['stall_timeout'], options['max_attempts'], options['name'])
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping, running jobs go back to the queue...')
+            worker.stop()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(f'Worker {worker.name} waiting for jobs (concurrency {worker.concurrency})')
+        worker.run_forever()
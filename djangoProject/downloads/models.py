@@ -0,0 +1,74 @@
+import uuid
+
+from django.db import models
+
+
+class CrawlJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FINISHED, 'Finished'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+    DONE = (FINISHED, FAILED, CANCELLED)
+
+    public_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    query = models.CharField(max_length=200)
+    num_images = models.PositiveIntegerField(default=10)
+    filters = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    cancel_requested = models.BooleanField(default=False)
+
+    worker = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    images = models.PositiveIntegerField(default=0)
+    bytes = models.BigIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # Bumped on every change so pollers can tell whether there is anything new
+    version = models.PositiveIntegerField(default=0)
+
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the next job with status='queued' ORDER BY -priority, created
+            models.Index(fields=['status', '-priority', 'created'], name='crawljob_claim_idx'),
+            # Stalled jobs are found by status='running' AND heartbeat < cutoff
+            models.Index(fields=['status', 'heartbeat'], name='crawljob_stall_idx'),
+            models.Index(fields=['created'], name='crawljob_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.query} ({self.status})'
+
+    @property
+    def done(self):
+        return self.status in self.DONE
+
+    def as_dict(self):
+        return {
+            'id': str(self.public_id),
+            'query': self.query,
+            'num_images': self.num_images,
+            'filters': self.filters,
+            'priority': self.priority,
+            'status': self.status,
+            'attempts': self.attempts,
+            'images': self.images,
+            'bytes': self.bytes,
+            'result': self.result,
+            'error': self.error or None,
+            'version': self.version,
+        }
@@ -0,0 +1,234 @@
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from image_downloader import ImageIndex, ResultCache, query_dir_name
+from image_downloader.storage import MANIFEST_NAME
+
+from . import jobs, views, worker
+from .models import CrawlJob
+
+
+class FakeDownload:
+    def __init__(self, query, num_images, download_dir, filters=None, on_image=None, index=None, resume=False,
+                 cache=None):
+        self.query = query
+        self.num_images = num_images
+        self.download_dir = download_dir
+        self.on_image = on_image
+        self.images = 0
+        self.bytes = 0
+
+    def cancel(self):
+        pass
+
+    def run(self):
+        for i in range(self.num_images):
+            self.images += 1
+            self.bytes += 100
+            self.on_image(f'{i}.jpg', 100)
+        return {'query': self.query, 'download_dir': self.download_dir, 'downloaded': self.images,
+                'cancelled': False}
+
+
+class WorkerTestMixin:
+    def setUp(self):
+        patcher = mock.patch.object(worker, 'QueryDownload', FakeDownload)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        download_root = tempfile.TemporaryDirectory()
+        self.addCleanup(download_root.cleanup)
+        settings_override = self.settings(DOWNLOAD_ROOT=download_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def run_queued_jobs(self):
+        crawl_worker = worker.CrawlWorker(name='test')
+        for job in jobs.claim('test', limit=100):
+            crawl_worker.run_job(job)
+        crawl_worker.cache.close()
+        crawl_worker.index.close()
+
+
+@override_settings(DOWNLOAD_POLL_INTERVAL=0.01)
+class DownloadImagesTests(WorkerTestMixin, TestCase):
+    def test_returns_job_without_waiting_for_the_crawl(self):
+        response = self.client.get('/download_images', {'query': 'red cars', 'num_images': 3, 'color': 'red'})
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['filters'], {'color': 'red'})
+        self.assertEqual(job['status'], 'queued')
+        self.assertTrue(job['events_url'].endswith('/events'))
+
+        self.run_queued_jobs()
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual(status['status'], 'finished')
+        self.assertEqual(status['images'], 3)
+
+    def test_query_is_required(self):
+        response = self.client.get('/download_images', {'query': ' '})
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_cannot_leave_the_download_root(self):
+        root = os.path.realpath(settings.DOWNLOAD_ROOT)
+        response = self.client.get('/download_images', {'query': '../../../victim', 'num_images': 1})
+        self.assertEqual(response.status_code, 202)
+        self.run_queued_jobs()
+        job = CrawlJob.objects.get(public_id=response.json()['id'])
+        self.assertEqual(os.path.dirname(job.result['download_dir']), root)
+
+        # A folder that is a link to somewhere else is refused too
+        outside = tempfile.TemporaryDirectory()
+        self.addCleanup(outside.cleanup)
+        os.symlink(outside.name, os.path.join(root, query_dir_name('linked')))
+        response = self.client.get('/download_images', {'query': 'linked'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cancel_queued_job(self):
+        job = self.client.get('/download_images', {'query': 'dogs'}).json()
+        response = self.client.post(job['status_url'] + '/cancel')
+        self.assertEqual(response.json()['status'], 'cancelled')
+        self.assertEqual(jobs.claim('test'), [])
+
+    def test_serves_the_downloader_page(self):
+        response = self.client.get('/')
+        self.assertContains(response, 'Advanced Image Downloader')
+
+    def test_cache_stats(self):
+        stats = self.client.get('/download_images/cache').json()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (0, 0, 0))
+        cache = views.result_cache()
+        self.client.get('/download_images/cache')
+        self.assertIs(views.result_cache(), cache)
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/download_images/nope').status_code, 404)
+        self.assertEqual(self.client.get('/download_images/9b5a7c7e-0000-4000-8000-000000000000').status_code, 404)
+
+
+@override_settings(DOWNLOAD_POLL_INTERVAL=0.01)
+class EventStreamTests(WorkerTestMixin, TransactionTestCase):
+    async def test_event_stream_ends_with_done(self):
+        response = await self.async_client.get('/download_images', {'query': 'cats', 'num_images': 2})
+        job = response.json()
+        await CrawlJob.objects.filter(public_id=job['id']).aupdate(status=CrawlJob.FINISHED, images=2, version=1)
+        response = await self.async_client.get(job['events_url'])
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('event: done', body)
+        self.assertIn('"images": 2', body)
+
+
+class WorkerTests(WorkerTestMixin, TestCase):
+    def test_requeued_job_is_left_to_its_new_worker(self):
+        jobs.enqueue('cats', 2, {})
+        [job] = jobs.claim('test')
+        # 'test' stops heartbeating, the job is requeued and claimed by 'b' while 'test' still runs it
+        CrawlJob.objects.filter(pk=job.pk).update(heartbeat=timezone.now() - timedelta(minutes=5))
+        jobs.requeue_stalled(stall_timeout=60, max_attempts=3)
+        jobs.claim('b')
+        crawl_worker = worker.CrawlWorker(name='test')
+        crawl_worker.run_job(job)
+        crawl_worker.cache.close()
+        crawl_worker.index.close()
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.RUNNING)
+        self.assertEqual(job.worker, 'b')
+        self.assertIsNone(job.result)
+
+
+    def test_job_requeued_on_shutdown_resumes(self):
+        resumed = []
+
+        def download(*args, **kwargs):
+            resumed.append(kwargs['resume'])
+            return FakeDownload(*args, **kwargs)
+
+        jobs.enqueue('cats', 2, {})
+        crawl_worker = worker.CrawlWorker(name='test')
+        crawl_worker.stopping.set()
+        with mock.patch.object(worker, 'QueryDownload', download), \
+                mock.patch.object(FakeDownload, 'run', lambda self: {'cancelled': True}):
+            [job] = jobs.claim('test')
+            crawl_worker.run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (CrawlJob.QUEUED, 0))
+
+        crawl_worker.stopping.clear()
+        with mock.patch.object(worker, 'QueryDownload', download):
+            [job] = jobs.claim('test')
+            crawl_worker.run_job(job)
+        crawl_worker.cache.close()
+        crawl_worker.index.close()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (CrawlJob.FINISHED, 1))
+        self.assertEqual(resumed, [False, True])
+
+
+class QueueTests(TestCase):
+    def test_claims_by_priority_then_age(self):
+        low = jobs.enqueue('low', 1, {})
+        high = jobs.enqueue('high', 1, {}, priority=5)
+        older = jobs.enqueue('older', 1, {})
+        self.assertEqual(jobs.claim('a', limit=2), [high, low])
+        self.assertEqual(jobs.claim('b', limit=2), [older])
+        self.assertEqual(jobs.claim('c'), [])
+
+    def test_one_job_per_query_at_a_time(self):
+        first = jobs.enqueue('cats', 1, {})
+        second = jobs.enqueue('cats', 1, {})
+        other = jobs.enqueue('dogs', 1, {})
+        self.assertEqual(jobs.claim('a', limit=3), [first, other])
+        self.assertEqual(jobs.claim('b'), [])
+        jobs.report(first.pk, 'a', status=CrawlJob.FINISHED)
+        self.assertEqual(jobs.claim('b'), [second])
+
+    def test_job_is_claimed_once(self):
+        jobs.enqueue('cats', 1, {})
+        first = jobs.claim('a')
+        self.assertEqual(len(first), 1)
+        self.assertEqual(first[0].worker, 'a')
+        self.assertEqual(first[0].attempts, 1)
+        self.assertEqual(jobs.claim('b'), [])
+
+    def test_stalled_jobs_are_requeued_then_failed(self):
+        job = jobs.enqueue('cats', 1, {})
+        for attempt in range(2):
+            jobs.claim('a')
+            CrawlJob.objects.filter(pk=job.pk).update(heartbeat=timezone.now() - timedelta(minutes=5))
+            jobs.requeue_stalled(stall_timeout=60, max_attempts=2)
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_heartbeat_reports_cancel_requests(self):
+        job = jobs.enqueue('cats', 1, {})
+        jobs.claim('a')
+        jobs.cancel(job)
+        self.assertEqual(jobs.heartbeat('a', [job.pk]), {job.pk})
+
+
+class ResultCacheTests(SimpleTestCase):
+    def test_eviction_keeps_the_index(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        index = ImageIndex(os.path.join(tmp.name, '.index'))
+        self.addCleanup(index.close)
+        cache = ResultCache(index, max_bytes=1)
+        self.addCleanup(cache.close)
+        url = 'https://example.com/cat.jpg'
+        path = index.store(url, b'not really a jpeg', 'ab' * 32, None, 'jpg')
+        download_dir = os.path.join(tmp.name, 'cats')
+        os.makedirs(download_dir)
+        with open(os.path.join(download_dir, MANIFEST_NAME), 'w') as f:
+            f.write('{"url": "%s", "width": 1, "height": 1}\n' % url)
+
+        cache.put(cache.key('cats', {}), 'cats', {}, 1, download_dir)
+        self.assertEqual(cache.metrics()['evictions'], 1)
+        self.assertEqual(index.lookup_url(url), path)
+        self.assertTrue(os.path.exists(path))
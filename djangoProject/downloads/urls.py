@@ -0,0 +1,14 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'downloads'
+
+urlpatterns = [
+    path('', views.index, name='index'),
+    path('download_images', views.download_images, name='download_images'),
+    path('download_images/cache', views.cache_stats, name='cache_stats'),
+    path('download_images/<uuid:job_id>', views.job_status, name='job_status'),
+    path('download_images/<uuid:job_id>/events', views.job_events, name='job_events'),
+    path('download_images/<uuid:job_id>/cancel', views.cancel_job, name='cancel_job'),
+]
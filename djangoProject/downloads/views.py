@@ -0,0 +1,122 @@
+import json
+import os
+
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.views.decorators.http import require_GET, require_POST
+
+from image_downloader import ImageIndex, ResultCache, build_filters
+
+from . import jobs
+from .models import CrawlJob
+
+# How long a long-poll request or an idle event stream stays open
+LONG_POLL_TIMEOUT = 25
+
+# DOWNLOAD_ROOT's index folder -> (ImageIndex, ResultCache), see result_cache()
+_result_caches = {}
+
+
+def index(request):
+    return render(request, 'Index.html')
+
+
+def job_payload(job):
+    payload = job.as_dict()
+    payload['status_url'] = reverse('downloads:job_status', args=[job.public_id])
+    payload['events_url'] = reverse('downloads:job_events', args=[job.public_id])
+    return payload
+
+
+async def aget_job(job_id):
+    job = await CrawlJob.objects.filter(public_id=job_id).afirst()
+    if job is None:
+        raise Http404('Unknown job')
+    return job
+
+
+@require_GET
+def download_images(request):
+    query = request.GET.get('query', '').strip()
+    if not query:
+        return JsonResponse({'error': 'query is required'}, status=400)
+    try:
+        num_images = int(request.GET.get('num_images', 10))
+    except ValueError:
+        return JsonResponse({'error': 'num_images must be a number'}, status=400)
+    num_images = max(1, min(num_images, settings.DOWNLOAD_MAX_IMAGES))
+    try:
+        jobs.download_dir(query)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    filters = build_filters(request.GET.get('color'), request.GET.get('type'), request.GET.get('size'),
+                            request.GET.get('license'), request.GET.get('format'), request.GET.get('time'))
+    try:
+        priority = int(request.GET.get('priority', 0))
+    except ValueError:
+        priority = 0
+    job = jobs.enqueue(query, num_images, filters, priority)
+    return JsonResponse(job_payload(job), status=202)
+
+
+def result_cache():
+    """The process' ResultCache for reading the stats, opened on first use rather than per request."""
+    root = os.path.join(settings.DOWNLOAD_ROOT, '.index')
+    if root not in _result_caches:
+        for image_index, cache in _result_caches.values():
+            cache.close()
+            image_index.close()
+        _result_caches.clear()
+        image_index = ImageIndex(root)
+        cache = ResultCache(image_index, settings.DOWNLOAD_CACHE_TTL, settings.DOWNLOAD_CACHE_MAX_BYTES)
+        _result_caches[root] = image_index, cache
+    return _result_caches[root][1]
+
+
+@require_GET
+def cache_stats(request):
+    """Hit/miss counters of the search result cache, shared by all crawl workers."""
+    return JsonResponse(result_cache().metrics())
+
+
+@require_GET
+async def job_status(request, job_id):
+    """Job state as JSON. With ?version=N this long-polls until the job changed after version N."""
+    job = await aget_job(job_id)
+    version = request.GET.get('version')
+    if version is not None and version.lstrip('-').isdigit():
+        job = await jobs.wait_for_change(job, int(version), LONG_POLL_TIMEOUT)
+    return JsonResponse(job_payload(job))
+
+
+@require_POST
+def cancel_job(request, job_id):
+    job = jobs.cancel(get_object_or_404(CrawlJob, public_id=job_id))
+    return JsonResponse(job_payload(job))
+
+
+async def event_stream(job):
+    version = -1
+    while True:
+        job = await jobs.wait_for_change(job, version, LONG_POLL_TIMEOUT)
+        if job.version == version:
+            # Nothing new, a comment keeps proxies from closing the connection
+            yield ': keep-alive\n\n'
+            continue
+        version = job.version
+        yield f'event: progress\ndata: {json.dumps(job.as_dict())}\n\n'
+        if job.done:
+            yield f'event: done\ndata: {json.dumps(job.as_dict())}\n\n'
+            return
+
+
+@require_GET
+async def job_events(request, job_id):
+    """Server-Sent Events stream of the job's progress, ends with a 'done' event."""
+    job = await aget_job(job_id)
+    response = StreamingHttpResponse(event_stream(job), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,112 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from image_downloader import ImageIndex, QueryDownload, ResultCache
+
+from . import jobs
+from .models import CrawlJob
+
+# Progress is written to the database at most this often per job
+PROGRESS_INTERVAL = 1.0
+
+
+class CrawlWorker:
+    """Claims CrawlJobs from the database and runs up to `concurrency` of them at once."""
+
+    def __init__(self, concurrency=2, poll_interval=1.0, heartbeat_interval=5.0, stall_timeout=60.0,
+                 max_attempts=3, name=None):
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stall_timeout = stall_timeout
+        self.max_attempts = max_attempts
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='crawl')
+        self.index = ImageIndex(os.path.join(settings.DOWNLOAD_ROOT, '.index'))
+        self.cache = ResultCache(self.index, settings.DOWNLOAD_CACHE_TTL, settings.DOWNLOAD_CACHE_MAX_BYTES)
+        self.downloads = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def stop(self):
+        self.stopping.set()
+
+    def run_forever(self):
+        last_heartbeat = 0.0
+        while not self.stopping.is_set():
+            if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                self.beat()
+                last_heartbeat = time.monotonic()
+            with self.lock:
+                free = self.concurrency - len(self.downloads)
+            if free > 0:
+                for job in jobs.claim(self.name, free):
+                    self.start(job)
+            self.stopping.wait(self.poll_interval)
+
+        # Shutting down: stop the crawls, run_job hands them back to the queue
+        with self.lock:
+            for download in self.downloads.values():
+                if download is not None:
+                    download.cancel()
+        self.pool.shutdown(wait=True)
+
+    def beat(self):
+        with self.lock:
+            job_ids = list(self.downloads)
+        for job_id in jobs.heartbeat(self.name, job_ids):
+            with self.lock:
+                download = self.downloads.get(job_id)
+            if download is not None:
+                download.cancel()
+        jobs.requeue_stalled(self.stall_timeout, self.max_attempts)
+
+    def start(self, job):
+        with self.lock:
+            self.downloads[job.pk] = None
+        self.pool.submit(self.run_job, job)
+
+    def run_job(self, job):
+        last_progress = [0.0]
+
+        def on_image(filename, nbytes):
+            if time.monotonic() - last_progress[0] >= PROGRESS_INTERVAL:
+                last_progress[0] = time.monotonic()
+                jobs.report(job.pk, self.name, images=download.images, bytes=download.bytes)
+
+        # Every write goes through report(): a worker presumed dead whose job was requeued must not
+        # overwrite what the worker that claimed it since writes
+        try:
+            # A query that would leave DOWNLOAD_ROOT fails here, before anything is removed
+            download_dir = jobs.download_dir(job.query)
+            # A job that ran before (requeued after a crash or a shutdown) continues from its checkpoint
+            resume = job.started < job.heartbeat
+            download = QueryDownload(job.query, job.num_images, download_dir, job.filters, on_image=on_image,
+                                     index=self.index, resume=resume, cache=self.cache)
+            with self.lock:
+                self.downloads[job.pk] = download
+            result = download.run()
+        except Exception as e:
+            jobs.report(job.pk, self.name, status=CrawlJob.FAILED, error=str(e), finished=timezone.now())
+        else:
+            if result['cancelled'] and self.stopping.is_set():
+                # Not the job's fault, don't count this attempt
+                jobs.report(job.pk, self.name, status=CrawlJob.QUEUED, worker='', heartbeat=None,
+                             attempts=F('attempts') - 1, images=download.images, bytes=download.bytes)
+            else:
+                status = CrawlJob.CANCELLED if result['cancelled'] else CrawlJob.FINISHED
+                jobs.report(job.pk, self.name, status=status, result=result, images=download.images,
+                            bytes=download.bytes, finished=timezone.now())
+        finally:
+            with self.lock:
+                self.downloads.pop(job.pk, None)
+            # Every pool thread has its own connection
+            connection.close()
@@ -0,0 +1,191 @@
+import hashlib
+import io
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+
+Image = namedtuple('Image', 'name size mtime_ns')
+Listing = namedtuple('Listing', 'mtime_ns names folders')
+
+
+def is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def resolve(root, relative):
+    """root/relative, or None when relative leaves root or goes through hidden files like .thumbnails."""
+    parts = [part for part in relative.replace('\\', '/').split('/') if part]
+    if any(part.startswith('.') for part in parts):
+        return None
+    return os.path.join(root, *parts)
+
+
+def version(size, mtime_ns):
+    """Changes whenever the file does, used for ETags and ?v= in URLs."""
+    return f'{size:x}-{mtime_ns:x}'
+
+
+class Folders:
+    """Sorted image names of folders, scanned again only when a folder's mtime changes.
+
+    Adding, removing or renaming a file changes the folder's mtime, so a page of a folder
+    that did not change costs one stat() of the folder, a binary search for the cursor and
+    a stat() of each image on the page, however many images the folder holds. Scans don't
+    stat() the files, that was most of their time.
+    """
+
+    def __init__(self, max_folders=32):
+        self.max_folders = max_folders
+        self.lock = threading.Lock()
+        self.listings = OrderedDict()
+
+    def get(self, path):
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self.lock:
+            listing = self.listings.get(path)
+            if listing is not None and listing.mtime_ns == mtime_ns:
+                self.listings.move_to_end(path)
+                return listing
+        listing = self.scan(path, mtime_ns)
+        with self.lock:
+            self.listings[path] = listing
+            self.listings.move_to_end(path)
+            while len(self.listings) > self.max_folders:
+                self.listings.popitem(last=False)
+        return listing
+
+    @staticmethod
+    def scan(path, mtime_ns):
+        names = []
+        folders = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    if not name.startswith('.'):
+                        names.append(name)
+                elif entry.is_dir() and not name.startswith('.'):
+                    folders.append(name)
+        return Listing(mtime_ns, sorted(names), sorted(folders))
+
+    def page(self, path, cursor, limit):
+        """(listing, up to limit Images after the name cursor, the cursor of the next page or None)."""
+        listing = self.get(path)
+        start = bisect_right(listing.names, cursor) if cursor else 0
+        names = listing.names[start:start + limit]
+        images = []
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(path, name))
+            except FileNotFoundError:
+                # Removed since the scan, the folder's new mtime makes the next page scan again
+                continue
+            images.append(Image(name, stat.st_size, stat.st_mtime_ns))
+        return listing, images, names[-1] if start + limit < len(listing.names) else None
+
+
+class ThumbnailCache:
+    """JPEG thumbnails made on first request, kept on disk and the most used ones in memory.
+
+    Files on disk are named after the image's path, size and mtime, so a changed image gets a
+    new thumbnail and the old one is simply never read again. At most memory_bytes of
+    thumbnails are kept in memory, least recently used first out. Requests for a thumbnail
+    that is being made wait for it instead of decoding the same image again.
+    """
+
+    def __init__(self, directory, memory_bytes=64 * 2 ** 20, quality=85):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.quality = quality
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.used_bytes = 0
+        self.making = {}
+        self.counters = dict.fromkeys(('memory_hits', 'disk_hits', 'made'), 0)
+
+    def key(self, relative, stat, side):
+        key = f'{relative}\0{version(stat.st_size, stat.st_mtime_ns)}\0{side}'
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.jpg')
+
+    def get(self, path, relative, stat, side):
+        """(source, JPEG bytes) of the thumbnail of path, at most side pixels square; source is memory, disk or made."""
+        key = self.key(relative, stat, side)
+        data = self._remember(key)
+        if data is not None:
+            return 'memory', data
+        with self.lock:
+            making = self.making.get(key)
+            if making is None:
+                making = self.making[key] = threading.Lock()
+        with making:
+            source = 'memory'
+            data = self._remember(key)
+            if data is None:
+                source, data = self._load(key, path, side)
+                self._keep(key, data)
+            with self.lock:
+                self.making.pop(key, None)
+        return source, data
+
+    def _remember(self, key):
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+            return data
+
+    def _keep(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        with self.lock:
+            if key in self.memory:
+                return
+            self.memory[key] = data
+            self.used_bytes += len(data)
+            while self.used_bytes > self.memory_bytes:
+                _, old = self.memory.popitem(last=False)
+                self.used_bytes -= len(old)
+
+    def _load(self, key, path, side):
+        cached = self.path(key)
+        try:
+            with open(cached, 'rb') as f:
+                data = f.read()
+            with self.lock:
+                self.counters['disk_hits'] += 1
+            return 'disk', data
+        except FileNotFoundError:
+            pass
+        data = self.make(path, side)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        tmp = f'{cached}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, cached)
+        with self.lock:
+            self.counters['made'] += 1
+        return 'made', data
+
+    def make(self, path, side):
+        from PIL import Image as PILImage
+
+        with PILImage.open(path) as image:
+            # JPEGs decode straight at a fraction of their size, much faster than full size
+            image.draft('RGB', (side, side))
+            image.thumbnail((side, side))
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            output = io.BytesIO()
+            image.save(output, 'JPEG', quality=self.quality)
+        return output.getvalue()
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.counters, memory_entries=len(self.memory), memory_bytes=self.used_bytes)
@@ -0,0 +1,126 @@
+"""
+Times the gallery on a folder of 100k images and checks serving large files keeps memory flat:
+
+    python manage.py bench_gallery --images 100000 --file-mb 512
+
+Works in a throwaway folder of hard links to one small PNG (or --root, an existing folder,
+for the listing). Requests go through Django with the test client, so this is the cost of
+the views, without a web server. Serving the --file-mb file prints how much the process'
+peak RSS grew, which stays near zero because the file is streamed in BLOCK_SIZE reads
+(a WSGI server with sendfile() does not even read it into Python).
+"""
+import errno
+import os
+import random
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from ... import views
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the image gallery.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=100000)
+        parser.add_argument('--root', help='existing folder of images to list instead of a generated one')
+        parser.add_argument('--thumbnails', type=int, default=50, help='thumbnails to make, then read back')
+        parser.add_argument('--file-mb', type=int, default=512, help='size of the full size file served')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = options['root'] or os.path.join(tmp, 'images')
+            if not options['root']:
+                self.make_images(root, options['images'])
+            with override_settings(GALLERY_ROOT=root, GALLERY_THUMBNAIL_DIR=os.path.join(tmp, 'thumbnails')):
+                views._thumbnails.clear()
+                client = Client(SERVER_NAME='localhost')
+                self.bench_listing(client, root, options['repeat'])
+                self.bench_thumbnails(client, root, options['thumbnails'])
+                self.bench_full_size(client, tmp, options['file_mb'])
+
+    def make_images(self, root, count):
+        from PIL import Image
+
+        os.makedirs(root)
+        first = os.path.join(root, '000000.png')
+        Image.new('RGB', (800, 600), (200, 80, 40)).save(first)
+        started = time.perf_counter()
+        for number in range(1, count):
+            path = os.path.join(root, f'{number:06d}.png')
+            try:
+                os.link(first, path)
+            except OSError as e:
+                if e.errno != errno.EMLINK:
+                    raise
+                # Filesystems limit the links to one file, ext4 to 65000
+                shutil.copyfile(first, path)
+                first = path
+        self.stdout.write(f'{count} images in {root} ({time.perf_counter() - started:.1f} s)')
+
+    def bench_listing(self, client, root, repeat):
+        views.folders.listings.clear()
+        started = time.perf_counter()
+        page = client.get('/api/gallery').json()
+        self.stdout.write(f'first page, folder scanned:  {(time.perf_counter() - started) * 1000:8.2f} ms '
+                          f'({page["count"]} images)')
+        names = views.folders.get(root).names
+        self.stdout.write(f'first page:                  {timed(lambda: client.get("/api/gallery"), repeat):8.2f} ms')
+        rng = random.Random(0)
+        self.stdout.write(f'page at a random name:       '
+                          f'{timed(lambda: client.get("/api/gallery", {"cursor": rng.choice(names)}), repeat):8.2f} ms')
+        etag = client.get('/api/gallery')['ETag']
+        self.stdout.write(f'not modified (304):          '
+                          f'{timed(lambda: client.get("/api/gallery", HTTP_IF_NONE_MATCH=etag), repeat):8.2f} ms')
+
+    def bench_thumbnails(self, client, root, count):
+        urls = [image['thumbnail_url'] for image in client.get('/api/gallery', {'limit': count}).json()['images']]
+
+        def get_all():
+            for url in urls:
+                client.get(url)
+
+        made = timed(get_all, 1) / len(urls)
+        memory = timed(get_all, 1) / len(urls)
+        views._thumbnails.clear()
+        disk = timed(get_all, 1) / len(urls)
+        self.stdout.write(f'thumbnail made:              {made:8.2f} ms')
+        self.stdout.write(f'thumbnail from memory:       {memory:8.2f} ms')
+        self.stdout.write(f'thumbnail from disk:         {disk:8.2f} ms')
+
+    def bench_full_size(self, client, tmp, megabytes):
+        os.makedirs(os.path.join(tmp, 'large'))
+        with override_settings(GALLERY_ROOT=os.path.join(tmp, 'large')):
+            with open(os.path.join(tmp, 'large', 'large.png'), 'wb') as f:
+                for _ in range(megabytes):
+                    f.write(os.urandom(2 ** 20))
+            before = peak_rss_mb()
+            for header in ({}, {'HTTP_RANGE': f'bytes={megabytes * 2 ** 19}-'}):
+                started = time.perf_counter()
+                response = client.get('/gallery/image/large.png', **header)
+                sent = sum(len(chunk) for chunk in response.streaming_content)
+                response.close()
+                elapsed = time.perf_counter() - started
+                label = 'full size file' if not header else 'second half (Range)'
+                self.stdout.write(f'{label + ":":28} {sent / 2 ** 20 / elapsed:8.0f} MB/s, '
+                                  f'peak RSS +{peak_rss_mb() - before:.1f} MB for {sent / 2 ** 20:.0f} MB sent')
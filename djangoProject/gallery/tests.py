@@ -0,0 +1,138 @@
+import io
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from . import views
+from .images import Folders, ThumbnailCache
+
+
+class GalleryTestMixin:
+    def setUp(self):
+        from PIL import Image
+
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        for number in range(5):
+            Image.new('RGB', (600, 400), (number * 50, 0, 0)).save(os.path.join(self.root, f'{number:06d}.png'))
+        os.makedirs(os.path.join(self.root, 'cats'))
+        Image.new('RGB', (50, 50)).save(os.path.join(self.root, 'cats', 'tabby.jpg'))
+        with open(os.path.join(self.root, 'notes.txt'), 'w') as f:
+            f.write('not an image')
+        settings_override = self.settings(GALLERY_ROOT=self.root,
+                                          GALLERY_THUMBNAIL_DIR=os.path.join(self.root, '.thumbnails'),
+                                          GALLERY_PAGE_SIZE=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(views._thumbnails.clear)
+
+    def content(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+
+class ListImagesTests(GalleryTestMixin, SimpleTestCase):
+    def walk(self, params=None):
+        names = []
+        url = '/api/gallery'
+        while url:
+            page = self.client.get(url, params).json()
+            params = None
+            names += [image['name'] for image in page['images']]
+            url = page['next']
+        return names
+
+    def test_pages_in_name_order(self):
+        page = self.client.get('/api/gallery').json()
+        self.assertEqual(page['folders'], ['cats'])
+        self.assertEqual(page['count'], 5)
+        self.assertEqual(self.walk(), [f'{number:06d}.png' for number in range(5)])
+        self.assertEqual(self.walk({'folder': 'cats'}), ['tabby.jpg'])
+
+    def test_listing_is_rescanned_when_the_folder_changes(self):
+        etag = self.client.get('/api/gallery')['ETag']
+        self.assertEqual(self.client.get('/api/gallery', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        os.remove(os.path.join(self.root, '000000.png'))
+        response = self.client.get('/api/gallery')
+        self.assertEqual(response.json()['count'], 4)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_scans_once_per_folder_version(self):
+        folders = Folders()
+        first = folders.get(self.root)
+        self.assertIs(folders.get(self.root), first)
+        _, page, next_cursor = folders.page(self.root, '000001.png', 2)
+        self.assertEqual([image.name for image in page], ['000002.png', '000003.png'])
+        self.assertEqual(next_cursor, '000003.png')
+        self.assertIsNone(folders.page(self.root, next_cursor, 2)[2])
+
+    def test_stays_in_the_gallery(self):
+        for folder in ('..', 'cats/../..', '.thumbnails', 'dogs'):
+            self.assertEqual(self.client.get('/api/gallery', {'folder': folder}).status_code, 404, folder)
+        for url in ('/gallery/image/notes.txt', '/gallery/image/../settings.py', '/gallery/image/.thumbnails/x.jpg'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+
+class ImageTests(GalleryTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.image = self.client.get('/api/gallery').json()['images'][0]
+        with open(os.path.join(self.root, '000000.png'), 'rb') as f:
+            self.data = f.read()
+
+    def test_streams_the_file(self):
+        response = self.client.get(self.image['url'])
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(int(response['Content-Length']), len(self.data))
+        self.assertEqual(response['Cache-Control'], views.IMMUTABLE)
+        self.assertEqual(self.content(response), self.data)
+        # Without the version the browser has to check again
+        response = self.client.get('/gallery/image/000000.png')
+        self.assertEqual(response['Cache-Control'], views.REVALIDATE)
+        self.assertEqual(self.client.get(self.image['url'], HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_ranges(self):
+        size = len(self.data)
+        for header, expected in (('bytes=0-99', self.data[:100]), ('bytes=100-', self.data[100:]),
+                                 ('bytes=-10', self.data[-10:]), (f'bytes=10-{size * 2}', self.data[10:])):
+            response = self.client.get(self.image['url'], HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(self.content(response), expected, header)
+            self.assertEqual(int(response['Content-Length']), len(expected))
+        response = self.client.get(self.image['url'], HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{size}')
+        self.assertEqual(self.client.get(self.image['url'], HTTP_RANGE=f'bytes={size}-').status_code, 416)
+        # A last byte before the first makes the range invalid, it is ignored rather than unsatisfiable
+        response = self.client.get(self.image['url'], HTTP_RANGE='bytes=5-2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.data)
+        # Ranges of an older version of the file get all of it
+        response = self.client.get(self.image['url'], HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.data)
+
+    def test_thumbnail_from_memory_then_disk(self):
+        from PIL import Image
+
+        response = self.client.get(self.image['thumbnail_url'])
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with Image.open(io.BytesIO(response.content)) as thumbnail:
+            self.assertEqual(thumbnail.size, (256, 171))
+        self.client.get(self.image['thumbnail_url'])
+        self.assertEqual(views.thumbnails().metrics()['made'], 1)
+        self.assertEqual(views.thumbnails().metrics()['memory_hits'], 1)
+
+        views._thumbnails.clear()
+        self.assertEqual(self.client.get(self.image['thumbnail_url']).content, response.content)
+        self.assertEqual(views.thumbnails().metrics()['disk_hits'], 1)
+        self.assertEqual(self.client.get('/gallery/thumbnail/100/000000.png').status_code, 404)
+
+    def test_memory_is_bounded(self):
+        cache = ThumbnailCache(os.path.join(self.root, '.thumbnails'), memory_bytes=3000)
+        for number in range(5):
+            path = os.path.join(self.root, f'{number:06d}.png')
+            cache.get(path, os.path.basename(path), os.stat(path), 128)
+        self.assertLessEqual(cache.metrics()['memory_bytes'], 3000)
+        self.assertLess(cache.metrics()['memory_entries'], 5)
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'gallery'
+
+urlpatterns = [
+    path('api/gallery', views.list_images, name='images'),
+    path('api/gallery/thumbnails', views.thumbnail_stats, name='thumbnail_stats'),
+    path('gallery/image/<path:name>', views.image, name='image'),
+    path('gallery/thumbnail/<int:side>/<path:name>', views.thumbnail, name='thumbnail'),
+]
@@ -0,0 +1,216 @@
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from monitoring.metrics import record_cache
+
+from .images import Folders, ThumbnailCache, is_image, resolve, version
+
+# Versioned URLs (?v= of the listing) never change, the others are checked with the ETag
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+# Bytes per read when the server has no sendfile() and Django streams the file itself
+BLOCK_SIZE = 256 * 1024
+RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+folders = Folders()
+_thumbnails = {}
+
+
+def thumbnails():
+    """The process' ThumbnailCache, so the in-memory thumbnails are shared by all requests."""
+    directory = str(settings.GALLERY_THUMBNAIL_DIR)
+    if directory not in _thumbnails:
+        _thumbnails.clear()
+        _thumbnails[directory] = ThumbnailCache(directory, settings.GALLERY_THUMBNAIL_MEMORY_BYTES)
+    return _thumbnails[directory]
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def image_path(name):
+    path = resolve(str(settings.GALLERY_ROOT), name)
+    if path is None or not is_image(path):
+        raise Http404('Unknown image')
+    return path
+
+
+def cache_control(request, response, etag):
+    response['ETag'] = f'"{etag}"'
+    response['Cache-Control'] = IMMUTABLE if request.GET.get('v') == etag.split(':')[0] else REVALIDATE
+    return response
+
+
+class FileRange:
+    """The length bytes of file from where it is, readable like the file itself.
+
+    WSGI servers with sendfile() (gunicorn) send from the file descriptor's position for
+    Content-Length bytes without reading it into Python; the others call read().
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def byte_range(header, size):
+    """(start, end) of a single bytes=start-end range, None to send the whole file, ValueError if unsatisfiable."""
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        # Several ranges at once or another unit: the whole file is a valid answer too
+        return None
+    start, end = match.groups()
+    if not start:
+        start, end = max(0, size - int(end)), size - 1
+    elif end and int(end) < int(start):
+        # Invalid rather than unsatisfiable, RFC 9110 has the header ignored
+        return None
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        raise ValueError
+    return start, end
+
+
+@require_safe
+def list_images(request):
+    """A page of ?folder= (the gallery root by default), ?limit= images after the ?cursor= name, in name order."""
+    folder = request.GET.get('folder', '').strip('/')
+    path = resolve(str(settings.GALLERY_ROOT), folder)
+    if path is None or not os.path.isdir(path):
+        return error('Unknown folder', status=404)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', settings.GALLERY_PAGE_SIZE)), settings.GALLERY_MAX_PAGE_SIZE))
+    except ValueError:
+        return error('limit must be a number')
+    cursor = request.GET.get('cursor', '')
+    listing, page, next_cursor = folders.page(path, cursor, limit)
+    etag = f'"{listing.mtime_ns:x}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    prefix = f'{folder}/' if folder else ''
+    # reverse() once per page instead of twice per image, it was most of the page's time
+    image_url = reverse('gallery:image', args=['-'])[:-1]
+    thumbnail_url = reverse('gallery:thumbnail', args=[settings.GALLERY_THUMBNAIL_SIZE, '-'])[:-1]
+    images = []
+    for image in page:
+        name = quote(prefix + image.name)
+        v = version(image.size, image.mtime_ns)
+        images.append({
+            'name': image.name,
+            'size': image.size,
+            'modified': image.mtime_ns // 10 ** 6,
+            'url': f'{image_url}{name}?v={v}',
+            'thumbnail_url': f'{thumbnail_url}{name}?v={v}',
+        })
+    next_url = None
+    if next_cursor:
+        query = request.GET.copy()
+        query['cursor'] = next_cursor
+        next_url = f'{request.path}?{query.urlencode()}'
+    response = JsonResponse({
+        'folder': folder,
+        'folders': listing.folders if not cursor else [],
+        'count': len(listing.names),
+        'images': images,
+        'next': next_url,
+    })
+    response['ETag'] = etag
+    response['Cache-Control'] = REVALIDATE
+    return response
+
+
+@require_safe
+def image(request, name):
+    """The image file, streamed (or sent with sendfile()) rather than read, with Range support."""
+    path = image_path(name)
+    try:
+        file = open(path, 'rb')
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        raise Http404('Unknown image')
+    # Of the file being sent, even if it was replaced since
+    stat = os.fstat(file.fileno())
+    etag = version(stat.st_size, stat.st_mtime_ns)
+    response = get_conditional_response(request, etag=f'"{etag}"', last_modified=int(stat.st_mtime))
+    if response is not None:
+        file.close()
+        return cache_control(request, response, etag)
+
+    content_range = None
+    header = request.headers.get('Range')
+    # If-Range: the range is only wanted from this version of the file, otherwise send all of it
+    if header and request.headers.get('If-Range', f'"{etag}"') in (f'"{etag}"', http_date(stat.st_mtime)):
+        try:
+            content_range = byte_range(header, stat.st_size)
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    if content_range is None:
+        response = FileResponse(file)
+    else:
+        start, end = content_range
+        file.seek(start)
+        response = FileResponse(FileRange(file, end - start + 1), status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response.block_size = BLOCK_SIZE
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return cache_control(request, response, etag)
+
+
+@require_safe
+def thumbnail(request, side, name):
+    """A JPEG at most side pixels wide and high, for the sizes in GALLERY_THUMBNAIL_SIZES."""
+    if side not in settings.GALLERY_THUMBNAIL_SIZES:
+        raise Http404('Unknown thumbnail size')
+    path = image_path(name)
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('Unknown image')
+    etag = f'{version(stat.st_size, stat.st_mtime_ns)}:{side}'
+    response = get_conditional_response(request, etag=f'"{etag}"')
+    if response is not None:
+        return cache_control(request, response, etag)
+    try:
+        source, data = thumbnails().get(path, name, stat, side)
+    except OSError:
+        # Pillow raises OSError subclasses for files that aren't images it can read
+        return error('Not a readable image', status=415)
+    record_cache('thumbnail_memory', source == 'memory')
+    if source != 'memory':
+        record_cache('thumbnail_disk', source == 'disk')
+    return cache_control(request, HttpResponse(data, content_type='image/jpeg'), etag)
+
+
+@require_safe
+def thumbnail_stats(request):
+    return JsonResponse(thumbnails().metrics())
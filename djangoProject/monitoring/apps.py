@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+from .metrics import time_query
+
+
+def watch_queries(sender, connection, **kwargs):
+    # Every connection, in whatever thread it is opened, so sync views count under ASGI too.
+    # The same connection object connects again after it was closed, the wrapper stays.
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class MonitoringConfig(AppConfig):
+    name = 'monitoring'
+
+    def ready(self):
+        connection_created.connect(watch_queries)
@@ -0,0 +1,125 @@
+"""
+Measures what MetricsMiddleware adds to a request:
+
+    python manage.py bench_metrics --requests 500 --rounds 10
+
+Sends the same requests through Django with the test client without the middleware, with
+it, and with it profiling --sample-rate of the requests, alternating between the three for
+--rounds rounds so they see the same machine. Prints the best round's time per request and
+the overhead. The endpoints are a page of the ToDo API (SQL) against a throwaway SQLite file
+and a gallery thumbnail served from memory, the cheapest request there is, where the same
+overhead weighs the most. On a noisy machine the difference between whole requests can be
+smaller than the noise, the same setup is timed twice to show it, and the middleware is
+also timed alone around a view doing nothing.
+
+Profiling costs little on average but a lot per profiled request, so with a low rate the
+profiling row mostly shows how many profiled requests the best round happened to get. Every
+request is also profiled for a while to measure that cost, and the overhead the rate should
+add on average is printed below the rows, with the noise they can be read against.
+"""
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, override_settings
+
+from gallery import views as gallery_views
+from todo.models import Task, TaskListState
+
+from ...metrics import REGISTRY
+from ...middleware import MetricsMiddleware
+
+MIDDLEWARE = settings.MIDDLEWARE + ['monitoring.middleware.MetricsMiddleware']
+
+
+def client(middleware, **metrics_settings):
+    """A test client whose handler loaded middleware, it keeps it after the settings are restored."""
+    with override_settings(MIDDLEWARE=middleware, **metrics_settings):
+        test_client = Client(SERVER_NAME='localhost')
+        test_client.handler.load_middleware()
+    return test_client
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the overhead of the metrics middleware.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='per endpoint, round and setup')
+        parser.add_argument('--rounds', type=int, default=10)
+        parser.add_argument('--sample-rate', type=float, default=0.01)
+
+    def handle(self, *args, **options):
+        from PIL import Image
+
+        with tempfile.TemporaryDirectory() as tmp:
+            connection.close()
+            connection.settings_dict['NAME'] = os.path.join(tmp, 'metrics.sqlite3')
+            call_command('migrate', 'todo', verbosity=0)
+            Task.objects.bulk_create(Task(text=f'Task {i}') for i in range(1000))
+            TaskListState.touch()
+            Image.new('RGB', (800, 600)).save(os.path.join(tmp, 'image.png'))
+            self.bench_middleware(options['requests'] * options['rounds'])
+
+            with override_settings(GALLERY_ROOT=tmp, GALLERY_THUMBNAIL_DIR=os.path.join(tmp, 'thumbnails'),
+                                   METRICS_PROFILE_DIR=os.path.join(tmp, 'profiles')):
+                gallery_views._thumbnails.clear()
+                clients = {
+                    'without': client(settings.MIDDLEWARE),
+                    # The same again: how far apart two identical setups are is the noise
+                    'without, again': client(settings.MIDDLEWARE),
+                    'with metrics': client(MIDDLEWARE, METRICS_PROFILE_SAMPLE_RATE=0),
+                    f'profiling {options["sample_rate"]:.0%}': client(
+                        MIDDLEWARE, METRICS_PROFILE_SAMPLE_RATE=options['sample_rate'],
+                        METRICS_PROFILE_SLOW_SECONDS=3600),
+                }
+                profiled = client(MIDDLEWARE, METRICS_PROFILE_SAMPLE_RATE=1, METRICS_PROFILE_SLOW_SECONDS=3600)
+                for path in ('/api/tasks', '/gallery/thumbnail/256/image.png'):
+                    noise = self.bench(path, clients, options['requests'], options['rounds'])
+                    self.bench_profiled(path, clients['with metrics'], profiled, options['requests'],
+                                        options['sample_rate'], noise)
+            REGISTRY.clear()
+
+    def bench_middleware(self, requests):
+        request = RequestFactory().get('/api/tasks')
+        response = HttpResponse(b'{}', content_type='application/json')
+        middleware = MetricsMiddleware(lambda request: response)
+        started = time.perf_counter()
+        for _ in range(requests):
+            middleware(request)
+        self.stdout.write(f'middleware alone: {(time.perf_counter() - started) / requests * 10 ** 6:.1f} us/request')
+
+    def bench_profiled(self, path, unprofiled, profiled, requests, sample_rate, noise):
+        times = []
+        for test_client in (unprofiled, profiled):
+            started = time.perf_counter()
+            for _ in range(requests):
+                test_client.get(path)
+            times.append((time.perf_counter() - started) / requests)
+        factor = times[1] / times[0]
+        self.stdout.write(f'  a profiled request takes {factor:.1f}x as long, profiling {sample_rate:.0%} should add '
+                          f'about {sample_rate * (factor - 1) * 100:+.1f}% on average')
+        self.stdout.write(f'  the rows above are within the noise when less than {noise * 100:.1f}% apart')
+
+    def bench(self, path, clients, requests, rounds):
+        times = {name: [] for name in clients}
+        names = list(clients)
+        for round in range(rounds):
+            # Each setup goes first as often as the others, the first of a round tends to be slower
+            for name in names[round % len(names):] + names[:round % len(names)]:
+                test_client = clients[name]
+                started = time.perf_counter()
+                for _ in range(requests):
+                    test_client.get(path)
+                times[name].append((time.perf_counter() - started) / requests)
+        # The best round is the one the rest of the machine disturbed the least
+        baseline = min(times['without'])
+        self.stdout.write(f'\n{path}')
+        for name, name_times in times.items():
+            best = min(name_times)
+            self.stdout.write(f'  {name:18} {best * 10 ** 6:8.0f} us/request {(best / baseline - 1) * 100:+6.1f}%')
+        return abs(min(times['without, again']) / baseline - 1)
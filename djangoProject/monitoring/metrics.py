@@ -0,0 +1,140 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds of the histogram buckets, Prometheus' le
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+BYTES = (100, 1000, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8)
+
+# The RequestStats of the request being measured, None outside MetricsMiddleware
+current = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """What one request did, filled in while it runs."""
+    __slots__ = ('queries', 'sql_time', 'cache_lookups')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.cache_lookups = []
+
+
+def time_query(execute, sql, params, many, context):
+    """The execute wrapper of every connection, counts and times the query for the request being measured.
+
+    The request is found through current, which asgiref copies into the threads that run sync
+    code for async requests, so this works for WSGI, sync views under ASGI and the ORM calls
+    of async views alike. Outside a measured request it costs a ContextVar lookup.
+    """
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_time += time.perf_counter() - started
+        stats.queries += 1
+
+
+def record_cache(cache, hit):
+    """Counts a lookup in one of the app's caches towards the request being measured, if any."""
+    stats = current.get()
+    if stats is not None:
+        stats.cache_lookups.append((cache, hit))
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> [count per bucket (not cumulative) and one for +Inf, sum]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self, label_names):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self.series.items()):
+            labels = format_labels(label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.series = {}
+
+    def inc(self, labels):
+        self.series[labels] = self.series.get(labels, 0) + 1
+
+    def render(self, label_names):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{{{format_labels(label_names, labels)}}} {value}')
+        return lines
+
+
+def format_labels(names, values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Registry:
+    """The metrics of this process, updated under one lock taken once per request.
+
+    Each worker process of the server has its own; Prometheus adds them up when it scrapes
+    every worker, or a multiprocess-aware exporter has to collect them.
+    """
+    REQUEST_LABELS = ('view', 'method', 'status')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.duration = Histogram('django_request_duration_seconds', 'Time spent in the view.', SECONDS)
+            self.queries = Histogram('django_request_sql_queries', 'SQL queries per request.', QUERIES)
+            self.sql_duration = Histogram('django_request_sql_duration_seconds', 'Time spent in SQL per request.',
+                                          SECONDS)
+            self.size = Histogram('django_response_size_bytes', 'Response body size.', BYTES)
+            self.cache_lookups = Counter('django_cache_lookups_total', 'Cache lookups by cache and result.')
+
+    def record(self, labels, duration, stats, size):
+        with self.lock:
+            self.duration.observe(labels, duration)
+            self.queries.observe(labels, stats.queries)
+            self.sql_duration.observe(labels, stats.sql_time)
+            if size is not None:
+                self.size.observe(labels, size)
+            for cache, hit in stats.cache_lookups:
+                self.cache_lookups.inc((cache, 'hit' if hit else 'miss'))
+
+    def render(self):
+        """The Prometheus text exposition format."""
+        with self.lock:
+            lines = []
+            for histogram in (self.duration, self.queries, self.sql_duration, self.size):
+                lines += histogram.render(self.REQUEST_LABELS)
+            lines += self.cache_lookups.render(('cache', 'result'))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
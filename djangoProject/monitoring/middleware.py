@@ -0,0 +1,112 @@
+import cProfile
+import os
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .metrics import REGISTRY, RequestStats, current
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unresolved'
+
+
+def response_size(response):
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    if response.streaming:
+        # Unknown without reading it
+        return None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """Times every request and counts its SQL queries, cache lookups and response bytes.
+
+    The numbers go to the histograms served at /metrics, labelled by view, method and status.
+    Put it last in MIDDLEWARE to time the view alone, first to include the other middleware.
+    METRICS_PROFILE_SAMPLE_RATE of the requests run under cProfile and the ones slower than
+    METRICS_PROFILE_SLOW_SECONDS leave a .prof file in METRICS_PROFILE_DIR, open it with
+    `python -m pstats` or snakeviz. Queries are counted by metrics.time_query, installed on
+    every connection by the app, WSGI or ASGI. Under ASGI the profiler runs in the thread
+    Django gives the request's sync code (sync views and middleware, the ORM of async
+    views); what async views do on the event loop itself isn't profiled.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.sample_rate = settings.METRICS_PROFILE_SAMPLE_RATE
+        self.slow = settings.METRICS_PROFILE_SLOW_SECONDS
+        self.profile_dir = str(settings.METRICS_PROFILE_DIR)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current.set(stats)
+        profiler = self.start_profiler() if self.sampled() else None
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - started
+            current.reset(token)
+            if profiler is not None:
+                profiler.disable()
+        self.record(request, response, stats, duration)
+        if profiler is not None and duration >= self.slow:
+            self.dump(profiler, request, duration)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current.set(stats)
+        profiler = None
+        if self.sampled():
+            # Thread sensitive: the thread Django runs this request's sync views in
+            profiler = await sync_to_async(self.start_profiler)()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            duration = time.perf_counter() - started
+            current.reset(token)
+            if profiler is not None:
+                await sync_to_async(profiler.disable)()
+        self.record(request, response, stats, duration)
+        if profiler is not None and duration >= self.slow:
+            self.dump(profiler, request, duration)
+        return response
+
+    def record(self, request, response, stats, duration):
+        if response.status_code == 304:
+            stats.cache_lookups.append(('http', True))
+        elif 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META:
+            stats.cache_lookups.append(('http', False))
+        labels = (view_name(request), request.method, response.status_code)
+        REGISTRY.record(labels, duration, stats, response_size(response))
+
+    def sampled(self):
+        return self.sample_rate and random.random() < self.sample_rate
+
+    def start_profiler(self):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another thread's request is being profiled and Python allows one profiler at a time
+            return None
+        return profiler
+
+    def dump(self, profiler, request, duration):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{view_name(request).replace(":", "-")}-{duration * 1000:.0f}ms.prof'
+        profiler.dump_stats(os.path.join(self.profile_dir, name))
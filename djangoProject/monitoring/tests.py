@@ -0,0 +1,130 @@
+import os
+import pstats
+import re
+import tempfile
+
+from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import views
+from .metrics import REGISTRY, Histogram, RequestStats, current, record_cache
+
+MIDDLEWARE = settings.MIDDLEWARE + ['monitoring.middleware.MetricsMiddleware']
+
+
+def sample(text, line):
+    """The value of a metric line of /metrics, e.g. 'django_request_sql_queries_count{view="todo:tasks",...}'."""
+    match = re.search(rf'^{re.escape(line)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+class HistogramTests(SimpleTestCase):
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram('latency_seconds', 'Latency.', (0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(('a"b',), value)
+        self.assertEqual(histogram.render(('view',)), [
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{view="a\\"b",le="0.1"} 2',
+            'latency_seconds_bucket{view="a\\"b",le="1"} 3',
+            'latency_seconds_bucket{view="a\\"b",le="+Inf"} 4',
+            'latency_seconds_sum{view="a\\"b"} 3.65',
+            'latency_seconds_count{view="a\\"b"} 4',
+        ])
+
+    def test_cache_lookups_only_count_inside_a_request(self):
+        record_cache('thumbnail_memory', True)
+        stats = RequestStats()
+        token = current.set(stats)
+        record_cache('thumbnail_memory', False)
+        current.reset(token)
+        self.assertEqual(stats.cache_lookups, [('thumbnail_memory', False)])
+
+
+class MetricsViewTests(SimpleTestCase):
+    def test_not_routed_unless_enabled(self):
+        self.assertFalse(settings.METRICS_ENABLED)
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'], METRICS_TOKEN='')
+    def test_only_allowed_addresses(self):
+        factory = RequestFactory()
+        self.assertEqual(views.metrics(factory.get('/metrics', REMOTE_ADDR='10.0.0.1')).status_code, 200)
+        self.assertEqual(views.metrics(factory.get('/metrics', REMOTE_ADDR='10.0.0.2')).status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='secret')
+    def test_or_a_token(self):
+        factory = RequestFactory()
+        self.assertEqual(views.metrics(factory.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')).status_code, 200)
+        self.assertEqual(views.metrics(factory.get('/metrics', HTTP_AUTHORIZATION='Bearer guess')).status_code, 403)
+        self.assertEqual(views.metrics(factory.get('/metrics')).status_code, 403)
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE)
+class MetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        REGISTRY.clear()
+        self.addCleanup(REGISTRY.clear)
+
+    def metrics(self):
+        # /metrics is only routed with METRICS_ENABLED, decided when the URLs are loaded
+        response = views.metrics(RequestFactory().get('/metrics'))
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_records_view_sql_and_size(self):
+        self.client.post('/api/tasks', '[{"text": "a"}, {"text": "b"}]', content_type='application/json')
+        response = self.client.get('/api/tasks')
+        text = self.metrics()
+        labels = '{view="todo:tasks",method="GET",status="200"}'
+        self.assertEqual(sample(text, f'django_request_duration_seconds_count{labels}'), 1)
+        # The list state, the page and its tags
+        self.assertEqual(sample(text, f'django_request_sql_queries_sum{labels}'), 3)
+        self.assertGreater(sample(text, f'django_request_sql_duration_seconds_sum{labels}'), 0)
+        self.assertEqual(sample(text, f'django_response_size_bytes_sum{labels}'), len(response.content))
+        self.assertEqual(sample(text, 'django_request_duration_seconds_count'
+                                      '{view="todo:tasks",method="POST",status="201"}'), 1)
+
+    def test_conditional_gets_count_as_cache_lookups(self):
+        etag = self.client.get('/api/tasks')['ETag']
+        self.client.get('/api/tasks', HTTP_IF_NONE_MATCH=etag)
+        self.client.post('/api/tasks', '{"text": "a"}', content_type='application/json')
+        self.client.get('/api/tasks', HTTP_IF_NONE_MATCH=etag)
+        text = self.metrics()
+        self.assertEqual(sample(text, 'django_cache_lookups_total{cache="http",result="hit"}'), 1)
+        self.assertEqual(sample(text, 'django_cache_lookups_total{cache="http",result="miss"}'), 1)
+
+    async def test_async_views_are_timed(self):
+        await self.async_client.get('/download_images/00000000-0000-0000-0000-000000000000')
+        text = REGISTRY.render()
+        labels = '{view="downloads:job_status",method="GET",status="404"}'
+        self.assertEqual(sample(text, f'django_request_duration_seconds_count{labels}'), 1)
+        # The job lookup, run by the ORM in a thread
+        self.assertEqual(sample(text, f'django_request_sql_queries_sum{labels}'), 1)
+
+    async def test_sync_views_under_asgi_count_queries(self):
+        await self.async_client.get('/api/tasks')
+        text = REGISTRY.render()
+        labels = '{view="todo:tasks",method="GET",status="200"}'
+        self.assertGreater(sample(text, f'django_request_sql_queries_sum{labels}'), 0)
+        self.assertGreater(sample(text, f'django_request_sql_duration_seconds_sum{labels}'), 0)
+
+    def test_slow_sampled_requests_are_profiled(self):
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with self.settings(METRICS_PROFILE_SAMPLE_RATE=1, METRICS_PROFILE_SLOW_SECONDS=0,
+                               METRICS_PROFILE_DIR=profile_dir):
+                self.client.get('/api/tasks')
+            profiles = os.listdir(profile_dir)
+            self.assertEqual(len(profiles), 1)
+            self.assertIn('todo-tasks', profiles[0])
+            self.assertTrue(profiles[0].endswith('.prof'))
+
+    async def test_sync_views_under_asgi_are_profiled(self):
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with self.settings(METRICS_PROFILE_SAMPLE_RATE=1, METRICS_PROFILE_SLOW_SECONDS=0,
+                               METRICS_PROFILE_DIR=profile_dir):
+                await self.async_client.get('/api/tasks')
+            [profile] = os.listdir(profile_dir)
+            functions = pstats.Stats(os.path.join(profile_dir, profile)).stats
+            self.assertIn('tasks', {name for filename, line, name in functions if filename.endswith('views.py')})
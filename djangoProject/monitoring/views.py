@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from .metrics import REGISTRY
+
+
+def allowed(request):
+    """From one of METRICS_ALLOWED_IPS or with the METRICS_TOKEN bearer token, when one is set."""
+    token = settings.METRICS_TOKEN
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+@require_GET
+def metrics(request):
+    """Prometheus' text format of what MetricsMiddleware measured in this process."""
+    if not allowed(request):
+        # The view names and timings tell how the site is built
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
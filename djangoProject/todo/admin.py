@@ -0,0 +1,30 @@
+from django.contrib import admin
+
+from .models import Task, TaskListState, TaskTag
+
+
+class TaskTagInline(admin.TabularInline):
+    model = TaskTag
+    extra = 0
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('text', 'priority', 'due', 'done', 'created')
+    list_filter = ('done', 'priority')
+    search_fields = ('text',)
+    inlines = [TaskTagInline]
+
+    # The admin writes in a transaction like the API, the list version is bumped in it too
+    def save_related(self, request, form, formsets, change):
+        # After the task and its tags, for adds and changes alike
+        super().save_related(request, form, formsets, change)
+        TaskListState.touch()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        TaskListState.touch()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        TaskListState.touch()
@@ -0,0 +1,231 @@
+"""
+Load test of the ToDo API against SQLite with a million tasks:
+
+    python manage.py bench_todo_api --rows 1000000 --concurrency 1,4 --seconds 10
+
+Fills a throwaway SQLite file (--database keeps it, and reuses it next time), then runs
+every scenario with N client processes for --seconds each and reports requests per
+second and latency percentiles. By default the requests go through Django in the client
+processes with the test client, so this measures the views, the ORM and SQLite without
+a web server; with --url they go to a running server over HTTP instead. For comparison
+it also times the OFFSET query the keyset pagination replaces.
+"""
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import date, timedelta
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...models import Task, TaskListState, TaskTag
+from ...views import encode_cursor
+
+BATCH = 5000
+TAGS = [f'tag{i}' for i in range(100)]
+
+
+def use_database(path):
+    connection.close()
+    connection.settings_dict['NAME'] = path
+
+
+def fill(rows):
+    rng = random.Random(0)
+    today = date.today()
+    next_id = 1
+    for start in range(0, rows, BATCH):
+        tasks = []
+        tags = []
+        for task_id in range(next_id, next_id + min(BATCH, rows - start)):
+            due = today + timedelta(days=rng.randint(-30, 700)) if rng.random() < 0.7 else None
+            tasks.append(Task(id=task_id, text=f'Task {task_id}', priority=rng.randint(1, 5), due=due,
+                              done=rng.random() < 0.3))
+            tags += [TaskTag(task_id=task_id, name=name) for name in rng.sample(TAGS, rng.randint(0, 2))]
+        Task.objects.bulk_create(tasks)
+        TaskTag.objects.bulk_create(tags)
+        next_id += len(tasks)
+    TaskListState.touch()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+class LocalClient:
+    def __init__(self):
+        from django.test import Client
+        # Errors are counted, not raised
+        self.client = Client(SERVER_NAME='localhost', raise_request_exception=False)
+
+    def request(self, method, path, body=None, headers=None):
+        headers = {f'HTTP_{name.upper().replace("-", "_")}': value for name, value in (headers or {}).items()}
+        if method == 'GET':
+            response = self.client.get(path, **headers)
+        else:
+            response = self.client.post(path, json.dumps(body), content_type='application/json', **headers)
+        return response.status_code, response.content, response.headers
+
+
+class RemoteClient:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def request(self, method, path, body=None, headers=None):
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(self.url + path, data, dict(headers or {}, **{
+            'Content-Type': 'application/json'}), method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers
+
+
+def scenarios(client, rows, rng):
+    """name -> function making one request and returning the HTTP status."""
+    etag = client.request('GET', '/api/tasks')[2]['ETag']
+    today = date.today()
+    created = []
+
+    def get(path, **headers):
+        return lambda: client.request('GET', path, headers=headers)[0]
+
+    def page_at_random_id():
+        # Anywhere in the table costs the same as the first page
+        return client.request('GET', f'/api/tasks?cursor={encode_cursor([rng.randint(1, rows)])}')[0]
+
+    def open_tasks_by_due_date():
+        cursor = encode_cursor([(today + timedelta(days=rng.randint(-30, 700))).isoformat(), rng.randint(1, rows)])
+        return client.request('GET', f'/api/tasks?order=due&done=false&cursor={cursor}')[0]
+
+    def bulk_create():
+        status, body, _ = client.request('POST', '/api/tasks', [
+            {'text': 'Benchmark task', 'priority': rng.randint(1, 5), 'tags': [rng.choice(TAGS)]}
+            for _ in range(100)])
+        created.extend(task['id'] for task in json.loads(body)['tasks'])
+        return status
+
+    def bulk_delete():
+        if not created:
+            bulk_create()
+        ids = created[:100]
+        del created[:100]
+        return client.request('POST', '/api/tasks/delete', {'ids': ids})[0]
+
+    return {
+        'first page': get('/api/tasks'),
+        'page at a random id': page_at_random_id,
+        'open tasks by due date': open_tasks_by_due_date,
+        'tagged': get('/api/tasks?tag=tag7'),
+        'not modified (304)': get('/api/tasks', **{'If-None-Match': etag}),
+        'bulk create 100': bulk_create,
+        'bulk delete 100': bulk_delete,
+    }
+
+
+SCENARIOS = ['first page', 'page at a random id', 'open tasks by due date', 'tagged', 'not modified (304)',
+             'bulk create 100', 'bulk delete 100']
+
+
+def run_client(path, url, rows, scenario, seconds, ready, results):
+    django.setup()
+    if url:
+        client = RemoteClient(url)
+    else:
+        use_database(path)
+        client = LocalClient()
+    requests = scenarios(client, rows, random.Random(os.getpid()))
+    if scenario == 'bulk delete 100':
+        # Deletes what it created beforehand, not the tasks the other scenarios read
+        for _ in range(int(seconds * 20)):
+            requests['bulk create 100']()
+    make_request = requests[scenario]
+    latencies = []
+    errors = 0
+    ready.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        status = make_request()
+        latencies.append(time.perf_counter() - started)
+        errors += status >= 400
+    results.put((latencies, errors))
+    connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Load test the ToDo API against SQLite.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--concurrency', default='1,4', help='comma separated numbers of client processes')
+        parser.add_argument('--seconds', type=float, default=10, help='per scenario and concurrency')
+        parser.add_argument('--database', help='SQLite file to fill, or to reuse when it is already filled')
+        parser.add_argument('--url', help='base URL of a running server using that database instead')
+        parser.add_argument('--scenarios', help='comma separated names, all by default')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = options['database'] or os.path.join(tmp, 'todo.sqlite3')
+            self.prepare(path, options['rows'])
+            self.compare_offset(options['rows'])
+            connection.close()
+            names = SCENARIOS
+            if options['scenarios']:
+                names = [name for name in names if name in options['scenarios'].split(',')]
+
+            self.stdout.write(f'\n{"scenario":26} {"clients":>7} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} '
+                              f'{"errors":>6}')
+            for name in names:
+                for clients in [int(n) for n in options['concurrency'].split(',')]:
+                    self.run_scenario(path, options, name, clients)
+
+    def prepare(self, path, rows):
+        use_database(path)
+        call_command('migrate', 'todo', verbosity=0)
+        count = Task.objects.count()
+        if count < rows:
+            self.stdout.write(f'Filling {path} with {rows - count} tasks...')
+            started = time.perf_counter()
+            Task.objects.all().delete()
+            fill(rows)
+            self.stdout.write(f'  {rows / (time.perf_counter() - started):.0f} rows/s, '
+                              f'{os.path.getsize(path) / 2 ** 20:.0f} MB')
+
+    def compare_offset(self, rows):
+        for label, page in (('OFFSET', lambda: list(Task.objects.order_by('id')[rows * 9 // 10:][:50])),
+                            ('keyset', lambda: list(Task.objects.filter(id__gt=rows * 9 // 10).order_by('id')[:50]))):
+            times = []
+            for _ in range(5):
+                started = time.perf_counter()
+                page()
+                times.append(time.perf_counter() - started)
+            self.stdout.write(f'{label:6} page at 90% of the table: {statistics.median(times) * 1000:8.2f} ms')
+
+    def run_scenario(self, path, options, name, clients):
+        # Everyone starts once all clients are set up
+        ready = multiprocessing.Barrier(clients + 1)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=run_client, args=(
+            path, options['url'], options['rows'], name, options['seconds'], ready, results)) for _ in range(clients)]
+        for process in processes:
+            process.start()
+        ready.wait()
+        latencies = []
+        errors = 0
+        for _ in processes:
+            process_latencies, process_errors = results.get()
+            latencies += process_latencies
+            errors += process_errors
+        for process in processes:
+            process.join()
+        p50, p99 = (statistics.quantiles(latencies, n=100)[i] * 1000 for i in (49, 98))
+        self.stdout.write(f'{name:26} {clients:7d} {len(latencies) / options["seconds"]:8.0f} {p50:8.2f} '
+                          f'{p99:8.2f} {errors:6d}')
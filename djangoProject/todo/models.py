@@ -0,0 +1,74 @@
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+
+class Task(models.Model):
+    PRIORITIES = range(1, 6)
+    DEFAULT_PRIORITY = 3
+
+    text = models.CharField(max_length=500)
+    # 1 is the most urgent, like in the ToDo List app
+    priority = models.PositiveSmallIntegerField(default=DEFAULT_PRIORITY)
+    due = models.DateField(null=True, blank=True)
+    done = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # One per ordering of the list endpoint, the id breaks ties and is the rest of the cursor
+        indexes = [
+            models.Index(fields=['priority', 'id'], name='task_priority_idx'),
+            # Also serves done=false ORDER BY due: SQLite prefers it to a (done, due, id) index, which
+            # only pays off when most tasks are done
+            models.Index(fields=['due', 'id'], name='task_due_idx'),
+        ]
+
+    def __str__(self):
+        return self.text
+
+    def as_dict(self, tags=None):
+        return {
+            'id': self.pk,
+            'text': self.text,
+            'priority': self.priority,
+            'due': self.due.isoformat() if self.due else None,
+            'done': self.done,
+            'tags': [tag.name for tag in self.tags.all()] if tags is None else tags,
+            'created': self.created.isoformat(),
+            'updated': self.updated.isoformat(),
+        }
+
+
+class TaskTag(models.Model):
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='tags')
+    name = models.CharField(max_length=50)
+
+    class Meta:
+        constraints = [
+            # Also the index of ?tag=: name = %s ORDER BY task_id
+            models.UniqueConstraint(fields=['name', 'task'], name='tasktag_name_task_uniq'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class TaskListState(models.Model):
+    """One row, bumped in the same transaction as every change to the tasks.
+
+    Conditional GETs of the list compare against it, so answering 304 costs one primary
+    key lookup instead of running the list query. The API views and TaskAdmin call touch();
+    other code changing tasks or tags has to as well, or clients keep getting 304s.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.get_or_create(pk=1)[0]
+
+    @classmethod
+    def touch(cls):
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1, modified=timezone.now()):
+            cls.objects.create(pk=1, version=1)
@@ -0,0 +1,159 @@
+import json
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from .models import Task
+from .views import after, encode_cursor, task_filter, ordering
+
+
+class TaskApiTestMixin:
+    def post(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def create(self, tasks):
+        response = self.post('/api/tasks', tasks)
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['tasks']
+
+    def walk(self, params):
+        """Every task of a listing, following next links."""
+        tasks = []
+        url = '/api/tasks'
+        while url:
+            page = self.client.get(url, params).json()
+            params = None
+            tasks += page['tasks']
+            url = page['next']
+        return tasks
+
+
+@override_settings(TODO_PAGE_SIZE=3)
+class TaskListTests(TaskApiTestMixin, TestCase):
+    def setUp(self):
+        self.tasks = self.create([
+            {'text': 'Pay rent', 'priority': 1, 'due': '2024-05-01', 'tags': ['Home', 'money']},
+            {'text': 'Buy milk', 'tags': ['home']},
+            {'text': 'File taxes', 'priority': 1, 'due': '2024-04-15', 'tags': ['money']},
+            {'text': 'Call mum', 'priority': 2, 'due': '2024-05-01', 'done': True},
+            {'text': 'Fix bike', 'priority': 5},
+            {'text': 'Book dentist', 'priority': 2, 'due': '2024-06-01'},
+            {'text': 'Water plants', 'due': '2024-04-15', 'tags': ['home']},
+        ])
+
+    def texts(self, params):
+        return [task['text'] for task in self.walk(params)]
+
+    def test_bulk_create(self):
+        self.assertEqual(self.tasks[0]['tags'], ['home', 'money'])
+        self.assertEqual(self.tasks[1]['priority'], Task.DEFAULT_PRIORITY)
+        self.assertEqual(Task.objects.count(), 7)
+
+    def test_invalid_task_creates_nothing(self):
+        response = self.post('/api/tasks', [{'text': 'fine'}, {'text': 'bad', 'priority': 9}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('priority', response.json()['error'])
+        self.assertEqual(Task.objects.count(), 7)
+
+    def test_pages_follow_every_ordering(self):
+        self.assertEqual(len(self.texts({})), 7)
+        self.assertEqual(self.texts({'order': 'priority'}), ['Pay rent', 'File taxes', 'Call mum', 'Book dentist',
+                                                             'Buy milk', 'Water plants', 'Fix bike'])
+        self.assertEqual(self.texts({'order': 'due'}), ['File taxes', 'Water plants', 'Pay rent', 'Call mum',
+                                                        'Book dentist'])
+
+    def test_filters(self):
+        self.assertEqual(self.texts({'tag': 'HOME'}), ['Pay rent', 'Buy milk', 'Water plants'])
+        self.assertEqual(self.texts({'done': 'false', 'order': 'due', 'due_before': '2024-05-02'}),
+                         ['File taxes', 'Water plants', 'Pay rent'])
+        self.assertEqual(self.texts({'priority': '2'}), ['Call mum', 'Book dentist'])
+
+    def test_bad_parameters(self):
+        cursor = encode_cursor([5, 5])
+        for params in ({'cursor': 'nonsense'}, {'cursor': cursor, 'order': 'due'}, {'order': 'text'},
+                       {'done': 'maybe'}, {'due_after': 'May'}):
+            self.assertEqual(self.client.get('/api/tasks', params).status_code, 400, params)
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get('/api/tasks')
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tasks', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/tasks', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        self.post('/api/tasks/delete', {'ids': [self.tasks[0]['id']]})
+        response = self.client.get('/api/tasks', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_admin_changes_are_not_cached(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser('admin'))
+        task = self.tasks[0]
+        etag = self.client.get('/api/tasks')['ETag']
+        response = self.client.post(f'/admin/todo/task/{task["id"]}/change/', {
+            'text': 'Changed in the admin', 'priority': task['priority'], 'due': '',
+            'tags-TOTAL_FORMS': 0, 'tags-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get('/api/tasks', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Changed in the admin', [task['text'] for task in response.json()['tasks']])
+
+        etag = response['ETag']
+        self.client.post('/admin/todo/task/', {'action': 'delete_selected', '_selected_action': [task['id']],
+                                               'post': 'yes'})
+        self.assertEqual(self.client.get('/api/tasks', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bulk_delete(self):
+        ids = [task['id'] for task in self.tasks[:3]]
+        response = self.post('/api/tasks/delete', {'ids': ids + [12345]})
+        self.assertEqual(response.json(), {'deleted': 3})
+        self.assertEqual(self.texts({'tag': 'money'}), [])
+        self.assertEqual(self.post('/api/tasks/delete', {'ids': 'all'}).status_code, 400)
+
+    def test_list_queries_use_the_indexes(self):
+        plans = {
+            'USING INDEX task_priority_idx': {'order': 'priority'},
+            'USING INDEX task_due_idx': {'order': 'due'},
+            'todo_tasktag USING COVERING INDEX': {'tag': 'home'},
+        }
+        for expected, params in plans.items():
+            fields = ordering(params)
+            cursor = ['2024-05-01' if field == 'due' else 1 for field in fields]
+            tasks = Task.objects.filter(task_filter(params) & after(fields, cursor)).order_by(*fields)
+            sql, sql_params = tasks[:10].query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', sql_params)
+                plan = ' '.join(str(row) for row in cursor.fetchall())
+            self.assertIn(expected, plan)
+            self.assertNotIn('TEMP B-TREE', plan, params)
+
+
+class TaskDetailTests(TaskApiTestMixin, TestCase):
+    def setUp(self):
+        self.task = self.post('/api/tasks', {'text': 'Pay rent', 'tags': ['home']}).json()
+        self.url = f'/api/tasks/{self.task["id"]}'
+
+    def test_update(self):
+        response = self.client.patch(self.url, json.dumps({'done': True, 'tags': ['money']}),
+                                     content_type='application/json')
+        self.assertEqual(response.json()['tags'], ['money'])
+        task = self.client.get(self.url).json()
+        self.assertTrue(task['done'])
+        self.assertEqual(task['text'], 'Pay rent')
+
+    def test_conditional_get_and_update(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.patch(self.url, json.dumps({'priority': 1}), content_type='application/json')
+        response = self.client.patch(self.url, json.dumps({'priority': 2}), content_type='application/json',
+                                     HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+
+    def test_delete(self):
+        self.assertEqual(self.client.delete(self.url).json(), {'deleted': 1})
+        self.assertEqual(self.client.get(self.url).status_code, 404)
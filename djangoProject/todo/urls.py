@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'todo'
+
+urlpatterns = [
+    path('api/tasks', views.tasks, name='tasks'),
+    path('api/tasks/delete', views.delete_tasks, name='delete_tasks'),
+    path('api/tasks/<int:task_id>', views.task_detail, name='task'),
+]
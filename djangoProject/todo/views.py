@@ -0,0 +1,271 @@
+import base64
+import json
+from datetime import date
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_http_methods, require_POST
+
+from .models import Task, TaskListState, TaskTag
+
+# ?order= -> ORDER BY, all of them end with the id so the cursor is unique
+ORDERINGS = {
+    'id': ('id',),
+    'priority': ('priority', 'id'),
+    'due': ('due', 'id'),
+}
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def parse_bool(value):
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'{value!r} is not true or false')
+
+
+def parse_body(request):
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        raise ValueError('the body must be JSON')
+
+
+def task_from_json(data, task=None):
+    """Applies a JSON object to task (a new one by default), returns (task, tags or None)."""
+    if not isinstance(data, dict):
+        raise ValueError('a task must be an object')
+    task = task or Task()
+    if task.pk is None or 'text' in data:
+        text = data.get('text')
+        if not isinstance(text, str) or not text.strip() or len(text) > 500:
+            raise ValueError('text must be 1 to 500 characters')
+        task.text = text.strip()
+    if 'priority' in data:
+        if data['priority'] not in Task.PRIORITIES or isinstance(data['priority'], bool):
+            raise ValueError(f'priority must be {Task.PRIORITIES[0]} to {Task.PRIORITIES[-1]}')
+        task.priority = data['priority']
+    if 'due' in data:
+        try:
+            task.due = date.fromisoformat(data['due']) if data['due'] is not None else None
+        except (TypeError, ValueError):
+            raise ValueError('due must be a YYYY-MM-DD date or null')
+    if 'done' in data:
+        if not isinstance(data['done'], bool):
+            raise ValueError('done must be true or false')
+        task.done = data['done']
+    tags = None
+    if 'tags' in data:
+        if not isinstance(data['tags'], list) or not all(isinstance(tag, str) for tag in data['tags']):
+            raise ValueError('tags must be a list of strings')
+        tags = list(dict.fromkeys(tag.strip().lower() for tag in data['tags'] if tag.strip()))
+        if any(len(tag) > 50 for tag in tags):
+            raise ValueError('tags are at most 50 characters')
+    return task, tags
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, count):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != count:
+        raise ValueError('invalid cursor')
+    return values
+
+
+def after(fields, values):
+    """WHERE (fields) > (values), written so the leading column is a range the index can seek to."""
+    where = Q(**{f'{fields[-1]}__gt': values[-1]})
+    for field, value in zip(reversed(fields[:-1]), reversed(values[:-1])):
+        where = Q(**{f'{field}__gt': value}) | Q(where, **{field: value})
+    if len(fields) > 1:
+        where &= Q(**{f'{fields[0]}__gte': values[0]})
+    return where
+
+
+def tags_by_task(tasks):
+    """{task id: [tag names]} in one query, prefetch_related costs more than the rest of the page."""
+    tags = {}
+    for task_id, name in TaskTag.objects.filter(task_id__in=[task.pk for task in tasks]).values_list('task_id', 'name'):
+        tags.setdefault(task_id, []).append(name)
+    return tags
+
+
+def list_state(request):
+    if not hasattr(request, 'task_list_state'):
+        request.task_list_state = TaskListState.current()
+    return request.task_list_state
+
+
+def list_etag(request):
+    return f'"{list_state(request).version}"'
+
+
+def list_modified(request):
+    return list_state(request).modified
+
+
+def task_filter(params):
+    where = Q()
+    if 'done' in params:
+        where &= Q(done=parse_bool(params['done']))
+    if 'priority' in params:
+        where &= Q(priority=int(params['priority']))
+    if 'tag' in params:
+        where &= Q(tags__name=params['tag'].strip().lower())
+    if 'due_before' in params:
+        where &= Q(due__lt=date.fromisoformat(params['due_before']))
+    if 'due_after' in params:
+        where &= Q(due__gte=date.fromisoformat(params['due_after']))
+    return where
+
+
+def ordering(params):
+    order = params.get('order', 'id')
+    if order not in ORDERINGS:
+        raise ValueError(f'order must be one of {", ".join(ORDERINGS)}')
+    if order == 'id' and 'tag' in params:
+        # The same order, but read from the (name, task) index of the tag instead of sorting its tasks
+        return ('tags__task',)
+    return ORDERINGS[order]
+
+
+def cursor_value(task, field):
+    if field == 'tags__task':
+        return task.pk
+    if field == 'due':
+        return task.due.isoformat()
+    return getattr(task, field)
+
+
+@condition(etag_func=list_etag, last_modified_func=list_modified)
+def list_tasks(request):
+    """A page of tasks, ?limit= long, after ?cursor= (from the previous page's next)."""
+    params = request.GET
+    try:
+        fields = ordering(params)
+        limit = max(1, min(int(params.get('limit', settings.TODO_PAGE_SIZE)), settings.TODO_MAX_PAGE_SIZE))
+        where = task_filter(params)
+    except ValueError as e:
+        return error(str(e))
+    if 'due' in fields:
+        where &= Q(due__isnull=False)
+    if params.get('cursor'):
+        try:
+            where &= after(fields, decode_cursor(params['cursor'], len(fields)))
+            # Values of the wrong type only fail once they are part of a query
+            Task.objects.filter(where)
+        except (TypeError, ValueError, ValidationError):
+            return error('invalid cursor')
+    # In one filter() so the tag conditions, the cursor and the ORDER BY share one join.
+    # One more than asked for tells whether there is a next page.
+    page = list(Task.objects.filter(where).order_by(*fields)[:limit + 1])
+    next_url = None
+    if len(page) > limit:
+        page = page[:limit]
+        query = params.copy()
+        query['cursor'] = encode_cursor([cursor_value(page[-1], field) for field in fields])
+        next_url = f'{request.path}?{query.urlencode()}'
+    tags = tags_by_task(page)
+    return JsonResponse({'tasks': [task.as_dict(tags.get(task.pk, [])) for task in page], 'next': next_url})
+
+
+def create_tasks(request):
+    """One task object, or a list of up to TODO_MAX_BULK of them created in one transaction."""
+    try:
+        data = parse_body(request)
+        many = isinstance(data, list)
+        if many and len(data) > settings.TODO_MAX_BULK:
+            raise ValueError(f'at most {settings.TODO_MAX_BULK} tasks at once')
+        created = [task_from_json(item) for item in (data if many else [data])]
+    except ValueError as e:
+        return error(str(e))
+    with transaction.atomic():
+        Task.objects.bulk_create([task for task, _ in created])
+        TaskTag.objects.bulk_create(TaskTag(task=task, name=name) for task, tags in created for name in tags or ())
+        TaskListState.touch()
+    payload = [task.as_dict(tags or []) for task, tags in created]
+    return JsonResponse({'tasks': payload} if many else payload[0], status=201)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'HEAD', 'POST'])
+def tasks(request):
+    if request.method == 'POST':
+        return create_tasks(request)
+    return list_tasks(request)
+
+
+@csrf_exempt
+@require_POST
+def delete_tasks(request):
+    """{"ids": [...]}, deleted in one transaction."""
+    try:
+        ids = parse_body(request).get('ids')
+    except (AttributeError, ValueError):
+        ids = None
+    if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        return error('ids must be a list of task ids')
+    if len(ids) > settings.TODO_MAX_BULK:
+        return error(f'at most {settings.TODO_MAX_BULK} tasks at once')
+    with transaction.atomic():
+        _, deleted = Task.objects.filter(pk__in=ids).delete()
+        if deleted:
+            TaskListState.touch()
+    return JsonResponse({'deleted': deleted.get(Task._meta.label, 0)})
+
+
+def get_task(request, task_id):
+    if not hasattr(request, 'task'):
+        request.task = Task.objects.prefetch_related('tags').filter(pk=task_id).first()
+    return request.task
+
+
+def task_etag(request, task_id):
+    task = get_task(request, task_id)
+    return None if task is None else f'"{task.pk}-{task.updated.timestamp():.6f}"'
+
+
+def task_modified(request, task_id):
+    task = get_task(request, task_id)
+    return None if task is None else task.updated
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'HEAD', 'PATCH', 'DELETE'])
+@condition(etag_func=task_etag, last_modified_func=task_modified)
+def task_detail(request, task_id):
+    task = get_task(request, task_id)
+    if task is None:
+        return error('Unknown task', status=404)
+    if request.method == 'DELETE':
+        with transaction.atomic():
+            task.delete()
+            TaskListState.touch()
+        return JsonResponse({'deleted': 1})
+    if request.method == 'PATCH':
+        try:
+            task, tags = task_from_json(parse_body(request), task)
+        except ValueError as e:
+            return error(str(e))
+        with transaction.atomic():
+            task.save()
+            if tags is not None:
+                task.tags.all().delete()
+                TaskTag.objects.bulk_create(TaskTag(task=task, name=name) for name in tags)
+            TaskListState.touch()
+        return JsonResponse(task.as_dict(tags))
+    return JsonResponse(task.as_dict())
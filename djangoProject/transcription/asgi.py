@@ -0,0 +1,122 @@
+"""
+WebSocket transcription, served next to the Django views by djangoProject.asgi:
+
+    ws://host/ws/transcribe/?rate=16000
+
+The client sends 16 bit little endian mono PCM at rate (8000-48000, 16000 by default) as
+binary messages of any length and {"type": "end"} as text when it is done. The server sends
+    {"type": "partial", "text": ...}              what a streaming backend understood so far
+    {"type": "final", "text", "start", "end", "confidence"}  a finished phrase, times in seconds
+    {"type": "final", "error": ..., "start", "end"}          a phrase that couldn't be recognized
+    {"type": "done"}                                after {"type": "end"}, then closes
+A client sending faster than its audio can be processed is simply not read from until it
+can be, see TranscriptionStream. Text that isn't a JSON object closes the connection with
+1007, audio that can't be processed with 1011.
+"""
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+
+from .service import get_service
+
+logger = logging.getLogger(__name__)
+
+MIN_RATE = 8000
+MAX_RATE = 48000
+
+
+def message_type(text):
+    """The type of a JSON control message, None when text isn't a JSON object."""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return None
+    return message.get('type', '') if isinstance(message, dict) else None
+
+
+async def transcribe(scope, receive, send, service=None):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    try:
+        rate = int(parse_qs(scope.get('query_string', b'').decode()).get('rate', ['16000'])[0])
+    except ValueError:
+        rate = 0
+    if not MIN_RATE <= rate <= MAX_RATE:
+        # Closing before accepting rejects the handshake with 403
+        await send({'type': 'websocket.close', 'code': 1008})
+        return
+    # Creating the backend may load a model, not on the event loop
+    service = service or await asyncio.to_thread(get_service)
+    await send({'type': 'websocket.accept'})
+
+    async def send_json(data):
+        await send({'type': 'websocket.send', 'text': json.dumps(data)})
+
+    async def on_partial(text):
+        await send_json({'type': 'partial', 'text': text})
+
+    async def on_final(final):
+        message = {'type': 'final', 'start': final.start, 'end': final.end}
+        if final.error is None:
+            message.update(text=final.text, confidence=final.confidence)
+        else:
+            message['error'] = final.error
+        await send_json(message)
+
+    stream = service.open_stream(rate, on_partial, on_final)
+    worker = asyncio.create_task(stream.run())
+
+    async def unless_failed(putting):
+        """Waits for a feed() or finish() of a full stream, False if the worker stops first and never makes room."""
+        putting = asyncio.ensure_future(putting)
+        await asyncio.wait((putting, worker), return_when=asyncio.FIRST_COMPLETED)
+        if not putting.done():
+            putting.cancel()
+            return False
+        return True
+
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            if message.get('bytes'):
+                if stream.full():
+                    # Don't read on while the stream is behind, unless it failed
+                    if not await unless_failed(stream.feed(message['bytes'])):
+                        break
+                else:
+                    await stream.feed(message['bytes'])
+            elif message.get('text'):
+                kind = message_type(message['text'])
+                if kind is None:
+                    await send({'type': 'websocket.close', 'code': 1007})
+                    return
+                if kind == 'end':
+                    break
+        await unless_failed(stream.finish())
+        # Raises what stopped the worker, if anything did
+        await worker
+        await send_json({'type': 'done'})
+        await send({'type': 'websocket.close', 'code': 1000})
+    except Exception:
+        logger.exception('Transcription stream failed')
+        await send({'type': 'websocket.close', 'code': 1011})
+    finally:
+        worker.cancel()
+
+
+ROUTES = {
+    '/ws/transcribe/': transcribe,
+}
+
+
+async def websocket_application(scope, receive, send):
+    handler = ROUTES.get(scope['path'])
+    if handler is None:
+        await receive()
+        await send({'type': 'websocket.close', 'code': 1008})
+        return
+    await handler(scope, receive, send)
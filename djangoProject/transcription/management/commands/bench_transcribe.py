@@ -0,0 +1,197 @@
+"""
+Load test of the WebSocket transcription service with N simulated talkers:
+
+    python manage.py bench_transcribe --streams 10,50,100 --seconds 20
+
+Every stream sends audio at the pace it would be recorded (100 ms messages) and measures
+how long after the end of each phrase its final arrives. By default the service runs in
+this process with a stub recognizer (--delay seconds per phrase plus --per-second seconds
+per second of speech), so the CPU time per stream is measured too; with --url the streams
+go to a running server (`uvicorn djangoProject.asgi:application`) and only latency is
+reported. --audio replays a recording instead of the generated speech-like tones.
+"""
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from speech_engine.audio import decode
+from speech_engine.replay import StubRecognizer
+from speech_engine.trace import percentile
+
+from ...asgi import transcribe
+from ...service import TranscriptionService
+
+RATE = 16000
+FRAME_SECONDS = 0.1
+# Messages an ASGI server buffers per connection before it stops reading the socket
+SERVER_QUEUE = 32
+
+
+def synthetic_speech(seconds, seed=0):
+    """Phrases of 0.8-2 s of noisy tones separated by 0.8-1.5 s of quiet, like someone dictating."""
+    rng = np.random.default_rng(seed)
+    parts = []
+    total = 0
+    while total < seconds * RATE:
+        t = np.arange(int(rng.uniform(0.8, 2.0) * RATE)) / RATE
+        tone = np.sin(2 * np.pi * rng.uniform(150, 400) * t) * 6000 + rng.normal(0, 800, len(t))
+        quiet = rng.normal(0, 60, int(rng.uniform(0.8, 1.5) * RATE))
+        parts += [tone, quiet]
+        total += len(tone) + len(quiet)
+    return np.concatenate(parts)[:int(seconds * RATE)].astype(np.int16)
+
+
+class LocalConnection:
+    """A WebSocket connection to transcribe() running in this process."""
+
+    def __init__(self, service):
+        self.service = service
+        self.to_server = asyncio.Queue(SERVER_QUEUE)
+        self.to_client = asyncio.Queue()
+        self.task = None
+
+    async def open(self):
+        scope = {'type': 'websocket', 'path': '/ws/transcribe/', 'query_string': f'rate={RATE}'.encode()}
+        self.task = asyncio.create_task(transcribe(scope, self.to_server.get, self.to_client.put, self.service))
+        await self.to_server.put({'type': 'websocket.connect'})
+        assert (await self.to_client.get())['type'] == 'websocket.accept'
+
+    async def send(self, data):
+        if isinstance(data, bytes):
+            await self.to_server.put({'type': 'websocket.receive', 'bytes': data})
+        else:
+            await self.to_server.put({'type': 'websocket.receive', 'text': data})
+
+    async def recv(self):
+        message = await self.to_client.get()
+        return message['text'] if message['type'] == 'websocket.send' else None
+
+    async def close(self):
+        await self.task
+
+
+class RemoteConnection:
+    def __init__(self, url):
+        self.url = url
+        self.websocket = None
+
+    async def open(self):
+        import websockets
+        self.websocket = await websockets.connect(f'{self.url}?rate={RATE}', max_size=None)
+
+    async def send(self, data):
+        await self.websocket.send(data)
+
+    async def recv(self):
+        import websockets
+        try:
+            return await self.websocket.recv()
+        except websockets.ConnectionClosed:
+            return None
+
+    async def close(self):
+        await self.websocket.close()
+
+
+async def talk(connection, audio, latencies, lags):
+    """Send audio in real time, collect the latency of every final."""
+    frame = int(FRAME_SECONDS * RATE) * 2
+    data = audio.tobytes()
+    await connection.open()
+    started = time.perf_counter()
+
+    async def receive():
+        while True:
+            message = await connection.recv()
+            if message is None:
+                return
+            message = json.loads(message)
+            if message['type'] == 'final':
+                latencies.append(time.perf_counter() - (started + message['end']))
+            elif message['type'] == 'done':
+                return
+
+    receiver = asyncio.create_task(receive())
+    for i, offset in enumerate(range(0, len(data), frame)):
+        due = started + i * FRAME_SECONDS
+        # Behind schedule when the server held back the previous message
+        lags.append(max(0.0, time.perf_counter() - due))
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        await connection.send(data[offset:offset + frame])
+    await connection.send(json.dumps({'type': 'end'}))
+    await receiver
+    await connection.close()
+
+
+async def run_streams(count, audio, make_connection):
+    latencies = []
+    lags = []
+
+    async def one():
+        # Don't let every stream start talking at the same moment
+        await asyncio.sleep(random.uniform(0, 1))
+        await talk(make_connection(), audio, latencies, lags)
+
+    await asyncio.gather(*(one() for _ in range(count)))
+    return latencies, lags
+
+
+class Command(BaseCommand):
+    help = 'Load test the WebSocket transcription service with simulated streams.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--streams', default='1,10,50', help='comma separated numbers of concurrent streams')
+        parser.add_argument('--seconds', type=float, default=20, help='audio sent by every stream')
+        parser.add_argument('--audio', help='recording to send instead of generated speech')
+        parser.add_argument('--url', help='ws:// URL of a running server, e.g. ws://localhost:8000/ws/transcribe/')
+        parser.add_argument('--workers', type=int, default=settings.TRANSCRIBE_WORKERS,
+                            help='recognition threads of the in-process service')
+        parser.add_argument('--vad-workers', type=int, default=settings.TRANSCRIBE_VAD_WORKERS)
+        parser.add_argument('--delay', type=float, default=0.3, help='stub recognition seconds per phrase')
+        parser.add_argument('--per-second', type=float, default=0.05, help='stub seconds per second of speech')
+        parser.add_argument('--jitter', type=float, default=0.1)
+
+    def handle(self, *args, **options):
+        if options['audio']:
+            audio = np.concatenate(list(decode(options['audio'], RATE)))[:int(options['seconds'] * RATE)]
+        else:
+            audio = synthetic_speech(options['seconds'])
+
+        self.stdout.write(f'{"streams":>7} {"finals":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+                          f'{"max lag ms":>10} {"cores":>6} {"streams/core":>12}')
+        for count in [int(n) for n in options['streams'].split(',')]:
+            service = None
+            if options['url']:
+                def make_connection():
+                    return RemoteConnection(options['url'])
+            else:
+                recognizer = StubRecognizer(options['delay'], options['per_second'], options['jitter'])
+                service = TranscriptionService(recognize=recognizer.recognize_with_confidence,
+                                               workers=options['workers'], vad_workers=options['vad_workers'])
+
+                def make_connection():
+                    return LocalConnection(service)
+
+            cpu, wall = time.process_time(), time.perf_counter()
+            latencies, lags = asyncio.run(run_streams(count, audio, make_connection))
+            cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+            if service is not None:
+                service.shutdown()
+
+            latencies.sort()
+            row = f'{count:7d} {len(latencies):7d} '
+            if latencies:
+                row += ' '.join(f'{percentile(latencies, p) * 1000:8.0f}' for p in (0.5, 0.95, 0.99))
+            else:
+                row += f'{"-":>8} {"-":>8} {"-":>8}'
+            row += f' {max(lags, default=0) * 1000:10.0f}'
+            if service is not None:
+                # Includes the simulated clients, so this is a lower bound
+                cores = cpu / wall
+                row += f' {cores:6.2f} {count / cores if cores else 0:12.0f}'
+            self.stdout.write(row)
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import speech_recognition as sr
+from django.conf import settings
+
+from speech_engine import VoiceActivityDetector, make_backend
+
+Final = namedtuple('Final', 'text start end confidence error')
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    """The process wide service, created from the TRANSCRIBE_* settings on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TranscriptionService()
+        return _service
+
+
+class TranscriptionService:
+    """Voice activity detection and recognition workers shared by every connection.
+
+    Each connection gets a TranscriptionStream. Streams hand their audio to vad_pool and
+    their phrases to recognition_pool, so a thousand connections cost a thousand small
+    states, not a thousand threads. recognize(audio) -> (text, confidence) defaults to the
+    TRANSCRIBE_BACKEND recognizer.
+    """
+
+    def __init__(self, backend=None, recognize=None, workers=None, vad_workers=None, max_buffered_frames=None,
+                 max_pending_phrases=None, pause=None):
+        self.backend = backend
+        if self.backend is None and recognize is None:
+            self.backend = make_backend(settings.TRANSCRIBE_BACKEND, **settings.TRANSCRIBE_BACKEND_OPTIONS)
+        self.recognize = recognize or self.backend.recognize_with_confidence
+        self.max_buffered_frames = max_buffered_frames or settings.TRANSCRIBE_MAX_BUFFERED_FRAMES
+        self.max_pending_phrases = max_pending_phrases or settings.TRANSCRIBE_MAX_PENDING_PHRASES
+        self.pause = pause or settings.TRANSCRIBE_PAUSE
+        self.recognition_pool = ThreadPoolExecutor(workers or settings.TRANSCRIBE_WORKERS,
+                                                   thread_name_prefix='transcribe')
+        self.vad_pool = ThreadPoolExecutor(vad_workers or settings.TRANSCRIBE_VAD_WORKERS, thread_name_prefix='vad')
+
+    def open_stream(self, rate, on_partial, on_final):
+        return TranscriptionStream(self, rate, on_partial, on_final)
+
+    def shutdown(self):
+        self.recognition_pool.shutdown(cancel_futures=True)
+        self.vad_pool.shutdown(cancel_futures=True)
+
+
+class TranscriptionStream:
+    """One client's audio (16 bit mono PCM at rate) on its way through the shared workers.
+
+    feed() waits while max_buffered_frames frames are queued, which stops the connection
+    from reading more audio from the socket; the processing side in turn waits while
+    max_pending_phrases phrases are being recognized. A slow recognizer therefore slows
+    down the client that is talking, not everyone else and not the server's memory.
+    on_partial(text) and on_final(Final) are coroutines, finals come in spoken order.
+    """
+
+    def __init__(self, service, rate, on_partial, on_final):
+        self.service = service
+        self.rate = rate
+        self.on_partial = on_partial
+        self.on_final = on_final
+        self.frames = asyncio.Queue(service.max_buffered_frames)
+        self.pending = asyncio.Queue()
+        self.slots = asyncio.Semaphore(service.max_pending_phrases)
+        if service.backend is not None and service.backend.streaming:
+            self.decoder = service.backend.stream(rate)
+            self.vad = None
+        else:
+            self.decoder = None
+            self.vad = VoiceActivityDetector(rate, hangover=service.pause)
+        self.position = 0
+
+    def full(self):
+        return self.frames.full()
+
+    async def feed(self, data):
+        await self.frames.put(data)
+
+    async def finish(self):
+        await self.frames.put(None)
+
+    async def run(self):
+        """Process everything fed until finish(), returns when the last final was handed over."""
+        sender = asyncio.create_task(self._send_finals())
+        try:
+            if self.decoder is not None:
+                await self._decode()
+            else:
+                await self._segment()
+            await self.pending.put(None)
+            await sender
+        finally:
+            # The client went away or processing failed: nobody is waiting for the rest, and the
+            # sender would wait for the next phrase forever
+            sender.cancel()
+
+    async def _segment(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await self.frames.get()
+            if data is None:
+                segments = await loop.run_in_executor(self.service.vad_pool, self.vad.flush)
+            else:
+                samples = np.frombuffer(data[:len(data) // 2 * 2], np.int16)
+                self.position += len(samples)
+                segments = await loop.run_in_executor(self.service.vad_pool, self.vad.process, samples)
+            for start, samples in segments:
+                await self.slots.acquire()
+                audio = sr.AudioData(samples.tobytes(), self.rate, 2)
+                future = loop.run_in_executor(self.service.recognition_pool, self.service.recognize, audio)
+                await self.pending.put((start, start + len(samples) / self.rate, future))
+            if data is None:
+                break
+
+    async def _send_finals(self):
+        while True:
+            item = await self.pending.get()
+            if item is None:
+                break
+            start, end, future = item
+            try:
+                (text, confidence), error = await future, None
+            except sr.UnknownValueError:
+                text, confidence, error = '', None, None
+            except Exception as e:
+                text, confidence, error = None, None, str(e)
+            finally:
+                self.slots.release()
+            if text or error:
+                await self.on_final(Final(text, start, end, confidence, error))
+
+    async def _decode(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await self.frames.get()
+            if data is None:
+                text, confidence = await loop.run_in_executor(self.service.recognition_pool, self.decoder.finish)
+                result = ('final', text, confidence)
+            else:
+                self.position += len(data) // 2
+                result = await loop.run_in_executor(self.service.recognition_pool, self.decoder.accept, data)
+            if result is not None:
+                kind, text, confidence = result
+                seconds = self.position / self.rate
+                if kind == 'partial':
+                    await self.on_partial(text)
+                elif text:
+                    await self.on_final(Final(text, None, seconds, confidence, None))
+            if data is None:
+                break
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import threading
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from .asgi import transcribe, websocket_application
+from .service import TranscriptionService, VoiceActivityDetector
+
+RATE = 16000
+
+
+def phrases(count):
+    """count half second tones, each after a second of silence."""
+    t = np.arange(RATE // 2) / RATE
+    tone = (np.sin(2 * np.pi * 300 * t) * 8000).astype(np.int16)
+    return np.concatenate([np.concatenate([np.zeros(RATE, np.int16), tone]) for _ in range(count)]
+                          + [np.zeros(RATE, np.int16)]).tobytes()
+
+
+class Client:
+    def __init__(self, service, query=f'rate={RATE}', path='/ws/transcribe/', server_queue=4):
+        self.to_server = asyncio.Queue(server_queue)
+        self.to_client = asyncio.Queue()
+        scope = {'type': 'websocket', 'path': path, 'query_string': query.encode()}
+        handler = transcribe(scope, self.to_server.get, self.to_client.put, service) if service else \
+            websocket_application(scope, self.to_server.get, self.to_client.put)
+        self.task = asyncio.create_task(handler)
+
+    async def connect(self):
+        await self.to_server.put({'type': 'websocket.connect'})
+        return await self.to_client.get()
+
+    async def send_audio(self, data, frame=3200):
+        for offset in range(0, len(data), frame):
+            await self.to_server.put({'type': 'websocket.receive', 'bytes': data[offset:offset + frame]})
+
+    async def end(self):
+        await self.to_server.put({'type': 'websocket.receive', 'text': json.dumps({'type': 'end'})})
+        messages = []
+        while True:
+            message = await self.to_client.get()
+            if message['type'] == 'websocket.close':
+                return messages, message['code']
+            messages.append(json.loads(message['text']))
+
+
+class TranscribeTests(SimpleTestCase):
+    def make_service(self, recognize, **options):
+        service = TranscriptionService(recognize=recognize, workers=4, vad_workers=2, max_buffered_frames=8,
+                                       max_pending_phrases=2, pause=0.3, **options)
+        self.addCleanup(service.shutdown)
+        return service
+
+    async def test_finals_in_spoken_order(self):
+        count = iter(range(100))
+        service = self.make_service(lambda audio: (f'phrase {next(count)}', 0.9))
+        client = Client(service)
+        self.assertEqual((await client.connect())['type'], 'websocket.accept')
+        await client.send_audio(phrases(3))
+        messages, code = await client.end()
+        self.assertEqual([m['text'] for m in messages[:-1]], ['phrase 0', 'phrase 1', 'phrase 2'])
+        self.assertEqual([round(m['start'], 1) for m in messages[:-1]], [0.8, 2.3, 3.8])
+        self.assertEqual(messages[-1], {'type': 'done'})
+        self.assertEqual(code, 1000)
+
+    async def test_slow_recognizer_stops_reading_the_socket(self):
+        release = threading.Event()
+        service = self.make_service(lambda audio: (release.wait(), ('text', None))[1])
+        client = Client(service)
+        await client.connect()
+        with self.assertRaises(asyncio.TimeoutError):
+            # Far more phrases than may be pending, the buffers fill up and sending blocks
+            await asyncio.wait_for(client.send_audio(phrases(20)), 2)
+        release.set()
+        await client.send_audio(phrases(1))
+        messages, code = await client.end()
+        self.assertEqual(messages[-1], {'type': 'done'})
+
+    async def test_recognition_errors_are_reported(self):
+        def fail(audio):
+            raise RuntimeError('service down')
+        client = Client(self.make_service(fail))
+        await client.connect()
+        await client.send_audio(phrases(1))
+        messages, code = await client.end()
+        self.assertEqual(messages[0]['error'], 'service down')
+
+    async def test_failed_stream_closes_and_leaves_no_tasks(self):
+        client = Client(self.make_service(lambda audio: ('text', None)))
+        await client.connect()
+        with mock.patch.object(VoiceActivityDetector, 'process', side_effect=ValueError('bad audio')), \
+                self.assertLogs('transcription.asgi', 'ERROR'):
+            await client.send_audio(phrases(1)[:6400])
+            messages, code = await client.end()
+            await client.task
+        self.assertEqual((messages, code), ([], 1011))
+        # The stream's task sending the finals too
+        self.assertEqual(asyncio.all_tasks(), {asyncio.current_task()})
+
+    async def test_text_that_isnt_a_json_object_closes(self):
+        for text in ('end', '["end"]'):
+            client = Client(self.make_service(lambda audio: ('text', None)))
+            await client.connect()
+            await client.to_server.put({'type': 'websocket.receive', 'text': text})
+            self.assertEqual(await client.to_client.get(), {'type': 'websocket.close', 'code': 1007})
+            await client.task
+
+    async def test_invalid_rate_and_unknown_path_are_rejected(self):
+        client = Client(self.make_service(lambda audio: ('', None)), query='rate=100')
+        self.assertEqual(await client.connect(), {'type': 'websocket.close', 'code': 1008})
+        client = Client(None, path='/ws/other/')
+        self.assertEqual(await client.connect(), {'type': 'websocket.close', 'code': 1008})